@@ -54,8 +54,50 @@ class OrderAdmin(admin.ModelAdmin):
 class OrderItemAdmin(admin.ModelAdmin):
     model = OrderItem
 
+    # Правка позиции из админки пересчитывает сохраненную сумму заказа и заказа покупателя
+    def recalculate(self, order_ids):
+        Order.objects.recalculate_totals(order_ids)
+        Order.objects.recalculate_parent_totals(
+            Order.objects.filter(id__in=order_ids, parent__isnull=False).values('parent_id'))
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.recalculate([obj.order_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recalculate([obj.order_id])
+
+    def delete_queryset(self, request, queryset):
+        order_ids = list(queryset.values_list('order_id', flat=True).distinct())
+        super().delete_queryset(request, queryset)
+        self.recalculate(order_ids)
+
 
 @admin.register(ConfirmEmailToken)
 class ConfirmEmailTokenAdmin(admin.ModelAdmin):
     model = ConfirmEmailToken
-    list_display = ('user', 'key', 'created_at',)
\ No newline at end of file
+    list_display = ('user', 'key', 'created_at',)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    model = OutboxEmail
+    list_display = ('id', 'to', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at',)
+    list_filter = ('status',)
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    model = ImportJob
+    list_display = ('id', 'user', 'status', 'mode', 'processed', 'created_at', 'finished_at',)
+
+
+@admin.register(OrderArchive)
+class OrderArchiveAdmin(admin.ModelAdmin):
+    model = OrderArchive
+
+
+@admin.register(OrderItemArchive)
+class OrderItemArchiveAdmin(admin.ModelAdmin):
+    model = OrderItemArchive
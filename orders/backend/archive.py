@@ -0,0 +1,130 @@
+import datetime
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from backend import fast_serializers
+from backend.metrics import serialization
+from backend.models import Order, OrderArchive, OrderItem, OrderItemArchive
+
+# Архив закрытых заказов. Рабочие таблицы Order и OrderItem хранят корзины, заказы в работе
+# и закрытые заказы за последние ORDER_ARCHIVE_DAYS дней; более старые закрытые заказы команда archive_orders
+# переносит в OrderArchive и OrderItemArchive (заказ покупателя вместе с заказами магазинов и позициями).
+# Списки order и partner/orders по умолчанию читают только рабочие таблицы, история за период
+# (created_after, created_before) - рабочие таблицы и архив
+RETENTION_DAYS = getattr(settings, 'ORDER_ARCHIVE_DAYS', 365)
+# Заказ покупателя закрыт, когда все его заказы магазинов в одном из этих статусов
+CLOSED_STATUSES = ('delivered', 'canceled')
+CREATED_AFTER_QUERY_PARAM = 'created_after'
+CREATED_BEFORE_QUERY_PARAM = 'created_before'
+
+ORDER_COPY_FIELDS = ('id', 'user_id', 'created_at', 'status', 'total', 'shop_id', 'parent_id')
+ITEM_COPY_FIELDS = ('id', 'order_id', 'product_info_id', 'quantity', 'price')
+
+# Вывод архивных заказов в формате fast_serializers.orders и customer_orders
+archived_orders = partial(fast_serializers.orders, item_model=OrderItemArchive)
+archived_customer_orders = partial(fast_serializers.customer_orders, order_model=OrderArchive,
+                                   item_model=OrderItemArchive)
+
+
+class PeriodError(ValueError):
+    # Неправильный параметр периода, args[0] - словарь ошибок для ответа
+    pass
+
+
+def archivable_orders(cutoff):
+    # Оформленные заказы покупателей, созданные до cutoff, все заказы магазинов которых закрыты
+    sub_orders = Order.objects.filter(parent_id=OuterRef('id'))
+    return Order.objects.filter(parent__isnull=True, created_at__lt=cutoff).exclude(status='temporary').filter(
+        Exists(sub_orders)).exclude(Exists(sub_orders.exclude(status__in=CLOSED_STATUSES)))
+
+
+def archive_batch(cutoff, batch_size=1000):
+    # Перенос в архив не больше batch_size заказов покупателей в одной транзакции, возвращает их число.
+    # Заказы блокируются: заказы, которые уже переносит другой процесс, пропускаются, а заказ магазина,
+    # статус которого изменился до блокировки, оставляет заказ покупателя в рабочих таблицах
+    with transaction.atomic():
+        parent_ids = list(archivable_orders(cutoff).select_for_update(skip_locked=True).order_by('id').values_list(
+            'id', flat=True)[:batch_size])
+        if not parent_ids:
+            return 0
+        sub_orders = list(Order.objects.select_for_update().filter(parent_id__in=parent_ids).order_by('id').values(
+            *ORDER_COPY_FIELDS))
+        reopened = {row['parent_id'] for row in sub_orders if row['status'] not in CLOSED_STATUSES}
+        parent_ids = [parent_id for parent_id in parent_ids if parent_id not in reopened]
+        sub_orders = [row for row in sub_orders if row['parent_id'] not in reopened]
+        sub_order_ids = [row['id'] for row in sub_orders]
+        if not parent_ids:
+            return 0
+
+        OrderArchive.objects.bulk_create(
+            [OrderArchive(**row) for row in Order.objects.filter(id__in=parent_ids).values(*ORDER_COPY_FIELDS)]
+            + [OrderArchive(**row) for row in sub_orders], batch_size=batch_size)
+        OrderItemArchive.objects.bulk_create(
+            [OrderItemArchive(**row) for row in OrderItem.objects.filter(
+                order_id__in=sub_order_ids).values(*ITEM_COPY_FIELDS)], batch_size=batch_size)
+        OrderItem.objects.filter(order_id__in=sub_order_ids).delete()
+        Order.objects.filter(id__in=sub_order_ids).delete()
+        Order.objects.filter(id__in=parent_ids).delete()
+    return len(parent_ids)
+
+
+def parse_period(query_params):
+    # (created_after, created_before) из параметров запроса или None, если период не задан.
+    # Дата (ГГГГ-ММ-ДД) включает весь день в текущем часовом поясе, дата и время ISO 8601 - точная граница
+    if not query_params.get(CREATED_AFTER_QUERY_PARAM) and not query_params.get(CREATED_BEFORE_QUERY_PARAM):
+        return None
+    period = []
+    for name, days in ((CREATED_AFTER_QUERY_PARAM, 0), (CREATED_BEFORE_QUERY_PARAM, 1)):
+        value = query_params.get(name, '')
+        if not value:
+            period.append(None)
+            continue
+        try:
+            # parse_datetime принимает и дату без времени, поэтому дата проверяется первой
+            day = parse_date(value)
+            if day is not None:
+                moment = datetime.datetime.combine(day + datetime.timedelta(days=days), datetime.time.min)
+            else:
+                moment = parse_datetime(value)
+                if moment is None:
+                    raise ValueError
+        except ValueError:
+            raise PeriodError({name: 'Ожидается дата ГГГГ-ММ-ДД или дата и время ISO 8601'})
+        period.append(moment if timezone.is_aware(moment) else timezone.make_aware(moment))
+    return tuple(period)
+
+
+def filter_period(queryset, period):
+    created_after, created_before = period
+    if created_after is not None:
+        queryset = queryset.filter(created_at__gte=created_after)
+    if created_before is not None:
+        queryset = queryset.filter(created_at__lt=created_before)
+    return queryset
+
+
+def history_response(paginator, hot, archive, serialize, serialize_archive, request):
+    # Страница истории заказов из рабочей таблицы (hot) и архива (archive) с сортировкой
+    # OrderPagination (-created_at, -id): из каждой таблицы читается страница по курсору,
+    # страницы объединяются. id заказов при переносе сохраняются, поэтому курсор общий
+    rows = []
+    archived = set()
+    for queryset, is_archive in ((hot, False), (archive, True)):
+        page = list(paginator.get_page_queryset(fast_serializers.page_values(queryset, fast_serializers.ORDER_FIELDS),
+                                                request))
+        if is_archive:
+            archived = {row['id'] for row in page}
+        rows.extend(page)
+    rows.sort(key=lambda row: (row['created_at'], row['id']), reverse=True)
+    page = paginator.set_page(rows[:paginator.page_size + 1])
+    with serialization():
+        results = {order['id']: order for order in serialize([row for row in page if row['id'] not in archived])}
+        results.update({order['id']: order for order in serialize_archive(
+            [row for row in page if row['id'] in archived])})
+        return fast_serializers.json_response({'next': paginator.get_next_link(),
+                                               'results': [results[row['id']] for row in page]})
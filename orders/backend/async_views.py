@@ -0,0 +1,203 @@
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse, QueryDict
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.request import Request
+
+import ujson
+
+from backend.archive import (PeriodError, archived_customer_orders, archived_orders, filter_period, history_response,
+                            parse_period)
+from backend.authentication import aauthenticate
+from backend.basket import (add_items, update_items, delete_items, place_order, BasketError,
+                            ORDER_POSITIONS_PREFETCH, SUB_ORDERS_PREFETCH)
+from backend import fast_serializers
+from backend.fast_serializers import PRODUCT_INFO_PREFETCH
+from backend.facets import (PARAMETER_QUERY_PARAM, facet_counts, filter_by_parameters, parse_parameter_filters,
+                            wants_facets)
+from backend.filters import ProductInfoFilter
+from backend.models import Order, OrderArchive, ProductInfo
+from backend.pagination import ProductPagination, OrderPagination
+from backend.search import search_products
+from backend.serializers import CustomerOrderSerializer, OrderSerializer, ProductInfoSerializer
+from backend.signals import new_order
+
+# Асинхронные (ASGI) версии горячих эндпоинтов: products, basket, order, partner/orders.
+# Чтение идет через асинхронный ORM, без перехода в поток. Изменения корзины и оформление заказа
+# выполняются в транзакции, а транзакции в Django синхронные, поэтому эти функции вызываются
+# через sync_to_async. Аутентификация - только по токену (заголовок Authorization: Token <key>)
+
+
+def get_data(request):
+    # Параметры тела запроса: JSON или форма (для PUT/DELETE Django форму сам не разбирает)
+    if request.content_type == 'application/json':
+        try:
+            data = ujson.loads(request.body or b'{}')
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    if request.method == 'POST':
+        return request.POST
+    return QueryDict(request.body)
+
+
+def paginated_response(paginator, data, **extra):
+    return JsonResponse({'next': paginator.get_next_link(), 'results': data, **extra})
+
+
+class AsyncAPIView(View):
+    # Базовое представление: аутентификация до вызова обработчика, request.user - пользователь или None.
+    # Как и APIView, не требует CSRF-токена: сессия не используется
+    login_required = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await aauthenticate(request)
+        if self.login_required and request.user is None:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as error:
+            # Исключения DRF из общих с синхронными представлениями частей (пагинация) - ответ как у APIView
+            return JsonResponse({'detail': error.detail}, status=error.status_code)
+
+
+class AsyncProductSearchView(AsyncAPIView):
+    # Список товаров: те же фильтры (category, shop, param), поиск (search), сортировка (ordering=price), фасеты
+    # и курсорная пагинация, что и у ProductSearchView
+    login_required = False
+
+    async def get(self, request, *args, **kwargs):
+        queryset = ProductInfo.objects.filter(is_active=True).select_related(
+            'product__category', 'shop').prefetch_related(*PRODUCT_INFO_PREFETCH)
+        filterset = ProductInfoFilter(request.GET, queryset=queryset)
+        if not filterset.is_valid():
+            return JsonResponse({'Status': False, 'Errors': filterset.errors}, status=400)
+        queryset = filterset.qs
+        try:
+            parameters = parse_parameter_filters(request.GET.getlist(PARAMETER_QUERY_PARAM))
+        except ValidationError as error:
+            return JsonResponse({'Status': False, 'Errors': error.detail}, status=400)
+        # Фильтр по ProductInfo.attributes строится без запросов к БД
+        queryset = filter_by_parameters(queryset, parameters)
+        search = request.GET.get('search', '').strip()
+        if search:
+            queryset = search_products(queryset, search)
+        ordering = request.GET.get('ordering')
+        if ordering in ('price', '-price'):
+            queryset = queryset.order_by(ordering)
+
+        paginator = ProductPagination()
+        page = await paginator.apaginate_queryset(queryset, Request(request))
+        extra = {}
+        if wants_facets(request.GET):
+            extra['facets'] = await sync_to_async(facet_counts)(queryset, request.GET)
+        return paginated_response(paginator, ProductInfoSerializer(page, many=True).data, **extra)
+
+
+class AsyncBasketView(AsyncAPIView):
+
+    async def get(self, request, *args, **kwargs):
+        basket = Order.objects.filter(user_id=request.user.id, status='temporary').select_related(
+            'user').prefetch_related(ORDER_POSITIONS_PREFETCH)
+        orders = [order async for order in basket]
+        return JsonResponse(OrderSerializer(orders, many=True).data, safe=False)
+
+    async def post(self, request, *args, **kwargs):
+        items = get_data(request).get('items')
+        if items:
+            try:
+                await sync_to_async(add_items)(request.user.id, items)
+            except BasketError as error:
+                return JsonResponse({'Status': False, 'Errors': error.args[0]})
+            return JsonResponse({'Status': True})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+    async def put(self, request, *args, **kwargs):
+        items = get_data(request).get('items')
+        if items:
+            try:
+                objects_updated = await sync_to_async(update_items)(request.user.id, items)
+            except BasketError as error:
+                return JsonResponse({'Status': False, 'Errors': error.args[0]})
+            return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+    async def delete(self, request, *args, **kwargs):
+        items = get_data(request).get('items')
+        if items:
+            ids = [int(order_item_id) for order_item_id in str(items).split(',') if order_item_id.isdigit()]
+            if ids:
+                deleted_count = await sync_to_async(delete_items)(request.user.id, ids)
+                return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+
+def checkout(user_id, order_id):
+    # Оформление заказа и постановка письма в очередь одной транзакцией, как в OrderView.post
+    with transaction.atomic():
+        is_updated = place_order(user_id, order_id)
+        if is_updated:
+            new_order.send(sender=AsyncOrderView, user_id=user_id)
+    return is_updated
+
+
+class AsyncOrderView(AsyncAPIView):
+
+    async def get(self, request, *args, **kwargs):
+        orders = Order.objects.filter(
+            user_id=request.user.id, parent__isnull=True).exclude(status='temporary').prefetch_related(
+            SUB_ORDERS_PREFETCH).select_related('user')
+        try:
+            period = parse_period(request.GET)
+        except PeriodError as error:
+            return JsonResponse({'Status': False, 'Errors': error.args[0]}, status=400)
+        if period is not None:
+            # История с архивом собирается синхронно: две выборки страниц и их сериализация (archive.py)
+            archive = OrderArchive.objects.filter(user_id=request.user.id, parent__isnull=True)
+            return await sync_to_async(history_response)(
+                OrderPagination(), filter_period(orders, period), filter_period(archive, period),
+                fast_serializers.customer_orders, archived_customer_orders, Request(request))
+        paginator = OrderPagination()
+        page = await paginator.apaginate_queryset(orders, Request(request))
+        return paginated_response(paginator, CustomerOrderSerializer(page, many=True).data)
+
+    async def post(self, request, *args, **kwargs):
+        order_id = str(get_data(request).get('id', ''))
+        if order_id.isdigit():
+            try:
+                is_updated = await sync_to_async(checkout)(request.user.id, int(order_id))
+            except BasketError as error:
+                return JsonResponse({'Status': False, 'Errors': error.args[0]}, status=409)
+            except IntegrityError:
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
+            if is_updated:
+                return JsonResponse({'Status': True})
+            return JsonResponse({'Status': False, 'Errors': 'Корзина не найдена'}, status=404)
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+
+
+class AsyncPartnerOrders(AsyncAPIView):
+
+    async def get(self, request, *args, **kwargs):
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+        orders = Order.objects.filter(shop__user_id=request.user.id).prefetch_related(
+            ORDER_POSITIONS_PREFETCH).select_related('user')
+        try:
+            period = parse_period(request.GET)
+        except PeriodError as error:
+            return JsonResponse({'Status': False, 'Errors': error.args[0]}, status=400)
+        if period is not None:
+            archive = OrderArchive.objects.filter(shop__user_id=request.user.id)
+            return await sync_to_async(history_response)(
+                OrderPagination(), filter_period(orders, period), filter_period(archive, period),
+                fast_serializers.orders, archived_orders, Request(request))
+        paginator = OrderPagination()
+        page = await paginator.apaginate_queryset(orders, Request(request))
+        return paginated_response(paginator, OrderSerializer(page, many=True).data)
@@ -0,0 +1,35 @@
+from django.db.models import Aggregate, JSONField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from backend.models import ProductInfo, ProductParameter
+
+# Параметры карточки товара в столбце ProductInfo.attributes: {название параметра: значение}.
+# Таблицы Parameter/ProductParameter остаются источником данных (поиск, админка), столбец - их копия
+# для вывода без запросов к параметрам, для фильтра по содержимому (attributes @> {...}, GIN-индекс) и фасетов.
+# Импорт пишет столбец вместе с параметрами, правки через ORM пересчитывают его сигналами
+
+
+class JSONBObjectAgg(Aggregate):
+    # jsonb_object_agg(ключ, значение) PostgreSQL
+    function = 'JSONB_OBJECT_AGG'
+    output_field = JSONField()
+
+
+def attributes_expression():
+    # Объект параметров карточки коррелированным подзапросом, пересчет одним UPDATE без выборки в Python
+    attributes = Subquery(
+        ProductParameter.objects.filter(product_info_id=OuterRef('id')).values('product_info_id').annotate(
+            attributes=JSONBObjectAgg('parameter__name', 'value')).values('attributes')[:1])
+    return Coalesce(attributes, Value({}, output_field=JSONField()), output_field=JSONField())
+
+
+def update_attributes(product_info_ids):
+    # Пересчет столбца attributes только для переданных карточек
+    if not product_info_ids:
+        return 0
+    return ProductInfo.objects.filter(id__in=product_info_ids).update(attributes=attributes_expression())
+
+
+def parameter_strings(attributes):
+    # Вывод параметров в API: ['Название: значение', ...] по алфавиту названий
+    return [f'{name}: {value}' for name, value in sorted(attributes.items())]
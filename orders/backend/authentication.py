@@ -0,0 +1,129 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from backend.cache import get_versions, invalidate, token_namespace, user_namespace
+
+# Результат аутентификации, который кладется в request.auth вместо модели Token
+CachedToken = namedtuple('CachedToken', ['key', 'user_id', 'type', 'shop_id'])
+
+
+class TokenCache:
+    # Ограниченный по размеру LRU-кэш токенов с временем жизни записей в памяти процесса.
+    # Запись хранит версии токена и пользователя из общего кэша (backend/cache.py, алиас 'catalog'):
+    # выход, смена токена, пароля и данных пользователя меняют версию, и записи во всех процессах
+    # перестают действовать со следующего запроса. Проверка версий - одно чтение общего кэша, без БД
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, user, token, versions = entry
+            if expires < time.monotonic():
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+        if get_versions([token_namespace(key), user_namespace(token.user_id)]) != versions:
+            self.invalidate_key(key)
+            return None
+        # Каждый запрос получает свою копию пользователя, общий объект из кэша не изменяется
+        return copy.copy(user), token
+
+    def set(self, key, user, token, versions):
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, copy.copy(user), token, versions)
+            self.user_keys.setdefault(user.id, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            keys = self.user_keys.get(entry[2].user_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.user_keys[entry[2].user_id]
+
+    def invalidate_key(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key in list(self.user_keys.get(user_id, ())):
+                self.remove(key)
+
+    def forget_key(self, key):
+        # Сброс токена во всех процессах: локальная запись удаляется сразу, версия меняется после коммита
+        self.invalidate_key(key)
+        invalidate(token_namespace(key))
+
+    def forget_user(self, user_id):
+        self.invalidate_user(user_id)
+        invalidate(user_namespace(user_id))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+
+token_cache = TokenCache(**getattr(settings, 'AUTH_TOKEN_CACHE', {}))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # Аутентификация по заголовку "Authorization: Token <key>" как у TokenAuthentication,
+    # но пользователь, его тип и id магазина берутся из token_cache: в установившемся режиме
+    # аутентификация не обращается к БД. При промахе токен, пользователь и магазин читаются одним запросом
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Версия токена читается до запроса к БД: выход, выполненный во время запроса, сменит ее
+        # и не даст закэшировать удаленный токен
+        token_version = get_versions([token_namespace(key)])[0]
+        token = Token.objects.select_related('user__shop').filter(key=key).first()
+        if token is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        user = token.user
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        shop_id = user.shop.id if hasattr(user, 'shop') else None
+        # Объект магазина в кэш не попадает: его поля (статус приема заказов) меняются без сохранения пользователя
+        user._state.fields_cache.pop('shop', None)
+        auth = CachedToken(key, user.id, user.type, shop_id)
+        token_cache.set(key, user, auth, [token_version, get_versions([user_namespace(user.id)])[0]])
+        return copy.copy(user), auth
+
+
+async def aauthenticate(request):
+    # Аутентификация по токену для async-представлений (django.http.HttpRequest, без DRF).
+    # При попадании в token_cache обращения к БД нет, при промахе запрос выполняется в потоке
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+    cached = token_cache.get(header[1])
+    if cached is not None:
+        return cached[0]
+    try:
+        user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(header[1])
+    except exceptions.AuthenticationFailed:
+        return None
+    return user
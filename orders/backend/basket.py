@@ -0,0 +1,200 @@
+import ujson
+from django.db import transaction
+from django.db.models import Prefetch, Sum
+
+from backend.cache import invalidate, shop_namespace
+from backend.fast_serializers import SHOPS_PREFETCH
+from backend.models import Order, OrderItem, ProductInfo
+
+
+# Связанные объекты позиций заказа, которые выводит OrderSerializer, в порядке id (как в fast_serializers)
+ORDER_POSITIONS_PREFETCH = Prefetch('positions', queryset=OrderItem.objects.select_related(
+    'product_info__product__category').prefetch_related(
+    Prefetch('product_info__product__category__shops', queryset=SHOPS_PREFETCH.queryset)).order_by('id'))
+
+# Заказы по магазинам с их позициями для вывода заказа покупателя
+SUB_ORDERS_PREFETCH = Prefetch('sub_orders', queryset=Order.objects.select_related('user').prefetch_related(
+    ORDER_POSITIONS_PREFETCH).order_by('id'))
+
+
+class BasketError(ValueError):
+    # Ошибка в переданных позициях корзины, args[0] - текст или словарь ошибок для ответа
+    pass
+
+
+class OutOfStockError(BasketError):
+    # Остатков не хватает для оформления заказа, args[0] - {product_info_id: текст}
+    pass
+
+
+class OrderStatusError(ValueError):
+    # Недопустимая смена статуса заказа магазина, args[0] - текст ошибки для ответа
+    pass
+
+
+# Статусы, в которые магазин может перевести свой заказ из текущего статуса.
+# Доставленный и отмененный заказы не меняются
+PARTNER_STATUS_TRANSITIONS = {
+    'new': ('accepted', 'canceled'),
+    'accepted': ('assembled', 'canceled'),
+    'assembled': ('sent', 'canceled'),
+    'sent': ('delivered',),
+}
+
+
+def parse_items(items):
+    # items приходит JSON-строкой (как раньше) или уже разобранным списком
+    if isinstance(items, str):
+        try:
+            items = ujson.loads(items)
+        except ValueError:
+            raise BasketError('Ошибка запроса')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise BasketError('Ошибка запроса')
+    return items
+
+
+def is_positive_int(value):
+    return type(value) == int and value > 0
+
+
+def get_basket(user_id):
+    basket, _ = Order.objects.get_or_create(user_id=user_id, status='temporary')
+    return basket
+
+
+def basket_ids(user_id):
+    # Подзапрос id корзины пользователя для пересчета суммы без отдельной выборки
+    return Order.objects.filter(user_id=user_id, status='temporary').values('id')
+
+
+def add_items(user_id, items):
+    # Добавление товаров в корзину: [{"product_info": id, "quantity": n}, ...].
+    # Вся пачка проверяется по одной выборке ProductInfo и записывается одним upsert по (order, product_info),
+    # для уже лежащего в корзине товара количество заменяется. Повторы товара в пачке - действует последний.
+    quantities = {}
+    errors = {}
+    for index, item in enumerate(parse_items(items)):
+        if not is_positive_int(item.get('product_info')) or not is_positive_int(item.get('quantity')):
+            errors[index] = 'Ожидаются целые положительные product_info и quantity'
+        else:
+            quantities[item['product_info']] = item['quantity']
+    if errors:
+        raise BasketError(errors)
+    if not quantities:
+        return 0
+
+    prices = dict(ProductInfo.objects.filter(id__in=quantities, is_active=True).values_list('id', 'price'))
+    missing = sorted(set(quantities) - prices.keys())
+    if missing:
+        raise BasketError({'product_info': f'Товары не найдены или сняты с продажи: {missing}'})
+
+    with transaction.atomic():
+        basket = get_basket(user_id)
+        OrderItem.objects.bulk_create(
+            [OrderItem(order_id=basket.id, product_info_id=product_info_id, quantity=quantity,
+                       price=prices[product_info_id])
+             for product_info_id, quantity in quantities.items()],
+            update_conflicts=True, unique_fields=['order', 'product_info'], update_fields=['quantity', 'price'])
+        Order.objects.recalculate_totals([basket.id])
+    return len(quantities)
+
+
+def update_items(user_id, items):
+    # Изменение количества по id позиций корзины: [{"id": id, "quantity": n}, ...].
+    # Позиции выбираются одним запросом и обновляются одним bulk_update
+    quantities = {item['id']: item['quantity'] for item in parse_items(items)
+                  if is_positive_int(item.get('id')) and is_positive_int(item.get('quantity'))}
+    if not quantities:
+        return 0
+    with transaction.atomic():
+        positions = list(OrderItem.objects.filter(
+            order__user_id=user_id, order__status='temporary', id__in=quantities).only('id'))
+        for position in positions:
+            position.quantity = quantities[position.id]
+        OrderItem.objects.bulk_update(positions, ['quantity'])
+        Order.objects.recalculate_totals(basket_ids(user_id))
+    return len(positions)
+
+
+def delete_items(user_id, ids):
+    # Удаление позиций корзины по списку id одним DELETE ... WHERE id IN (...)
+    if not ids:
+        return 0
+    with transaction.atomic():
+        deleted = OrderItem.objects.filter(order__user_id=user_id, order__status='temporary', id__in=ids).delete()[0]
+        Order.objects.recalculate_totals(basket_ids(user_id))
+    return deleted
+
+
+def place_order(user_id, order_id):
+    # Оформление корзины с резервированием остатков, все в одной транзакции.
+    # Строки ProductInfo позиций блокируются одним SELECT ... FOR UPDATE в порядке id: у всех
+    # оформлений один порядок захвата блокировок, поэтому взаимоблокировок нет, а блокируются только
+    # покупаемые товары. Остатки проверяются и списываются под блокировкой, снимки цен позиций
+    # обновляются по текущему прайсу. При нехватке хотя бы одного товара транзакция откатывается целиком.
+    # Позиции распределяются по заказам магазинов (Order.shop, Order.parent), которые каждый магазин
+    # выполняет независимо; корзина остается заказом покупателя с общей суммой
+    with transaction.atomic():
+        if not Order.objects.filter(user_id=user_id, id=order_id, status='temporary').update(status='new'):
+            return False
+        positions = list(OrderItem.objects.filter(order_id=order_id).only('id', 'product_info_id', 'quantity'))
+        if not positions:
+            raise BasketError('Корзина пуста')
+        stock = {info.id: info for info in ProductInfo.objects.select_for_update().filter(
+            id__in=[position.product_info_id for position in positions]).order_by('id').only(
+            'id', 'shop_id', 'quantity', 'price', 'is_active')}
+        shortages = {}
+        for position in positions:
+            info = stock[position.product_info_id]
+            available = info.quantity if info.is_active else 0
+            if available < position.quantity:
+                shortages[info.id] = f'Недостаточно товара, доступно: {available}'
+            else:
+                info.quantity -= position.quantity
+                position.price = info.price
+        if shortages:
+            raise OutOfStockError(shortages)
+        ProductInfo.objects.bulk_update(stock.values(), ['quantity'])
+        sub_orders = Order.objects.bulk_create(
+            [Order(user_id=user_id, status='new', shop_id=shop_id, parent_id=order_id)
+             for shop_id in sorted({info.shop_id for info in stock.values()})])
+        sub_order_ids = {sub_order.shop_id: sub_order.id for sub_order in sub_orders}
+        for position in positions:
+            position.order_id = sub_order_ids[stock[position.product_info_id].shop_id]
+        OrderItem.objects.bulk_update(positions, ['order', 'price'])
+        Order.objects.recalculate_totals(sub_order_ids.values())
+        Order.objects.recalculate_parent_totals([order_id])
+        # Остатки выводятся в прайсе магазина, bulk_update не вызывает сигналов сброса кэша
+        invalidate(*{shop_namespace(info.shop_id) for info in stock.values()})
+    return True
+
+
+def release_stock(order_id):
+    # Возврат в остатки товаров, зарезервированных позициями заказа магазина при оформлении.
+    # Строки ProductInfo блокируются в порядке id, как в place_order
+    quantities = dict(OrderItem.objects.filter(order_id=order_id).values('product_info_id').annotate(
+        total=Sum('quantity')).values_list('product_info_id', 'total').order_by())
+    stock = list(ProductInfo.objects.select_for_update().filter(id__in=quantities).order_by('id').only(
+        'id', 'shop_id', 'quantity'))
+    for info in stock:
+        info.quantity += quantities[info.id]
+    ProductInfo.objects.bulk_update(stock, ['quantity'])
+    invalidate(*{shop_namespace(info.shop_id) for info in stock})
+
+
+def set_partner_status(shop_user_id, order_id, status):
+    # Смена статуса заказа магазина по PARTNER_STATUS_TRANSITIONS, False - заказ не найден.
+    # Заказ блокируется, чтобы параллельные смены статуса проверялись по очереди;
+    # при отмене зарезервированные остатки возвращаются в той же транзакции
+    with transaction.atomic():
+        order = Order.objects.select_for_update(of=('self',)).filter(
+            id=order_id, shop__user_id=shop_user_id).only('id', 'status').first()
+        if order is None:
+            return False
+        if status not in PARTNER_STATUS_TRANSITIONS.get(order.status, ()):
+            raise OrderStatusError(f'Заказ в статусе {order.status} нельзя перевести в статус {status}')
+        Order.objects.filter(id=order.id).update(status=status)
+        if status == 'canceled':
+            release_stock(order.id)
+    return True
@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import yaml
+from django.conf import settings
+
+# Категории синтетического каталога получают id от CATEGORY_BASE, чтобы не пересекаться с прайсами магазинов
+CATEGORY_BASE = 1000000
+
+
+def percentile(values, percent):
+    # Перцентиль по отсортированному списку (метод ближайшего ранга)
+    if not values:
+        return 0
+    index = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    # Сводка прогона: число запросов, ошибки, запросов в секунду и задержки в миллисекундах
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0,
+    }
+
+
+async def run_load(url, requests=1000, concurrency=100, headers=None, method='GET', data=None, timeout=30,
+                   tokens=None):
+    # Нагрузка на url: requests запросов, не более concurrency одновременно.
+    # tokens - токены пользователей: каждый из параллельных клиентов работает под своим (по кругу).
+    # Ошибкой считается исключение клиента или ответ со статусом >= 400
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(headers=headers, timeout=timeout, limits=limits) as client:
+        async def worker(index):
+            nonlocal errors
+            auth = {'Authorization': f'Token {tokens[index % len(tokens)]}'} if tokens else None
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, data=data, headers=auth)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if response.status_code >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def wait_for_server(url, timeout=30):
+    # Ожидание, пока запущенный сервер начнет отвечать
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return True
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(kind, port, workers=4, threads=8):
+    # Запуск сервера приложения в отдельном процессе с текущими настройками Django:
+    # wsgi - gunicorn с потоками, asgi - uvicorn
+    if kind == 'wsgi':
+        command = [sys.executable, '-m', 'gunicorn', 'orders.wsgi:application', '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'orders.asgi:application', '--host', '127.0.0.1',
+                   '--port', str(port), '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+    return subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy())
+
+
+def generate_feed(shop_index, goods=1000, parameters=5, categories=10, seed=0):
+    # Прайс магазина в формате shop1.yaml (shop, categories, goods) с воспроизводимым содержимым:
+    # одинаковые аргументы дают одинаковый прайс. Товары соседних магазинов наполовину совпадают
+    # (одни и те же Product у разных магазинов), у параметров небольшой набор значений
+    rng = random.Random(f'{seed}:{shop_index}')
+    first_product = shop_index * (goods // 2)
+    feed_goods = []
+    for number in range(first_product, first_product + goods):
+        price = rng.randrange(100, 200000, 10)
+        feed_goods.append({
+            'id': shop_index * 10 ** 7 + number,
+            'category': CATEGORY_BASE + number % categories,
+            'model': f'bench/model-{number}',
+            'name': f'Товар {number}',
+            'price': price,
+            'price_rrc': price + rng.randrange(0, 20000, 10),
+            'quantity': rng.randint(1000, 100000),
+            'parameters': {f'Параметр {index + 1}': f'значение {rng.randint(1, 8)}' for index in range(parameters)},
+        })
+    return {
+        'shop': f'Бенчмарк {shop_index}',
+        'categories': [{'id': CATEGORY_BASE + index, 'name': f'Категория {index + 1}'} for index in range(categories)],
+        'goods': feed_goods,
+    }
+
+
+def write_feed(feed, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        yaml.safe_dump(feed, file, allow_unicode=True, sort_keys=False)
+
+
+def serve_directory(directory, port):
+    # HTTP-сервер с файлами прайсов (для partner/update) в фоновом потоке, остановка - server.shutdown()
+    handler = functools.partial(QuietRequestHandler, directory=str(directory))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def git_revision():
+    # Коммит, на котором выполнен прогон, для сравнения результатов между коммитами
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,96 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+# Алиас кэша каталога в settings.CACHES, бэкенд (память процесса, файлы, БД) выбирается настройками
+CACHE_ALIAS = 'catalog'
+
+# Пространства имен версий: общий каталог (категории, магазины, товары, параметры)
+# и прайс отдельного магазина (карточки товаров магазина)
+CATALOG = 'catalog'
+
+
+def shop_namespace(shop_id):
+    return f'shop:{shop_id}'
+
+
+# Пространства имен кэша аутентификации (backend/authentication.py): токен и пользователь
+def token_namespace(key):
+    return f'token:{key}'
+
+
+def user_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def version_key(namespace):
+    return f'version:{namespace}'
+
+
+def get_versions(namespaces):
+    # Текущие версии пространств имен одним запросом к кэшу.
+    # Отсутствующая версия заводится от текущего времени, чтобы после вытеснения счетчика
+    # не совпасть с версией старых записей
+    cache = get_cache()
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*namespaces):
+    # Новая версия пространств имен делает недоступными все записи, построенные на старой
+    cache = get_cache()
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            cache.set(version_key(namespace), time.time_ns(), None)
+
+
+def invalidate(*namespaces):
+    # Смена версии после фиксации транзакции: иначе параллельный запрос успеет
+    # закэшировать под новой версией еще не измененные данные
+    transaction.on_commit(lambda: bump(*namespaces))
+
+
+def cached(namespaces, key, build):
+    # Read-through: значение берется из кэша по ключу с версиями всех пространств имен,
+    # от которых оно зависит, при промахе строится build() и сохраняется на TIMEOUT кэша.
+    # Версии хранятся без срока жизни
+    cache = get_cache()
+    versions = get_versions(namespaces)
+    digest = hashlib.md5(key.encode()).hexdigest()
+    full_key = ':'.join([*(f'{namespace}@{version}' for namespace, version in zip(namespaces, versions)), digest])
+    value = cache.get(full_key)
+    if value is None:
+        value = build()
+        cache.set(full_key, value)
+    return value
+
+
+class CachedListMixin:
+    # Кэширование ответа списка (страница целиком, с учетом параметров запроса) для ListAPIView.
+    # Хранится готовое тело JSON-ответа, поэтому list() следующего класса должен возвращать
+    # отрендеренный HttpResponse (FastListMixin).
+    # get_cache_namespaces возвращает пространства имен, от которых зависит ответ, или None - без кэша
+    def get_cache_namespaces(self, request):
+        return [CATALOG]
+
+    def list(self, request, *args, **kwargs):
+        namespaces = self.get_cache_namespaces(request)
+        if namespaces is None:
+            return super().list(request, *args, **kwargs)
+        content = cached(namespaces, request.build_absolute_uri(),
+                         lambda: super(CachedListMixin, self).list(request, *args, **kwargs).content)
+        return HttpResponse(content, content_type='application/json')
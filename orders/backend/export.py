@@ -0,0 +1,87 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+
+from backend.fast_serializers import dumps
+
+# Потоковая выгрузка списков (параметр export): строки читаются серверным курсором
+# (iterator(chunk_size)), пачками по chunk_size сериализуются функциями fast_serializers
+# и сразу отдаются клиенту, поэтому память процесса не зависит от размера выгрузки
+EXPORT_QUERY_PARAM = 'export'
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def iter_batches(queryset, fields, serialize, chunk_size=CHUNK_SIZE):
+    # Сериализованные пачки строк queryset.values(fields)
+    batch = []
+    for row in queryset.prefetch_related(None).values(*fields).iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) == chunk_size:
+            yield serialize(batch)
+            batch = []
+    if batch:
+        yield serialize(batch)
+
+
+def iter_json(batches):
+    # JSON-массив по частям: одна часть ответа на пачку строк
+    yield b'['
+    separator = b''
+    for batch in batches:
+        if batch:
+            yield separator + dumps(batch)[1:-1]
+            separator = b','
+    yield b']'
+
+
+def iter_ndjson(batches):
+    # NDJSON: объект на строку
+    for batch in batches:
+        if batch:
+            yield b'\n'.join(dumps(item) for item in batch) + b'\n'
+
+
+async def aiterate(iterator):
+    # Под ASGI синхронный итератор ответа Django сначала читает целиком в память.
+    # Части запрашиваются по одной в потоке для синхронного кода (thread_sensitive) -
+    # в том же, где открыт серверный курсор, соединения с БД привязаны к потоку
+    next_part = sync_to_async(next, thread_sensitive=True)
+    while (part := await next_part(iterator, None)) is not None:
+        yield part
+
+
+def export_response(request, queryset, fields, serialize, filename):
+    # Ответ с выгрузкой в формате из параметра export или ошибка 400 для неизвестного формата
+    export_format = request.GET.get(EXPORT_QUERY_PARAM)
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'Status': False, 'Errors': f'Формат выгрузки: {", ".join(EXPORT_FORMATS)}'},
+                            status=400)
+    batches = iter_batches(queryset, fields, serialize)
+    content = iter_json(batches) if export_format == 'json' else iter_ndjson(batches)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        content = aiterate(content)
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def is_export(request):
+    return EXPORT_QUERY_PARAM in request.GET
+
+
+class ExportListMixin:
+    # Выгрузка всего отфильтрованного списка ListAPIView вместо страницы: ?export=json или ?export=ndjson.
+    # Сортировка та же, что у пагинации представления; используются fast_fields и fast_serializer (FastListMixin)
+    export_filename = 'export'
+
+    def list(self, request, *args, **kwargs):
+        if not is_export(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.order_by(*self.paginator.get_ordering(queryset))
+        return export_response(request, queryset, self.fast_fields, self.fast_serializer, self.export_filename)
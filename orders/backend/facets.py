@@ -0,0 +1,223 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections, router, transaction
+from django.db.models import Q, Sum
+from rest_framework.exceptions import ValidationError
+
+from backend.models import Parameter, ParameterFacet, ParameterPairFacet, ProductInfo
+
+# Фильтры по значениям параметров и счетчики значений (фасеты) для списка товаров.
+# Фильтр: products?param=Цвет:красный&param=Цвет:синий&param=Встроенная память (Гб):256 -
+# значения одного параметра объединяются через ИЛИ, разные параметры - через И.
+# Фасеты (products?facets=1) суммируются из таблиц счетчиков по категории и магазину:
+# без фильтра - из ParameterFacet, с фильтром по одному параметру - из ParameterPairFacet
+# (счетчики значений при заданном значении другого параметра). При поиске или фильтре по
+# нескольким параметрам счетчики считаются по столбцу attributes отобранных карточек.
+# Счетчики поддерживаются приращениями: ProductInfo.facet_state хранит, с какой категорией
+# и значениями параметров карточка уже учтена, update_facets приводит счетчики к текущему состоянию карточек
+PARAMETER_QUERY_PARAM = 'param'
+FACETS_QUERY_PARAM = 'facets'
+
+# Приращения, накапливаемые внутри deferred_facets() (импорт прайса, каскадное удаление)
+_pending = ContextVar('pending_facet_deltas', default=None)
+
+
+def parse_parameter_filters(values):
+    # ['Цвет:красный', 'Цвет:синий'] -> {'Цвет': ['красный', 'синий']}
+    filters = {}
+    for value in values:
+        name, separator, parameter_value = value.partition(':')
+        if not separator or not name.strip() or not parameter_value.strip():
+            raise ValidationError({PARAMETER_QUERY_PARAM: f'Ожидается "параметр:значение", получено "{value}"'})
+        filters.setdefault(name.strip(), []).append(parameter_value.strip())
+    return filters
+
+
+def filter_by_parameters(queryset, filters):
+    # Условия по содержимому ProductInfo.attributes (attributes @> {"Цвет": "красный"}, GIN-индекс)
+    for name, values in filters.items():
+        condition = Q()
+        for value in values:
+            condition |= Q(attributes__contains={name: value})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def facet_counts(queryset, query_params):
+    # {параметр: {значение: число карточек}}, значения по убыванию числа карточек
+    scope = facet_scope(query_params)
+    filters = parse_parameter_filters(query_params.getlist(PARAMETER_QUERY_PARAM))
+    if scope is None or len(filters) > 1:
+        rows = attribute_counts(queryset)
+    elif filters:
+        # Значения самого параметра фильтра считаются без него, остальные - при выбранных его значениях;
+        # обе выборки - одним запросом UNION ALL
+        (name, values), = filters.items()
+        rows = summed_counts(ParameterFacet.objects.filter(**scope, parameter__name=name)).union(
+            summed_counts(ParameterPairFacet.objects.filter(**scope, filter_parameter__name=name,
+                                                            filter_value__in=values)), all=True)
+    else:
+        rows = summed_counts(ParameterFacet.objects.filter(**scope))
+    facets = {}
+    for name, value, count in sorted(rows, key=lambda row: (row[0], -row[2], row[1])):
+        facets.setdefault(name, {})[value] = count
+    return facets
+
+
+def summed_counts(queryset):
+    return queryset.values_list('parameter__name', 'value').annotate(count=Sum('count')).order_by()
+
+
+def attribute_counts(queryset):
+    # Группировка пар из attributes отобранных карточек: одна таблица, без соединения с ProductParameter
+    sql, params = queryset.order_by().values('attributes').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'SELECT attribute.key, attribute.value, COUNT(*) FROM ({sql}) AS product_info, '
+                       f'jsonb_each_text(product_info.attributes) AS attribute GROUP BY 1, 2', params)
+        return cursor.fetchall()
+
+
+def facet_scope(query_params):
+    # Фильтр таблиц счетчиков для запроса списка товаров или None, если счетчики из таблиц не подходят:
+    # задан поиск (или category/shop не целые)
+    if query_params.get('search', '').strip():
+        return None
+    scope = {}
+    for name in ('category', 'shop'):
+        value = query_params.get(name, '')
+        if value:
+            if not value.isdigit():
+                return None
+            scope[f'{name}_id'] = int(value)
+    return scope
+
+
+def wants_facets(query_params):
+    return query_params.get(FACETS_QUERY_PARAM) in ('1', 'true')
+
+
+def facet_state(category_id, attributes, is_active, parameter_ids):
+    # Значение ProductInfo.facet_state: карточка в продаже учитывается с категорией и параметрами
+    # {id параметра: значение} (по id, чтобы переименование параметра не меняло учтенного)
+    if not is_active:
+        return None
+    return {'category': category_id,
+            'parameters': {str(parameter_ids[name]): value for name, value in attributes.items() if name in parameter_ids}}
+
+
+class FacetDelta:
+    # Приращения счетчиков: (магазин, категория, параметр, значение) для ParameterFacet и
+    # (магазин, категория, параметр фильтра, значение фильтра, параметр, значение) для ParameterPairFacet
+    def __init__(self):
+        self.singles = Counter()
+        self.pairs = Counter()
+
+    def add(self, shop_id, state, sign=1):
+        if not state:
+            return
+        category_id = state['category']
+        parameters = [(int(parameter_id), value) for parameter_id, value in state['parameters'].items()]
+        for parameter_id, value in parameters:
+            self.singles[(shop_id, category_id, parameter_id, value)] += sign
+            for filter_parameter_id, filter_value in parameters:
+                if filter_parameter_id != parameter_id:
+                    self.pairs[(shop_id, category_id, filter_parameter_id, filter_value, parameter_id, value)] += sign
+
+    def update(self, other):
+        self.singles.update(other.singles)
+        self.pairs.update(other.pairs)
+
+    def apply(self):
+        apply_counts(ParameterFacet, ('shop_id', 'category_id', 'parameter_id', 'value'), self.singles)
+        apply_counts(ParameterPairFacet, ('shop_id', 'category_id', 'filter_parameter_id', 'filter_value',
+                                          'parameter_id', 'value'), self.pairs)
+
+
+def apply_counts(model, fields, deltas):
+    # Прибавление приращений {ключ: число} к счетчикам model. Существующие строки блокируются
+    # в порядке id (параллельные транзакции не взаимоблокируются) и обновляются одним запросом,
+    # недостающие вставляются, обнулившиеся удаляются
+    deltas = {key: count for key, count in deltas.items() if count}
+    if not deltas:
+        return
+    table = model._meta.db_table
+    columns = ', '.join(fields)
+    arrays = ', '.join('%s::bigint[]' if field.endswith('_id') else '%s::text[]' for field in fields)
+
+    def unnest(keys):
+        return [list(column) for column in zip(*keys)] + [[deltas[key] for key in keys]]
+
+    with connections[router.db_for_write(model)].cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} AS facet SET count = GREATEST(facet.count + delta.count, 0) '
+            f'FROM (SELECT locked.id, delta.count FROM {table} AS locked '
+            f'JOIN unnest({arrays}, %s::integer[]) AS delta({columns}, count) USING ({columns}) '
+            f'ORDER BY locked.id FOR UPDATE OF locked) AS delta '
+            f'WHERE facet.id = delta.id RETURNING facet.id, facet.count, {", ".join(f"facet.{f}" for f in fields)}',
+            unnest(list(deltas)))
+        updated = cursor.fetchall()
+        existing = {tuple(row[2:]) for row in updated}
+        created = sorted(key for key, count in deltas.items() if count > 0 and key not in existing)
+        if created:
+            # Строку могла вставить параллельная транзакция - тогда приращение прибавляется к ней
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}, count) SELECT * FROM unnest({arrays}, %s::integer[]) '
+                f'ON CONFLICT ({columns}) DO UPDATE SET count = {table}.count + EXCLUDED.count',
+                unnest(created))
+        emptied = [row[0] for row in updated if not row[1]]
+        if emptied:
+            cursor.execute(f'DELETE FROM {table} WHERE id = ANY(%s) AND count = 0', [emptied])
+
+
+def add_deltas(delta):
+    pending = _pending.get()
+    if pending is not None:
+        pending.update(delta)
+    else:
+        delta.apply()
+
+
+@contextmanager
+def deferred_facets():
+    # Приращения внутри блока накапливаются и применяются к счетчикам один раз при выходе:
+    # импорт прайса и каскадные удаления пишут счетчики одной порцией, а не по каждой карточке.
+    # При исключении приращения отбрасываются вместе с откатываемой транзакцией
+    delta = FacetDelta()
+    token = _pending.set(delta)
+    try:
+        yield delta
+    finally:
+        _pending.reset(token)
+    add_deltas(delta)
+
+
+def update_facets(product_info_ids):
+    # Приведение счетчиков к текущим категории, параметрам и статусу карточек: разница между
+    # facet_state (что уже учтено) и текущим состоянием. Строки карточек блокируются, поэтому
+    # параллельные правки одной карточки учитываются по очереди и ровно один раз
+    if not product_info_ids:
+        return
+    delta = FacetDelta()
+    changed = []
+    with transaction.atomic():
+        rows = list(ProductInfo.objects.select_for_update(of=('self',)).filter(id__in=product_info_ids).order_by(
+            'id').values_list('id', 'shop_id', 'product__category_id', 'attributes', 'is_active', 'facet_state'))
+        names = {name for row in rows if row[4] for name in row[3]}
+        parameter_ids = dict(Parameter.objects.filter(name__in=names).values_list('name', 'id')) if names else {}
+        for product_info_id, shop_id, category_id, attributes, is_active, old_state in rows:
+            new_state = facet_state(category_id, attributes, is_active, parameter_ids)
+            if new_state != old_state:
+                delta.add(shop_id, old_state, -1)
+                delta.add(shop_id, new_state)
+                changed.append(ProductInfo(id=product_info_id, facet_state=new_state))
+        ProductInfo.objects.bulk_update(changed, ['facet_state'], batch_size=1000)
+        add_deltas(delta)
+
+
+def clear_shop_facets(shop_id):
+    # Снятие всех карточек магазина со счетчиков перед их удалением (импорт в режиме replace)
+    ParameterFacet.objects.filter(shop_id=shop_id).delete()
+    ParameterPairFacet.objects.filter(shop_id=shop_id).delete()
+    ProductInfo.objects.filter(shop_id=shop_id).update(is_active=False, facet_state=None)
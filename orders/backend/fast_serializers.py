@@ -0,0 +1,175 @@
+import ujson
+from django.db.models import Prefetch
+from django.http import HttpResponse
+from django.utils import timezone
+
+from backend.attributes import parameter_strings
+from backend.metrics import serialization
+from backend.models import Category, Order, OrderItem, Product, ProductInfo, Shop, User
+
+# Быстрая сериализация списков для чтения: строки выбираются через values() пачкой на каждый уровень
+# вложенности и собираются в словари без объектов моделей и полей DRF, результат кодируется ujson.
+# Вывод совпадает с ProductInfoSerializer, CategorySerializer, OrderSerializer и CustomerOrderSerializer
+# байт в байт (проверяется командой bench_serializers), поэтому вложенные списки в обоих вариантах
+# упорядочены по id - ниже заданы prefetch-запросы для сериализаторов DRF с той же сортировкой.
+# Параметры карточек в обоих вариантах выводятся из ProductInfo.attributes, без запросов к ProductParameter
+
+SHOPS_PREFETCH = Prefetch('shops', queryset=Shop.objects.select_related('user').order_by('id'))
+PRODUCT_INFO_PREFETCH = (Prefetch('product__category__shops', queryset=SHOPS_PREFETCH.queryset),)
+
+PRODUCT_INFO_FIELDS = ('id', 'product_id', 'model', 'shop_id', 'description', 'quantity', 'price',
+                       'recomended_price', 'attributes')
+CATEGORY_FIELDS = ('id', 'name')
+ORDER_FIELDS = ('id', 'user_id', 'created_at', 'status', 'shop_id', 'total')
+
+
+def decimal(value):
+    # DecimalField DRF выводит строкой с числом знаков поля, значения из БД уже имеют этот масштаб
+    return str(value)
+
+
+def iso_datetime(value):
+    # Как DateTimeField DRF: время в текущем часовом поясе, ISO 8601, UTC обозначается Z
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def dumps(data):
+    # Как JSONRenderer DRF: без экранирования не-ASCII символов и "/", компактные разделители
+    content = ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False)
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode('utf-8')
+
+
+def json_response(data):
+    return HttpResponse(dumps(data), content_type='application/json')
+
+
+def page_values(queryset, fields):
+    # values() для страницы списка: поля вывода и аннотации, по которым идет сортировка (например, rank поиска)
+    return queryset.prefetch_related(None).values(*fields, *queryset.query.annotations)
+
+
+def shops_by_category(category_ids):
+    shops = {category_id: [] for category_id in category_ids}
+    for row in Category.shops.through.objects.filter(category_id__in=category_ids).order_by('shop_id').values(
+            'category_id', 'shop_id', 'shop__name', 'shop__url', 'shop__status',
+            'shop__user_id', 'shop__user__adress', 'shop__user__phone'):
+        shops[row['category_id']].append({
+            'id': row['shop_id'],
+            'name': row['shop__name'],
+            'url': row['shop__url'],
+            'status': row['shop__status'],
+            'user': {'id': row['shop__user_id'], 'adress': row['shop__user__adress'], 'phone': row['shop__user__phone']},
+        })
+    return shops
+
+
+def categories(rows):
+    # rows - values(*CATEGORY_FIELDS) категорий
+    shops = shops_by_category([row['id'] for row in rows])
+    return [{'id': row['id'], 'name': row['name'], 'shops': shops[row['id']]} for row in rows]
+
+
+def product_infos(rows):
+    # rows - values(*PRODUCT_INFO_FIELDS) карточек товаров
+    products = {row['id']: row for row in Product.objects.filter(
+        id__in={row['product_id'] for row in rows}).values('id', 'name', 'category_id', 'category__name')}
+    shops = shops_by_category({product['category_id'] for product in products.values()})
+
+    result = []
+    for row in rows:
+        product = products[row['product_id']]
+        result.append({
+            'id': row['id'],
+            'product': {
+                'id': product['id'],
+                'name': product['name'],
+                'category': {'id': product['category_id'], 'name': product['category__name'],
+                             'shops': shops[product['category_id']]},
+            },
+            'model': row['model'],
+            'shop': row['shop_id'],
+            'description': row['description'],
+            'quantity': row['quantity'],
+            'price': decimal(row['price']),
+            'recomended_price': decimal(row['recomended_price']),
+            'parameters': parameter_strings(row['attributes']),
+        })
+    return result
+
+
+def user_names(user_ids):
+    # str(User) для StringRelatedField
+    return {row['id']: f'{row["first_name"]} {row["last_name"]}, {row["email"]}, {row["phone"]}'
+            for row in User.objects.filter(id__in=user_ids).values('id', 'first_name', 'last_name', 'email', 'phone')}
+
+
+def orders(rows, users=None, item_model=OrderItem):
+    # rows - values(*ORDER_FIELDS) заказов, вывод как у OrderSerializer.
+    # item_model - таблица позиций: OrderItem или OrderItemArchive для архивных заказов
+    users = users if users is not None else user_names({row['user_id'] for row in rows})
+    positions = {row['id']: [] for row in rows}
+    items = list(item_model.objects.filter(order_id__in=positions).order_by('id').values(
+        'id', 'order_id', 'product_info_id', 'quantity', 'price'))
+    infos = {info['id']: info for info in product_infos(list(ProductInfo.objects.filter(
+        id__in={item['product_info_id'] for item in items}).order_by('id').values(*PRODUCT_INFO_FIELDS)))}
+    for item in items:
+        positions[item['order_id']].append({
+            'id': item['id'],
+            'product_info': infos[item['product_info_id']],
+            'quantity': item['quantity'],
+            'price': decimal(item['price']),
+        })
+    return [{
+        'id': row['id'],
+        'user': users[row['user_id']],
+        'created_at': iso_datetime(row['created_at']),
+        'status': row['status'],
+        'shop': row['shop_id'],
+        'positions': positions[row['id']],
+        'cost': decimal(row['total']),
+    } for row in rows]
+
+
+def customer_orders(rows, order_model=Order, item_model=OrderItem):
+    # rows - values(*ORDER_FIELDS) заказов покупателя, вывод как у CustomerOrderSerializer
+    users = user_names({row['user_id'] for row in rows})
+    sub_orders = {row['id']: [] for row in rows}
+    sub_order_rows = list(order_model.objects.filter(parent_id__in=sub_orders).order_by('id').values(
+        *ORDER_FIELDS, 'parent_id'))
+    for sub_order_row, sub_order in zip(sub_order_rows, orders(sub_order_rows, users, item_model)):
+        sub_orders[sub_order_row['parent_id']].append(sub_order)
+    return [{
+        'id': row['id'],
+        'user': users[row['user_id']],
+        'created_at': iso_datetime(row['created_at']),
+        'status': row['status'],
+        'sub_orders': sub_orders[row['id']],
+        'cost': decimal(row['total']),
+    } for row in rows]
+
+
+def paginated_response(paginator, queryset, fields, serialize, request, view=None, extra=None):
+    # Страница queryset через values(fields) и ответ {'next', 'results'} как у KeysetPagination,
+    # extra - дополнительные ключи ответа
+    page = paginator.paginate_queryset(page_values(queryset, fields), request, view=view)
+    with serialization():
+        return json_response({'next': paginator.get_next_link(), 'results': serialize(page), **(extra or {})})
+
+
+class FastListMixin:
+    # list() для ListAPIView: фильтры и пагинация представления, сериализация функцией fast_serializer
+    # из этого модуля (staticmethod) вместо serializer_class - он остается для схемы API и проверки вывода
+    fast_fields = None
+    fast_serializer = None
+
+    def get_extra_data(self, request, queryset):
+        # Дополнительные ключи ответа, посчитанные по отфильтрованному списку целиком
+        return None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return paginated_response(self.paginator, queryset, self.fast_fields, self.fast_serializer, request,
+                                  view=self, extra=self.get_extra_data(request, queryset))
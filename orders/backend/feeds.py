@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import threading
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
+
+import httpx
+import ujson
+import yaml
+
+# Загрузчик на libyaml (C), если PyYAML собран с ним, иначе чистый Python
+try:
+    from yaml import CSafeLoader as FeedLoader
+except ImportError:
+    from yaml import SafeLoader as FeedLoader
+
+
+FEED_TIMEOUT = 30
+FEED_CHUNK_SIZE = 64 * 1024
+# Прайсы до этого размера держатся в памяти, большие сбрасываются во временный файл на диске
+FEED_SPOOL_SIZE = 8 * 1024 * 1024
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines')
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+
+class FeedError(ValueError):
+    pass
+
+
+class YamlFeed:
+    # Потоковый разбор прайса в формате shop1.yaml.
+    # Документ читается из файлоподобного объекта порциями, shop и categories разбираются сразу,
+    # а товары из goods отдаются по одному генератором goods, поэтому в памяти держится только текущий товар.
+    # shop и categories должны идти в документе раньше goods.
+    def __init__(self, stream):
+        self.loader = FeedLoader(stream)
+        self.shop = None
+        self.categories = []
+        self.has_goods = False
+        self.anchors = {}
+        self.read_header()
+
+    def expect(self, event_class):
+        event = self.loader.get_event()
+        if not isinstance(event, event_class):
+            raise FeedError(f'Неожиданная структура прайса: {event}')
+        return event
+
+    def read_header(self):
+        self.expect(yaml.StreamStartEvent)
+        self.expect(yaml.DocumentStartEvent)
+        self.expect(yaml.MappingStartEvent)
+        while not self.loader.check_event(yaml.MappingEndEvent):
+            key = self.expect(yaml.ScalarEvent).value
+            if key == 'goods':
+                self.expect(yaml.SequenceStartEvent)
+                self.has_goods = True
+                break
+            value = self.read_value()
+            if key == 'shop':
+                self.shop = value
+            elif key == 'categories':
+                self.categories = value or []
+        if self.shop is None:
+            raise FeedError('В прайсе не указан shop (он должен идти перед goods)')
+
+    def read_value(self):
+        # Сборка python-объекта из событий парсера; скаляры приводятся к типам так же, как в yaml.safe_load
+        loader = self.loader
+        event = loader.get_event()
+        if isinstance(event, yaml.AliasEvent):
+            return self.anchors[event.anchor]
+        if isinstance(event, yaml.ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+            # Конструктор тега вызывается напрямую: construct_object запоминает каждый узел
+            # в loader.constructed_objects, и за весь прайс там накопились бы все значения
+            constructor = loader.yaml_constructors.get(tag, loader.yaml_constructors[None])
+            value = constructor(loader, yaml.ScalarNode(tag, event.value, event.start_mark, event.end_mark,
+                                                        style=event.style))
+        elif isinstance(event, yaml.SequenceStartEvent):
+            value = []
+            while not loader.check_event(yaml.SequenceEndEvent):
+                value.append(self.read_value())
+            loader.get_event()
+        elif isinstance(event, yaml.MappingStartEvent):
+            value = {}
+            while not loader.check_event(yaml.MappingEndEvent):
+                key = self.read_value()
+                value[key] = self.read_value()
+            loader.get_event()
+        else:
+            raise FeedError(f'Неожиданная структура прайса: {event}')
+        if event.anchor is not None:
+            self.anchors[event.anchor] = value
+        return value
+
+    @property
+    def goods(self):
+        if not self.has_goods:
+            return
+        while not self.loader.check_event(yaml.SequenceEndEvent):
+            yield self.read_value()
+        self.loader.get_event()
+
+
+class NdjsonFeed:
+    # Прайс в формате JSON Lines: первая строка - заголовок {"shop": ..., "categories": [...]},
+    # каждая следующая строка - один товар в том же виде, что и элемент goods в shop1.yaml
+    def __init__(self, lines):
+        self.lines = (line for line in lines if line.strip())
+        try:
+            header = ujson.loads(next(self.lines))
+        except StopIteration:
+            raise FeedError('Пустой прайс')
+        except ValueError as error:
+            raise FeedError(str(error))
+        if 'shop' not in header:
+            raise FeedError('В заголовке прайса не указан shop')
+        self.shop = header['shop']
+        self.categories = header.get('categories', [])
+
+    @property
+    def goods(self):
+        for line in self.lines:
+            try:
+                yield ujson.loads(line)
+            except ValueError as error:
+                raise FeedError(str(error))
+
+
+def is_ndjson(url, content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return content_type in NDJSON_CONTENT_TYPES or urlparse(url).path.lower().endswith(NDJSON_EXTENSIONS)
+
+
+_loop = None
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    # Общий на процесс httpx.AsyncClient с пулом keep-alive соединений: повторные загрузки прайсов
+    # с того же сервера (из разных потоков воркера) используют уже открытые соединения.
+    # Клиент привязан к циклу событий, поэтому все загрузки идут в одном цикле в отдельном потоке
+    global _loop, _client
+    with _client_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='feed-downloads', daemon=True).start()
+            transport = httpx.AsyncHTTPTransport(
+                retries=2, limits=httpx.Limits(max_connections=None, max_keepalive_connections=16))
+            _client = httpx.AsyncClient(transport=transport, timeout=FEED_TIMEOUT, follow_redirects=True)
+        return _loop, _client
+
+
+class FeedDownload:
+    # Результат загрузки прайса: тело сохраняется во временный файл с одновременным подсчетом sha256,
+    # чтобы до разбора можно было сравнить его с хэшем последнего успешного импорта
+    def __init__(self, url, response):
+        self.url = url
+        self.not_modified = response.status_code == 304
+        self.etag = response.headers.get('ETag', '')
+        self.last_modified = response.headers.get('Last-Modified', '')
+        self.content_type = response.headers.get('Content-Type')
+        self.sha256 = ''
+        self.file = SpooledTemporaryFile(max_size=FEED_SPOOL_SIZE)
+        self.digest = hashlib.sha256()
+
+    def write(self, chunk):
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def finish(self):
+        if not self.not_modified:
+            self.sha256 = self.digest.hexdigest()
+        self.file.seek(0)
+        return self
+
+    def feed(self):
+        if is_ndjson(self.url, self.content_type):
+            return NdjsonFeed(self.file)
+        return YamlFeed(self.file)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def conditional_headers(etag, last_modified):
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    return headers
+
+
+def fetch_feed(url, etag='', last_modified=''):
+    # Загрузка прайса с условными заголовками: если прайс не менялся с прошлой загрузки,
+    # сервер ответит 304 и тело не передается. Поток задания ждет загрузку в цикле общего клиента,
+    # пока тело передается по сети, цикл обслуживает загрузки других заданий
+    loop, client = get_client()
+    return asyncio.run_coroutine_threadsafe(_afetch_feed(client, url, etag, last_modified), loop).result()
+
+
+async def _afetch_feed(client, url, etag, last_modified):
+    headers = conditional_headers(etag, last_modified)
+    async with client.stream('GET', url, headers=headers) as response:
+        # httpx считает ошибкой любой не 2xx ответ, включая 304
+        if response.status_code != 304:
+            response.raise_for_status()
+        download = FeedDownload(url, response)
+        if not download.not_modified:
+            async for chunk in response.aiter_bytes(FEED_CHUNK_SIZE):
+                download.write(chunk)
+        return download.finish()
@@ -0,0 +1,34 @@
+import django_filters
+from rest_framework.filters import BaseFilterBackend
+
+from backend.facets import PARAMETER_QUERY_PARAM, filter_by_parameters, parse_parameter_filters
+from backend.models import ProductInfo
+from backend.search import search_products
+
+
+class ProductInfoFilter(django_filters.FilterSet):
+    category = django_filters.NumberFilter(field_name='product__category')
+    shop = django_filters.NumberFilter(field_name='shop')
+
+    class Meta:
+        model = ProductInfo
+        fields = ['category', 'shop']
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    # Полнотекстовый поиск по параметру search с ранжированием по релевантности,
+    # использует поддерживаемый импортом вектор ProductInfo.search_vector и GIN-индекс по нему
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        return search_products(queryset, text)
+
+
+class ParameterFilter(BaseFilterBackend):
+    # Фильтр по значениям параметров: param=Цвет:красный (параметр можно повторять), см. backend/facets.py
+    def filter_queryset(self, request, queryset, view):
+        return filter_by_parameters(queryset, parse_parameter_filters(
+            request.query_params.getlist(PARAMETER_QUERY_PARAM)))
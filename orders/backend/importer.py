@@ -0,0 +1,285 @@
+import time
+from decimal import Decimal
+from itertools import islice
+
+from django.db import connection, transaction
+
+from backend.cache import CATALOG, invalidate, shop_namespace
+from backend.facets import clear_shop_facets, deferred_facets, facet_state, update_facets
+from backend.feeds import FeedError
+from backend.models import Category, Product, ProductInfo, Parameter, ProductParameter
+from backend.search import update_search_vectors
+
+
+def chunked(iterable, size):
+    # Разбивает любой итерируемый объект на списки длиной не более size
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def too_long(values):
+    # [(модель, поле, ключ в прайсе, значение)] -> описания значений длиннее max_length поля
+    errors = []
+    for model, field, key, value in values:
+        max_length = model._meta.get_field(field).max_length
+        if len(str(value)) > max_length:
+            errors.append(f'{key} длиннее {max_length} символов')
+    return errors
+
+
+class QueryCounter:
+    # Обертка для connection.execute_wrapper, считает запросы к БД за время импорта
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class CatalogImporter:
+    # Пакетный импорт прайс-листа магазина.
+    # Категории, товары и параметры разрешаются пачками через словари в памяти,
+    # карточки товаров и их параметры пишутся через bulk_create порциями по batch_size строк.
+    # Весь импорт выполняется в одной транзакции.
+    # Режимы:
+    #   sync - сравнение с текущими карточками магазина по external_id: вставляются только новые,
+    #          обновляются только изменившиеся поля, пропавшие из прайса снимаются с продажи (is_active=False)
+    #   replace - удаление всех карточек магазина и полная загрузка прайса заново
+    BATCH_SIZE = 1000
+    MODES = ('sync', 'replace')
+    # Поля карточки, которые сравниваются с прайсом в режиме sync (параметры - по копии в attributes)
+    SYNC_FIELDS = ('product_id', 'model', 'price', 'recomended_price', 'quantity', 'attributes', 'is_active')
+
+    def __init__(self, shop, mode='sync', batch_size=None):
+        if mode not in self.MODES:
+            raise ValueError(f'Неизвестный режим импорта: {mode}')
+        self.shop = shop
+        self.mode = mode
+        self.batch_size = batch_size or self.BATCH_SIZE
+        # (название, id категории) -> id товара
+        self.products = {}
+        # название параметра -> id параметра
+        self.parameters = {}
+        # external_id -> (id, значения SYNC_FIELDS) для текущих карточек магазина
+        self.current = {}
+        self.seen = set()
+        # Приращения счетчиков фасетов (backend/facets.py) за время импорта
+        self.facets = None
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.retired = 0
+
+    def run(self, categories, goods):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        # Приращения счетчиков фасетов всего импорта записываются одной порцией в конце транзакции
+        with connection.execute_wrapper(counter), transaction.atomic(), deferred_facets() as self.facets:
+            self.import_categories(categories)
+            if self.mode == 'replace':
+                # Все карточки магазина снимаются со счетчиков разом, а не сигналами по каждой
+                clear_shop_facets(self.shop.id)
+                ProductInfo.objects.filter(shop_id=self.shop.id).delete()
+                for chunk in chunked(goods, self.batch_size):
+                    self.import_goods(chunk)
+            else:
+                self.load_current()
+                for chunk in chunked(goods, self.batch_size):
+                    self.sync_goods(chunk)
+                self.retire_missing()
+        # Bulk-операции импорта не вызывают сигналов, кэш каталога и прайса магазина сбрасывается здесь
+        invalidate(CATALOG, shop_namespace(self.shop.id))
+        elapsed = time.perf_counter() - started
+        return {
+            'mode': self.mode,
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'retired': self.retired,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed else 0,
+            'queries': counter.count,
+        }
+
+    def import_categories(self, categories):
+        names = {category['id']: category['name'] for category in categories}
+        if not names:
+            return
+        self.check_lengths([f'категория {category_id}: {error}' for category_id, name in names.items()
+                            for error in too_long([(Category, 'name', 'name', name)])])
+        # Upsert категорий по id с обновлением названия
+        Category.objects.bulk_create([Category(id=category_id, name=name) for category_id, name in names.items()],
+                                     update_conflicts=True, unique_fields=['id'], update_fields=['name'])
+        # Привязка категорий к магазину одним запросом, существующие связи пропускаются
+        Category.shops.through.objects.bulk_create(
+            [Category.shops.through(category_id=category_id, shop_id=self.shop.id) for category_id in names],
+            ignore_conflicts=True)
+
+    def resolve_products(self, goods):
+        keys = {(item['name'], item['category']) for item in goods} - self.products.keys()
+        if not keys:
+            return
+        # Upsert по уникальному (name, category): существующие товары не дублируются
+        # даже при параллельных импортах разных магазинов, id возвращаются для всех строк
+        products = Product.objects.bulk_create([Product(name=name, category_id=category_id) for name, category_id in keys],
+                                               update_conflicts=True, unique_fields=['name', 'category'],
+                                               update_fields=['name'])
+        for product in products:
+            self.products[(product.name, product.category_id)] = product.id
+
+    def resolve_parameters(self, goods):
+        names = {name for item in goods for name in item.get('parameters', {})} - self.parameters.keys()
+        if not names:
+            return
+        parameters = Parameter.objects.bulk_create([Parameter(name=name) for name in names],
+                                                   update_conflicts=True, unique_fields=['name'], update_fields=['name'])
+        for parameter in parameters:
+            self.parameters[parameter.name] = parameter.id
+
+    @staticmethod
+    def item_errors(item):
+        # Значения строки прайса, не помещающиеся в столбцы, куда они записываются
+        values = [(Product, 'name', 'name', item['name']), (ProductInfo, 'model', 'model', item.get('model', ''))]
+        for name, value in item.get('parameters', {}).items():
+            values.append((Parameter, 'name', f'parameters ("{name[:20]}...")', name))
+            values.append((ProductParameter, 'value', f'parameters.{name}', value))
+        return [f'товар {item["id"]}: {error}' for error in too_long(values)]
+
+    @staticmethod
+    def check_lengths(errors):
+        # Все строки порции со слишком длинными значениями перечисляются в ошибке до записи,
+        # вместо ошибки БД "value too long" на первой из них
+        if errors:
+            raise FeedError('Значения длиннее допустимого: ' + '; '.join(errors))
+
+    def item_values(self, item):
+        # Значения SYNC_FIELDS из строки прайса, приведенные к типам полей модели
+        return (self.products[(item['name'], item['category'])],
+                item.get('model', ''),
+                Decimal(str(item['price'])).quantize(Decimal('0.01')),
+                Decimal(str(item['price_rrc'])).quantize(Decimal('0.01')),
+                int(item['quantity']),
+                self.item_attributes(item),
+                True)
+
+    @staticmethod
+    def item_attributes(item):
+        # Параметры строки прайса в виде ProductInfo.attributes
+        return {name: str(value) for name, value in item.get('parameters', {}).items()}
+
+    def item_parameters(self, item):
+        return {self.parameters[name]: value for name, value in self.item_attributes(item).items()}
+
+    def build_product_info(self, item):
+        product_info = ProductInfo(external_id=item['id'],
+                                   description=item.get('description', ''),
+                                   shop_id=self.shop.id)
+        for field, value in zip(self.SYNC_FIELDS, self.item_values(item)):
+            setattr(product_info, field, value)
+        # Новая карточка сразу учитывается в счетчиках фасетов
+        product_info.facet_state = facet_state(item['category'], product_info.attributes, True, self.parameters)
+        self.facets.add(self.shop.id, product_info.facet_state)
+        return product_info
+
+    def build_parameters(self, product_info_id, item):
+        return [ProductParameter(product_info_id=product_info_id, parameter_id=parameter_id, value=value)
+                for parameter_id, value in self.item_parameters(item).items()]
+
+    def insert_goods(self, goods):
+        product_infos = ProductInfo.objects.bulk_create([self.build_product_info(item) for item in goods])
+        product_parameters = []
+        for product_info, item in zip(product_infos, goods):
+            product_parameters.extend(self.build_parameters(product_info.id, item))
+        ProductParameter.objects.bulk_create(product_parameters, batch_size=self.batch_size)
+        update_search_vectors([product_info.id for product_info in product_infos])
+        self.created += len(goods)
+
+    def import_goods(self, goods):
+        self.check_lengths([error for item in goods for error in self.item_errors(item)])
+        self.resolve_products(goods)
+        self.resolve_parameters(goods)
+        self.insert_goods(self.unseen(goods))
+        self.rows += len(goods)
+
+    def unseen(self, goods):
+        # Повторы external_id внутри одного прайса пропускаются (карточка уникальна по магазину и external_id)
+        result = []
+        for item in goods:
+            if item['id'] not in self.seen:
+                self.seen.add(item['id'])
+                result.append(item)
+        return result
+
+    def load_current(self):
+        rows = ProductInfo.objects.filter(shop_id=self.shop.id, external_id__isnull=False).values_list(
+            'external_id', 'id', *self.SYNC_FIELDS)
+        self.current = {external_id: (product_info_id, values) for external_id, product_info_id, *values in rows}
+
+    def sync_goods(self, goods):
+        self.check_lengths([error for item in goods for error in self.item_errors(item)])
+        self.resolve_products(goods)
+        self.resolve_parameters(goods)
+        new_goods = []
+        existing_goods = []
+        for item in self.unseen(goods):
+            if item['id'] in self.current:
+                existing_goods.append(item)
+            else:
+                new_goods.append(item)
+        if new_goods:
+            self.insert_goods(new_goods)
+
+        # Изменившиеся карточки группируются по набору изменившихся полей,
+        # чтобы bulk_update писал только то, что действительно поменялось.
+        # Параметры сравниваются с attributes из load_current, таблица ProductParameter не читается
+        changes = {}
+        parameters_changed = []
+        touched = []
+        facets_changed = []
+        for item in existing_goods:
+            product_info_id, values = self.current[item['id']]
+            new_values = self.item_values(item)
+            fields = tuple(field for field, old, new in zip(self.SYNC_FIELDS, values, new_values) if old != new)
+            if not fields:
+                continue
+            product_info = ProductInfo(id=product_info_id)
+            for field, value in zip(self.SYNC_FIELDS, new_values):
+                setattr(product_info, field, value)
+            changes.setdefault(fields, []).append(product_info)
+            if 'attributes' in fields:
+                parameters_changed.append((product_info_id, item))
+            touched.append(product_info_id)
+            if {'product_id', 'attributes', 'is_active'} & set(fields):
+                facets_changed.append(product_info_id)
+            self.updated += 1
+
+        for fields, product_infos in changes.items():
+            ProductInfo.objects.bulk_update(product_infos, fields, batch_size=self.batch_size)
+        if parameters_changed:
+            # Удаление одним запросом без сигналов post_delete по каждой строке: поисковый вектор,
+            # attributes и фасеты импорт пересчитывает сам
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {ProductParameter._meta.db_table} WHERE product_info_id = ANY(%s)',
+                               [[product_info_id for product_info_id, _ in parameters_changed]])
+            product_parameters = []
+            for product_info_id, item in parameters_changed:
+                product_parameters.extend(self.build_parameters(product_info_id, item))
+            ProductParameter.objects.bulk_create(product_parameters, batch_size=self.batch_size)
+        # Поисковый вектор пересчитывается только для изменившихся карточек, счетчики фасетов -
+        # только для сменивших товар, параметры или статус
+        update_search_vectors(touched)
+        update_facets(facets_changed)
+        self.rows += len(goods)
+
+    def retire_missing(self):
+        # Карточки, пропавшие из прайса, не удаляются (на них ссылаются позиции заказов), а снимаются с продажи
+        retired = [product_info_id for external_id, (product_info_id, values) in self.current.items()
+                   if external_id not in self.seen and values[-1]]
+        for chunk in chunked(retired, self.batch_size):
+            self.retired += ProductInfo.objects.filter(id__in=chunk).update(is_active=False)
+            update_facets(chunk)
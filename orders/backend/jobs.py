@@ -0,0 +1,111 @@
+import threading
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from backend.cache import CATALOG, invalidate
+from backend.feeds import fetch_feed
+from backend.importer import CatalogImporter
+from backend.models import ImportJob, Shop, User
+
+# Как часто (в секундах) выполняющееся задание сохраняет прогресс в БД
+PROGRESS_INTERVAL = 1
+
+
+def enqueue_import(user_id, url, mode='sync'):
+    return ImportJob.objects.create(user_id=user_id, url=url, mode=mode)
+
+
+def claim_job():
+    # Захват следующего задания из очереди.
+    # Задания одного магазина выполняются строго по очереди: пока у пользователя есть задание
+    # в статусе running, его остальные задания не захватываются. Задания разных магазинов
+    # захватываются параллельно, skip_locked не дает двум воркерам взять одно и то же задание.
+    # Если магазин первого задания оказался занят, берется следующее задание другого магазина
+    busy_users = set()
+    while True:
+        with transaction.atomic():
+            busy = ImportJob.objects.filter(status='running').values('user_id')
+            job = ImportJob.objects.select_for_update(skip_locked=True).filter(
+                status='queued').exclude(user_id__in=busy).exclude(user_id__in=busy_users).order_by('id').first()
+            if job is None:
+                return None
+            # Блокировка строки пользователя сериализует захват заданий одного магазина разными воркерами,
+            # после нее проверка на выполняющееся задание повторяется уже с учетом их коммитов
+            User.objects.select_for_update().filter(id=job.user_id).exists()
+            if ImportJob.objects.filter(user_id=job.user_id, status='running').exists():
+                busy_users.add(job.user_id)
+                continue
+            job.status = 'running'
+            job.started_at = timezone.now()
+            job.save(update_fields=['status', 'started_at'])
+            return job
+
+
+def requeue_running():
+    # Возврат в очередь заданий, прерванных остановкой воркера
+    return ImportJob.objects.filter(status='running').update(status='queued', started_at=None, processed=0)
+
+
+def import_feed(job, result):
+    # Загрузка и импорт прайса задания.
+    # Если ссылка та же, что при прошлом импорте, запрос отправляется с If-None-Match/If-Modified-Since;
+    # при ответе 304 или совпадении sha256 тела с последним успешным импортом разбор и запись пропускаются.
+    # Режим replace всегда выполняет полную загрузку.
+    shop = Shop.objects.filter(user_id=job.user_id).first()
+    known = shop is not None and shop.url == job.url and job.mode != 'replace'
+    # Загрузка идет общим асинхронным клиентом процесса (httpx), поток задания ждет ее завершения
+    download = fetch_feed(job.url, shop.feed_etag if known else '', shop.feed_last_modified if known else '')
+    with download:
+        if known and (download.not_modified or download.sha256 == shop.feed_hash):
+            if not download.not_modified:
+                Shop.objects.filter(id=shop.id).update(feed_etag=download.etag,
+                                                       feed_last_modified=download.last_modified)
+            return {'skipped': True, 'reason': 'not_modified' if download.not_modified else 'same_hash'}
+
+        feed = download.feed()
+        shop, _ = Shop.objects.get_or_create(name=feed.shop, user_id=job.user_id)
+        result['importer'] = CatalogImporter(shop, mode=job.mode)
+        stats = result['importer'].run(feed.categories, feed.goods)
+        Shop.objects.filter(id=shop.id).update(url=job.url, feed_etag=download.etag,
+                                               feed_last_modified=download.last_modified,
+                                               feed_hash=download.sha256)
+        invalidate(CATALOG)
+        return stats
+
+
+def run_job(job):
+    # Выполнение задания. Импорт идет в отдельном потоке внутри своей транзакции,
+    # а текущий поток раз в PROGRESS_INTERVAL секунд сохраняет число обработанных строк,
+    # чтобы прогресс был виден через partner/update/<job_id> до завершения транзакции импорта.
+    result = {}
+
+    def target():
+        try:
+            result['stats'] = import_feed(job, result)
+        except Exception as error:
+            result['error'] = error
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=target, name=f'import-job-{job.id}', daemon=True)
+    thread.start()
+    processed = 0
+    while thread.is_alive():
+        thread.join(PROGRESS_INTERVAL)
+        importer = result.get('importer')
+        if importer is not None and importer.rows != processed:
+            processed = importer.rows
+            ImportJob.objects.filter(id=job.id).update(processed=processed)
+
+    job.finished_at = timezone.now()
+    if 'error' in result:
+        job.status = 'failed'
+        job.error = str(result['error']) or result['error'].__class__.__name__
+    else:
+        job.stats = result['stats']
+        job.status = 'skipped' if job.stats.get('skipped') else 'done'
+        job.processed = job.stats.get('rows', 0)
+    job.save(update_fields=['status', 'error', 'stats', 'processed', 'finished_at'])
+    connections.close_all()
+    return job
@@ -0,0 +1,36 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from backend.archive import RETENTION_DAYS, archivable_orders, archive_batch
+
+
+class Command(BaseCommand):
+    help = ('Перенос закрытых заказов (все заказы магазинов доставлены или отменены) старше срока хранения '
+            'из рабочих таблиц Order и OrderItem в архив OrderArchive и OrderItemArchive. '
+            'Заказы переносятся пачками, каждая пачка - в своей транзакции; запускается по расписанию (cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION_DAYS,
+                            help='Срок хранения закрытых заказов в рабочих таблицах, дней (settings.ORDER_ARCHIVE_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Заказов покупателей в одной транзакции')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать заказы для переноса')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(days=options['days'])
+        if options['dry_run']:
+            self.stdout.write(f'Заказов для переноса в архив (созданы до {cutoff:%Y-%m-%d %H:%M}): '
+                              f'{archivable_orders(cutoff).count()}')
+            return
+        started = time.perf_counter()
+        archived = 0
+        while True:
+            count = archive_batch(cutoff, options['batch_size'])
+            if not count:
+                break
+            archived += count
+            self.stdout.write(f'Перенесено заказов: {archived}')
+        self.stdout.write(f'Перенесено в архив заказов покупателей: {archived}, '
+                          f'{round(time.perf_counter() - started, 1)} с')
@@ -0,0 +1,65 @@
+import asyncio
+import ujson
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.benchmarks import run_load, start_server, wait_for_server
+
+# Сравниваемые эндпоинты: синхронный маршрут (APIView) и его асинхронная версия
+ENDPOINTS = (
+    ('products', 'products', 'async/products', False),
+    ('basket', 'basket', 'async/basket', True),
+    ('order', 'order', 'async/order', True),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнение пропускной способности WSGI (gunicorn, синхронные представления) и ASGI '
+            '(uvicorn, синхронные и async-представления) при высокой конкурентности. '
+            'Серверы запускаются командой с одинаковым числом процессов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый замер')
+        parser.add_argument('--concurrency', type=int, default=200, help='Одновременных запросов')
+        parser.add_argument('--workers', type=int, default=4, help='Процессов сервера')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков на процесс gunicorn')
+        parser.add_argument('--wsgi-port', type=int, default=8101)
+        parser.add_argument('--asgi-port', type=int, default=8102)
+        parser.add_argument('--base-path', default='/', help='Префикс, под которым подключены маршруты backend')
+        parser.add_argument('--query', default='page_size=50', help='Параметры запроса products')
+        parser.add_argument('--token', help='Токен пользователя для basket и order (без него - только products)')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        base_path = '/' + options['base_path'].strip('/') + '/' if options['base_path'].strip('/') else '/'
+        headers = {'Authorization': f'Token {options["token"]}'} if options['token'] else {}
+        servers = {
+            'wsgi': start_server('wsgi', options['wsgi_port'], options['workers'], options['threads']),
+            'asgi': start_server('asgi', options['asgi_port'], options['workers']),
+        }
+        results = []
+        try:
+            for kind in servers:
+                if not wait_for_server(f'http://127.0.0.1:{options[f"{kind}_port"]}/'):
+                    raise CommandError(f'Сервер {kind} не запустился')
+            for name, sync_path, async_path, auth in ENDPOINTS:
+                if auth and not options['token']:
+                    continue
+                query = f'?{options["query"]}' if name == 'products' and options['query'] else ''
+                runs = [('wsgi', 'sync', sync_path), ('asgi', 'sync', sync_path), ('asgi', 'async', async_path)]
+                for kind, view, path in runs:
+                    url = f'http://127.0.0.1:{options[f"{kind}_port"]}{base_path}{path}{query}'
+                    # Прогрев: соединения с БД, импорт модулей в процессах сервера
+                    asyncio.run(run_load(url, min(100, options['requests']), options['concurrency'], headers))
+                    stats = asyncio.run(run_load(url, options['requests'], options['concurrency'], headers))
+                    results.append({'endpoint': name, 'server': kind, 'view': view, **stats})
+                    self.stdout.write(f'{name:10} {kind} {view:5} {stats["rps"]:>9} rps  p50 {stats["p50_ms"]} ms  '
+                                      f'p95 {stats["p95_ms"]} ms  p99 {stats["p99_ms"]} ms  ошибок {stats["errors"]}')
+        finally:
+            for process in servers.values():
+                process.terminate()
+            for process in servers.values():
+                process.wait()
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(ujson.dumps(results, indent=2, ensure_ascii=False))
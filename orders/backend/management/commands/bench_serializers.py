@@ -0,0 +1,81 @@
+import time
+
+import ujson
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from backend import fast_serializers
+from backend.basket import ORDER_POSITIONS_PREFETCH, SUB_ORDERS_PREFETCH
+from backend.benchmarks import percentile
+from backend.models import Category, Order, ProductInfo
+from backend.serializers import CategorySerializer, CustomerOrderSerializer, OrderSerializer, ProductInfoSerializer
+
+
+class Command(BaseCommand):
+    help = ('Сравнение сериализации страниц списков: сериализаторы DRF с JSONRenderer против fast_serializers '
+            '(values() и ujson). Для каждого списка проверяет, что ответы совпадают байт в байт, '
+            'и выводит медиану и p95 времени построения страницы, включая запросы к БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50, help='Строк на странице')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого варианта')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def get_cases(self):
+        # (название, queryset для DRF, сериализатор DRF, queryset для values(), поля, функция fast_serializers)
+        products = ProductInfo.objects.filter(is_active=True).order_by('price', 'id')
+        categories = Category.objects.order_by('id')
+        orders = Order.objects.exclude(status='temporary').filter(shop__isnull=False).order_by('-created_at', '-id')
+        customer_orders = Order.objects.filter(parent__isnull=True).exclude(status='temporary').order_by(
+            '-created_at', '-id')
+        return [
+            ('products', products.select_related('product__category', 'shop').prefetch_related(
+                *fast_serializers.PRODUCT_INFO_PREFETCH), ProductInfoSerializer,
+             products, fast_serializers.PRODUCT_INFO_FIELDS, fast_serializers.product_infos),
+            ('categories', categories.prefetch_related(fast_serializers.SHOPS_PREFETCH), CategorySerializer,
+             categories, fast_serializers.CATEGORY_FIELDS, fast_serializers.categories),
+            ('partner orders', orders.select_related('user').prefetch_related(ORDER_POSITIONS_PREFETCH),
+             OrderSerializer, orders, fast_serializers.ORDER_FIELDS, fast_serializers.orders),
+            ('customer orders', customer_orders.select_related('user').prefetch_related(SUB_ORDERS_PREFETCH),
+             CustomerOrderSerializer, customer_orders, fast_serializers.ORDER_FIELDS,
+             fast_serializers.customer_orders),
+        ]
+
+    @staticmethod
+    def measure(build, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            content = build()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        return content, timings
+
+    def handle(self, *args, **options):
+        limit, repeat = options['limit'], options['repeat']
+        renderer = JSONRenderer()
+        results = []
+        for name, queryset, serializer_class, values_queryset, fields, serialize in self.get_cases():
+            drf_content, drf_timings = self.measure(
+                lambda: renderer.render(serializer_class(list(queryset[:limit]), many=True).data), repeat)
+            fast_content, fast_timings = self.measure(
+                lambda: fast_serializers.dumps(serialize(list(values_queryset.values(*fields)[:limit]))), repeat)
+            if drf_content != fast_content:
+                raise CommandError(f'{name}: вывод fast_serializers отличается от сериализатора DRF')
+            result = {
+                'endpoint': name,
+                'rows': len(ujson.loads(drf_content)),
+                'bytes': len(drf_content),
+                'drf_p50_ms': round(percentile(drf_timings, 50) * 1000, 2),
+                'drf_p95_ms': round(percentile(drf_timings, 95) * 1000, 2),
+                'fast_p50_ms': round(percentile(fast_timings, 50) * 1000, 2),
+                'fast_p95_ms': round(percentile(fast_timings, 95) * 1000, 2),
+            }
+            result['speedup'] = round(result['drf_p50_ms'] / result['fast_p50_ms'], 2) if result['fast_p50_ms'] else 0
+            results.append(result)
+            self.stdout.write(f'{name}: {result["rows"]} строк, {result["bytes"]} байт, вывод совпадает; '
+                              f'DRF p50 {result["drf_p50_ms"]} ms, fast p50 {result["fast_p50_ms"]} ms, '
+                              f'ускорение x{result["speedup"]}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(ujson.dumps(results, indent=2, ensure_ascii=False))
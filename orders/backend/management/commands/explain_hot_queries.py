@@ -0,0 +1,80 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+
+from backend.facets import filter_by_parameters
+from backend.models import (ConfirmEmailToken, Order, OrderArchive, ParameterFacet, ParameterPairFacet, Product,
+                            ProductInfo, ProductParameter, Shop, User)
+
+
+class Command(BaseCommand):
+    help = ('Планы выполнения (EXPLAIN ANALYZE) основных запросов магазина. '
+            'Для сравнения до/после индексов выполните команду на миграции 0007 и на 0008 '
+            '(manage.py migrate backend 0007 / manage.py migrate backend) с --output в разные файлы')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Сохранить планы в файл')
+        parser.add_argument('--no-analyze', action='store_true', help='Только EXPLAIN, без выполнения запросов')
+
+    def get_queries(self):
+        # Запросы горячих путей API в том виде, в каком их строят представления и импорт
+        user = User.objects.filter(orders__isnull=False).order_by('id').first() or User.objects.order_by('id').first()
+        shop = Shop.objects.order_by('id').first()
+        product = Product.objects.order_by('id').first()
+        token = ConfirmEmailToken.objects.select_related('user').order_by('id').first()
+        if user is None or shop is None or product is None:
+            raise CommandError('Для сравнения планов нужны данные: пользователи, магазин и импортированный прайс')
+        queries = {
+            'basket: Order(user, status=temporary)':
+                Order.objects.filter(user_id=user.id, status='temporary'),
+            'orders: Order(user) без корзины, по (created_at, id)':
+                Order.objects.filter(user_id=user.id, parent__isnull=True).exclude(status='temporary').order_by(
+                    '-created_at', '-id')[:50],
+            'partner orders: Order(shop) по (created_at, id)':
+                Order.objects.filter(shop_id=shop.id).order_by('-created_at', '-id')[:50],
+            'orders history: OrderArchive(user) по (created_at, id)':
+                OrderArchive.objects.filter(user_id=user.id, parent__isnull=True).order_by('-created_at', '-id')[:50],
+            'orders: Order(user, status)':
+                Order.objects.filter(user_id=user.id, status='new'),
+            'products: ProductInfo(shop, product)':
+                ProductInfo.objects.filter(shop_id=shop.id, product_id=product.id),
+            'products: ProductInfo в продаже по (price, id)':
+                ProductInfo.objects.filter(is_active=True).order_by('price', 'id')[:50],
+            'import: Product(name, category)':
+                Product.objects.filter(name=product.name, category_id=product.category_id),
+            'import: ProductInfo(shop, external_id)':
+                ProductInfo.objects.filter(shop_id=shop.id, external_id__isnull=False).values_list('external_id', 'id'),
+        }
+        parameter = ProductParameter.objects.select_related('parameter').order_by('id').first()
+        if parameter is not None:
+            queries['products: фасеты по категории из ParameterFacet'] = ParameterFacet.objects.filter(
+                category_id=product.category_id).values('parameter__name', 'value').annotate(count=Sum('count'))
+            queries['products: фасеты при фильтре по параметру из ParameterPairFacet'] = ParameterPairFacet.objects.filter(
+                category_id=product.category_id, filter_parameter__name=parameter.parameter.name,
+                filter_value__in=[parameter.value]).values('parameter__name', 'value').annotate(count=Sum('count'))
+            queries['products: фильтр по значению параметра по (price, id)'] = filter_by_parameters(
+                ProductInfo.objects.filter(is_active=True),
+                {parameter.parameter.name: [parameter.value]}).order_by('price', 'id')[:50]
+        if token is not None:
+            queries['email confirm: ConfirmEmailToken(user__email, key)'] = ConfirmEmailToken.objects.filter(
+                user__email=token.user.email, key=token.key)
+        return queries
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Команда рассчитана на PostgreSQL')
+        analyze = not options['no_analyze']
+        report = []
+        for name, queryset in self.get_queries().items():
+            plan = queryset.explain(analyze=analyze)
+            timing = re.search(r'Execution Time: ([\d.]+) ms', plan)
+            report.append(f'=== {name}' + (f' ({timing.group(1)} ms)' if timing else ''))
+            report.append(plan)
+            report.append('')
+        text = '\n'.join(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text)
+        self.stdout.write(text)
@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from backend.benchmarks import generate_feed, write_feed
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических прайсов в формате shop1.yaml: N магазинов по M товаров с K параметрами. '
+            'Содержимое воспроизводимо - определяется аргументами и --seed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=10, help='Число магазинов (файлов прайсов)')
+        parser.add_argument('--goods', type=int, default=1000, help='Товаров в прайсе магазина')
+        parser.add_argument('--parameters', type=int, default=5, help='Параметров у товара')
+        parser.add_argument('--categories', type=int, default=10, help='Число категорий')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output-dir', default='bench_feeds', help='Каталог для файлов shop<N>.yaml')
+
+    def handle(self, *args, **options):
+        directory = Path(options['output_dir'])
+        directory.mkdir(parents=True, exist_ok=True)
+        for index in range(options['shops']):
+            path = directory / f'shop{index}.yaml'
+            write_feed(generate_feed(index, options['goods'], options['parameters'], options['categories'],
+                                     options['seed']), path)
+            self.stdout.write(f'{path}: {options["goods"]} товаров')
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import ujson
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from backend.benchmarks import git_revision, run_load, serve_directory, start_server, wait_for_server
+from backend.jobs import claim_job, run_job
+from backend.management.commands.seed_bench import BUYER_PREFIX, SHOP_PREFIX
+from backend.models import ImportJob, Order, ProductInfo, Shop
+
+# Сценарии: метод, путь (относительно --base-path), чьи токены используются (None - анонимно).
+# Тело запроса для POST строит get_data
+SCENARIOS = {
+    'products': ('GET', 'products?page_size=50', None),
+    'products-search': ('GET', 'products?search=Товар&page_size=50', None),
+    'basket': ('GET', 'basket', 'buyers'),
+    'basket-add': ('POST', 'basket', 'buyers'),
+    'order': ('GET', 'order', 'buyers'),
+    'partner-orders': ('GET', 'partner/orders', 'shops'),
+    'partner-update': ('POST', 'partner/update', 'shops'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон реальных эндпоинтов на данных seed_bench: для каждого сценария и уровня '
+            'конкурентности - пропускная способность и задержки p50/p95/p99. Сценарий import выполняет '
+            'задания импорта прайсов всех магазинов и измеряет строк в секунду. Результаты с коммитом '
+            'сохраняются в JSON (--output) и сравниваются с предыдущим прогоном (--compare)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join([*SCENARIOS, 'import']),
+                            help='Сценарии через запятую: ' + ', '.join([*SCENARIOS, 'import']))
+        parser.add_argument('--concurrency', default='1,16,64', help='Уровни конкурентности через запятую')
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на сценарий и уровень')
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='Запускаемый сервер (gunicorn или uvicorn)')
+        parser.add_argument('--url', help='Адрес уже запущенного сервера вместо запуска --server')
+        parser.add_argument('--port', type=int, default=8103)
+        parser.add_argument('--workers', type=int, default=4, help='Процессов сервера')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков на процесс gunicorn')
+        parser.add_argument('--base-path', default='/', help='Префикс, под которым подключены маршруты backend')
+        parser.add_argument('--feeds-dir', default='bench_feeds', help='Каталог прайсов seed_bench')
+        parser.add_argument('--feeds-port', type=int, default=8104)
+        parser.add_argument('--import-workers', type=int, default=4, help='Параллельных заданий в сценарии import')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'].split(',')
+        unknown = set(scenarios) - {*SCENARIOS, 'import'}
+        if unknown:
+            raise CommandError(f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        self.tokens = {
+            'shops': list(Token.objects.filter(user__username__startswith=SHOP_PREFIX).order_by(
+                'user_id').values_list('key', flat=True)),
+            'buyers': list(Token.objects.filter(user__username__startswith=BUYER_PREFIX).order_by(
+                'user_id').values_list('key', flat=True)),
+        }
+        if not self.tokens['shops'] or not self.tokens['buyers']:
+            raise CommandError('Нет данных для прогона: выполните manage.py seed_bench')
+        self.feeds = serve_directory(Path(options['feeds_dir']), options['feeds_port'])
+
+        server = None
+        base_url = options['url']
+        if not base_url:
+            server = start_server(options['server'], options['port'], options['workers'], options['threads'])
+            base_url = f'http://127.0.0.1:{options["port"]}'
+        base_url = base_url.rstrip('/') + '/' + (options['base_path'].strip('/') + '/').lstrip('/')
+        results = []
+        self.started_at = timezone.now()
+        try:
+            if not wait_for_server(base_url):
+                raise CommandError(f'Сервер {base_url} не отвечает')
+            for name in scenarios:
+                if name == 'import':
+                    results.append(self.run_import(options))
+                    continue
+                for level in levels:
+                    results.append(self.run_scenario(name, base_url, level, options['requests']))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            self.feeds.shutdown()
+            self.delete_queued_jobs()
+
+        report = {
+            'revision': git_revision(),
+            'created_at': self.started_at.isoformat(),
+            'server': 'external' if options['url'] else options['server'],
+            'catalog': {
+                'shops': Shop.objects.filter(user__username__startswith=SHOP_PREFIX).count(),
+                'product_infos': ProductInfo.objects.filter(shop__user__username__startswith=SHOP_PREFIX).count(),
+                'orders': Order.objects.filter(user__username__startswith=BUYER_PREFIX,
+                                               parent__isnull=True).exclude(status='temporary').count(),
+            },
+            'results': results,
+        }
+        if options['compare']:
+            self.compare(report, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(ujson.dumps(report, indent=2, ensure_ascii=False))
+
+    def get_data(self, name):
+        if name == 'basket-add':
+            # Повторное добавление того же товара заменяет количество, корзина не растет
+            product_info = ProductInfo.objects.filter(
+                shop__user__username__startswith=SHOP_PREFIX, is_active=True).order_by('id').first()
+            return {'items': ujson.dumps([{'product_info': product_info.id, 'quantity': 1}])}
+        if name == 'partner-update':
+            return {'url': f'http://127.0.0.1:{self.feeds.server_address[1]}/shop0.yaml'}
+        return None
+
+    def run_scenario(self, name, base_url, concurrency, requests):
+        method, path, users = SCENARIOS[name]
+        url = base_url + path
+        tokens = self.tokens[users] if users else None
+        data = self.get_data(name)
+        # Прогрев: соединения с БД и кэши в процессах сервера
+        asyncio.run(run_load(url, min(50, requests), concurrency, method=method, data=data, tokens=tokens))
+        stats = asyncio.run(run_load(url, requests, concurrency, method=method, data=data, tokens=tokens))
+        if name == 'partner-update':
+            self.delete_queued_jobs()
+        self.stdout.write(f'{name:16} x{concurrency:<4} {stats["rps"]:>9} rps  p50 {stats["p50_ms"]} ms  '
+                          f'p95 {stats["p95_ms"]} ms  p99 {stats["p99_ms"]} ms  ошибок {stats["errors"]}')
+        return {'scenario': name, 'concurrency': concurrency, **stats}
+
+    def delete_queued_jobs(self):
+        # Задания partner/update только ставятся в очередь, выполнять их не нужно
+        ImportJob.objects.filter(user__username__startswith=SHOP_PREFIX, status='queued',
+                                 created_at__gte=self.started_at).delete()
+
+    def run_import(self, options):
+        # Задания импорта прайсов всех магазинов выполняются в этом процессе, как run_import_worker.
+        # Состояние прайса сбрасывается, чтобы задание не пропускалось по ETag или хэшу
+        port = self.feeds.server_address[1]
+        shops = list(Shop.objects.filter(user__username__startswith=SHOP_PREFIX).order_by('id'))
+        Shop.objects.filter(id__in=[shop.id for shop in shops]).update(feed_etag='', feed_last_modified='',
+                                                                        feed_hash='')
+        jobs = [ImportJob.objects.create(user_id=shop.user_id, url=f'http://127.0.0.1:{port}/shop{index}.yaml')
+                for index, shop in enumerate(shops)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['import_workers']) as pool:
+            running = set()
+            while True:
+                job = claim_job() if len(running) < options['import_workers'] else None
+                if job is not None:
+                    running.add(pool.submit(run_job, job))
+                    continue
+                running = {future for future in running if not future.done()}
+                if not running and not ImportJob.objects.filter(id__in=[job.id for job in jobs],
+                                                                status='queued').exists():
+                    break
+                time.sleep(0.05)
+        elapsed = time.perf_counter() - started
+        finished = list(ImportJob.objects.filter(id__in=[job.id for job in jobs]))
+        rows = sum(job.processed for job in finished)
+        result = {
+            'scenario': 'import',
+            'concurrency': options['import_workers'],
+            'jobs': len(finished),
+            'errors': sum(job.status == 'failed' for job in finished),
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed, 1) if elapsed else 0,
+        }
+        self.stdout.write(f'import           x{result["concurrency"]:<4} {result["jobs"]} заданий, {rows} строк, '
+                          f'{result["rows_per_sec"]} строк/с, ошибок {result["errors"]}')
+        return result
+
+    def compare(self, report, path):
+        # Изменение метрик относительно прогона из файла path по совпадающим (сценарий, конкурентность)
+        with open(path, encoding='utf-8') as file:
+            previous = ujson.load(file)
+        before = {(result['scenario'], result['concurrency']): result for result in previous['results']}
+        self.stdout.write(f'Сравнение с {previous.get("revision")} ({previous.get("created_at")}):')
+        for result in report['results']:
+            old = before.get((result['scenario'], result['concurrency']))
+            if old is None:
+                continue
+            keys = ['rows_per_sec'] if result['scenario'] == 'import' else ['rps', 'p50_ms', 'p95_ms', 'p99_ms']
+            changes = []
+            for key in keys:
+                change = round((result[key] - old[key]) / old[key] * 100, 1) if old[key] else 0
+                changes.append(f'{key} {old[key]} -> {result[key]} ({change:+}%)')
+            self.stdout.write(f'{result["scenario"]:16} x{result["concurrency"]:<4} ' + ', '.join(changes))
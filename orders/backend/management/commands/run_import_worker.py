@@ -0,0 +1,51 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from backend.jobs import claim_job, requeue_running, run_job
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди импорта прайсов (partner/update): выполняет задания из таблицы ImportJob'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Число параллельно выполняемых заданий')
+        parser.add_argument('--poll', type=float, default=2, help='Пауза (сек) между опросами пустой очереди')
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='Вернуть в очередь задания в статусе running (после аварийной остановки воркера)')
+        parser.add_argument('--once', action='store_true', help='Выполнить задания из очереди и завершиться')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            self.stdout.write(f'Возвращено в очередь заданий: {requeue_running()}')
+
+        workers = options['workers']
+        running = set()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import-worker') as pool:
+            try:
+                while True:
+                    running = {future for future in running if not future.done()}
+                    claimed = False
+                    while len(running) < workers:
+                        job = claim_job()
+                        if job is None:
+                            break
+                        claimed = True
+                        self.stdout.write(f'Задание {job.id}: импорт {job.url}')
+                        running.add(pool.submit(self.process, job))
+                    if options['once'] and not claimed and not running:
+                        break
+                    if not claimed:
+                        time.sleep(options['poll'])
+            except KeyboardInterrupt:
+                self.stdout.write('Остановка воркера, ожидание выполняющихся заданий...')
+
+    def process(self, job):
+        job = run_job(job)
+        if job.status == 'done':
+            self.stdout.write(f'Задание {job.id} выполнено: {job.stats}')
+        elif job.status == 'skipped':
+            self.stdout.write(f'Задание {job.id} пропущено, прайс не изменился: {job.stats["reason"]}')
+        else:
+            self.stderr.write(f'Задание {job.id} завершилось ошибкой: {job.error}')
@@ -0,0 +1,87 @@
+import random
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from backend.basket import OutOfStockError, add_items, get_basket, place_order
+from backend.benchmarks import CATEGORY_BASE, generate_feed, write_feed
+from backend.importer import CatalogImporter
+from backend.models import Category, ProductInfo, Shop, User
+
+# Префиксы имен пользователей, которых создает команда; по ним их находит run_bench
+SHOP_PREFIX = 'bench-shop-'
+BUYER_PREFIX = 'bench-buyer-'
+
+
+class Command(BaseCommand):
+    help = ('Заполнение локальной БД данными для run_bench: магазины с синтетическими прайсами '
+            '(N магазинов x M товаров x K параметров), покупатели с токенами, корзины и история заказов. '
+            'Прайсы также пишутся в --feeds-dir для сценариев partner/update. Данные воспроизводимы по --seed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=10)
+        parser.add_argument('--goods', type=int, default=1000, help='Товаров в прайсе магазина')
+        parser.add_argument('--parameters', type=int, default=5, help='Параметров у товара')
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--buyers', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=10, help='Оформленных заказов на покупателя')
+        parser.add_argument('--basket-items', type=int, default=3, help='Позиций в корзине и в заказе')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--feeds-dir', default='bench_feeds')
+        parser.add_argument('--clear', action='store_true', help='Удалить данные предыдущего заполнения')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.clear()
+        started = time.perf_counter()
+        rng = random.Random(options['seed'])
+        feeds_dir = Path(options['feeds_dir'])
+        feeds_dir.mkdir(parents=True, exist_ok=True)
+
+        for index in range(options['shops']):
+            feed = generate_feed(index, options['goods'], options['parameters'], options['categories'],
+                                 options['seed'])
+            write_feed(feed, feeds_dir / f'shop{index}.yaml')
+            user = self.create_user(f'{SHOP_PREFIX}{index}', type='shop')
+            shop, _ = Shop.objects.get_or_create(name=feed['shop'], user=user)
+            stats = CatalogImporter(shop).run(feed['categories'], feed['goods'])
+            self.stdout.write(f'{feed["shop"]}: {stats["rows"]} строк, {stats["rows_per_sec"]} строк/с')
+
+        product_infos = list(ProductInfo.objects.filter(
+            shop__user__username__startswith=SHOP_PREFIX, is_active=True).values_list('id', flat=True))
+        placed = 0
+        for index in range(options['buyers']):
+            user = self.create_user(f'{BUYER_PREFIX}{index}')
+            for _ in range(options['orders']):
+                self.fill_basket(user, product_infos, options['basket_items'], rng)
+                try:
+                    placed += place_order(user.id, get_basket(user.id).id)
+                except OutOfStockError:
+                    pass
+            # Непустая корзина для сценариев basket
+            self.fill_basket(user, product_infos, options['basket_items'], rng)
+        self.stdout.write(f'Покупателей: {options["buyers"]}, оформлено заказов: {placed}, '
+                          f'{round(time.perf_counter() - started, 1)} с')
+
+    @staticmethod
+    def create_user(username, **fields):
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            user = User.objects.create_user(username, f'{username}@example.com', None, phone=0, is_active=True,
+                                            **fields)
+        Token.objects.get_or_create(user=user)
+        return user
+
+    @staticmethod
+    def fill_basket(user, product_infos, count, rng):
+        add_items(user.id, [{'product_info': product_info_id, 'quantity': rng.randint(1, 3)}
+                            for product_info_id in rng.sample(product_infos, min(count, len(product_infos)))])
+
+    def clear(self):
+        # Пользователи удаляются вместе с магазинами, карточками и заказами (каскад), категории - с товарами
+        deleted, _ = User.objects.filter(username__startswith=SHOP_PREFIX).delete()
+        deleted += User.objects.filter(username__startswith=BUYER_PREFIX).delete()[0]
+        deleted += Category.objects.filter(id__gte=CATEGORY_BASE).delete()[0]
+        self.stdout.write(f'Удалено объектов: {deleted}')
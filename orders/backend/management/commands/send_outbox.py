@@ -0,0 +1,60 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from backend.outbox import MAX_ATTEMPTS, send_batch
+
+
+class Command(BaseCommand):
+    help = ('Отправка писем из очереди OutboxEmail через одно SMTP-соединение. '
+            'Для проверки без почтового сервера: python -m aiosmtpd -n -l localhost:1025 '
+            'и send_outbox --host localhost --port 1025 --no-tls')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=100, help='Писем в одной пачке (одной транзакции)')
+        parser.add_argument('--poll', type=float, default=5, help='Пауза (сек) между опросами пустой очереди')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                            help='Число попыток, после которого письмо получает статус failed')
+        parser.add_argument('--once', action='store_true', help='Отправить готовые к отправке письма и завершиться')
+        parser.add_argument('--host', help='SMTP-сервер вместо settings.EMAIL_HOST')
+        parser.add_argument('--port', type=int, help='Порт вместо settings.EMAIL_PORT')
+        parser.add_argument('--no-tls', action='store_true', help='Без STARTTLS (локальный SMTP-сервер)')
+
+    def get_connection(self, options):
+        params = {}
+        if options['host']:
+            params['host'] = options['host']
+        if options['port']:
+            params['port'] = options['port']
+        if options['no_tls']:
+            params.update(use_tls=False, username='', password='')
+        return get_connection(**params)
+
+    def handle(self, *args, **options):
+        connection = self.get_connection(options)
+        try:
+            while True:
+                # Соединение открывается один раз и переиспользуется всеми пачками до обрыва
+                try:
+                    connection.open()
+                except OSError as error:
+                    self.stderr.write(f'Нет соединения с SMTP-сервером: {error}')
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+                sent, failed, disconnected = send_batch(connection, options['batch'], options['max_attempts'])
+                if sent or failed:
+                    self.stdout.write(f'Отправлено: {sent}, ошибок: {failed}')
+                if disconnected:
+                    connection.close()
+                    continue
+                if sent + failed < options['batch']:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            self.stdout.write('Остановка отправки')
+        finally:
+            connection.close()
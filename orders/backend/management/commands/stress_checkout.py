@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ujson
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from backend.basket import OutOfStockError, place_order
+from backend.benchmarks import summarize
+from backend.models import Category, Order, OrderItem, Product, ProductInfo, Shop, User
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочная проверка оформления заказов с резервированием остатков: параллельные покупатели '
+            'оформляют корзины с одними и теми же товарами. Проверяет отсутствие перепродажи и измеряет '
+            'TPS оформления на разном числе потоков. Создает временные данные и удаляет их по окончании')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--levels', default='1,2,4,8,16,32,64', help='Числа параллельных потоков через запятую')
+        parser.add_argument('--checkouts', type=int, default=20, help='Оформлений на поток')
+        parser.add_argument('--products', type=int, default=3, help='Товаров в каждой корзине (общих для всех)')
+        parser.add_argument('--stock-ratio', type=float, default=0.5,
+                            help='Остаток товара как доля от числа оформлений уровня (меньше 1 - часть получит отказ)')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Команда рассчитана на PostgreSQL')
+        levels = [int(level) for level in options['levels'].split(',')]
+        users = []
+        try:
+            shop_user, products = self.create_catalog(options['products'])
+            users = [shop_user] + [User.objects.create_user(
+                f'stress-buyer-{index}', f'stress-buyer-{index}@example.com', None, phone=0, is_active=True)
+                for index in range(max(levels))]
+            results = [self.run_level(level, users[1:level + 1], products, options) for level in levels]
+        finally:
+            # Удаление временных данных: заказы и магазин удаляются каскадом вместе с пользователями
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+            Category.objects.filter(name='stress-checkout').delete()
+        if any(result['oversold'] for result in results):
+            self.stderr.write('Обнаружена перепродажа остатков!')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(ujson.dumps(results, indent=2, ensure_ascii=False))
+
+    def create_catalog(self, count):
+        shop_user = User.objects.create_user('stress-shop', 'stress-shop@example.com', None, phone=0,
+                                             type='shop', is_active=True)
+        shop = Shop.objects.create(name='stress-shop', user=shop_user)
+        # id категорий задаются прайсами магазинов, последовательность таблицы не используется
+        category = Category.objects.create(
+            id=(Category.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1,
+            name='stress-checkout')
+        products = [ProductInfo.objects.create(
+            product=Product.objects.create(name=f'stress-product-{index}', category=category),
+            shop=shop, model='stress', quantity=0, price=100, recomended_price=100)
+            for index in range(count)]
+        return shop_user, products
+
+    def create_baskets(self, users, products, checkouts):
+        # Корзины готовятся заранее, чтобы замер включал только оформление.
+        # Порядок позиций в корзинах случайный: порядок блокировок задает place_order, а не корзина
+        orders = Order.objects.bulk_create(
+            [Order(user_id=user.id, status='temporary') for user in users for _ in range(checkouts)])
+        items = []
+        for order in orders:
+            for info in random.sample(products, len(products)):
+                items.append(OrderItem(order_id=order.id, product_info_id=info.id, quantity=1, price=info.price))
+        OrderItem.objects.bulk_create(items)
+        baskets = {}
+        for order in orders:
+            baskets.setdefault(order.user_id, []).append(order.id)
+        return baskets
+
+    def run_level(self, workers, users, products, options):
+        stock = max(1, int(workers * options['checkouts'] * options['stock_ratio']))
+        ProductInfo.objects.filter(id__in=[info.id for info in products]).update(quantity=stock)
+        baskets = self.create_baskets(users, products, options['checkouts'])
+        latencies = []
+        counters = {'placed': 0, 'out_of_stock': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker(user_id, order_ids):
+            try:
+                for order_id in order_ids:
+                    started = time.perf_counter()
+                    try:
+                        place_order(user_id, order_id)
+                        outcome = 'placed'
+                    except OutOfStockError:
+                        outcome = 'out_of_stock'
+                    except Exception as error:
+                        outcome = 'errors'
+                        self.stderr.write(f'Ошибка оформления: {error}')
+                    with lock:
+                        counters[outcome] += 1
+                        if outcome != 'errors':
+                            latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(worker, user_id, order_ids) for user_id, order_ids in baskets.items()]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        # Проверка: списано ровно столько, сколько продано в оформленных заказах, и не больше остатка
+        sold = {info.id: 0 for info in products}
+        for product_info_id, quantity in OrderItem.objects.filter(
+                order__user_id__in=baskets, order__status='new').values_list('product_info_id', 'quantity'):
+            sold[product_info_id] += quantity
+        remaining = dict(ProductInfo.objects.filter(id__in=sold).values_list('id', 'quantity'))
+        oversold = any(sold[info_id] > stock or remaining[info_id] != stock - sold[info_id] for info_id in sold)
+        Order.objects.filter(user_id__in=baskets).delete()
+
+        result = {'workers': workers, 'stock': stock, **counters, 'oversold': oversold,
+                  **summarize(latencies, counters['errors'], elapsed)}
+        result['tps'] = result.pop('rps')
+        self.stdout.write(f'{workers:>3} потоков: оформлено {counters["placed"]}, отказ по остатку '
+                          f'{counters["out_of_stock"]}, ошибок {counters["errors"]}, перепродажа: '
+                          f'{"ДА" if oversold else "нет"}, {result["tps"]} TPS, p50 {result["p50_ms"]} ms, '
+                          f'p99 {result["p99_ms"]} ms')
+        return result
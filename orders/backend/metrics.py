@@ -0,0 +1,249 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+# Метрики запросов к API по имени маршрута (backend/urls.py): число запросов и статусы ответов,
+# полное время ответа, число и время SQL-запросов, время сериализации ответа.
+# Хранятся в памяти процесса и отдаются эндпоинтом metrics в текстовом формате Prometheus;
+# при нескольких воркерах каждый процесс отдает свои значения
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestRecord:
+    # Измерения одного запроса; SQL-запросы учитываются обертками соединений (record_query)
+    def __init__(self, method):
+        self.method = method
+        self.view = None
+        self.status = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.latency = 0.0
+        self.started = time.perf_counter()
+
+    def start_serialization(self):
+        self.serialization_started = (time.perf_counter(), self.db_time)
+
+    def stop_serialization(self):
+        # Время сериализации без SQL-запросов, выполненных во время нее (они учтены в db_time)
+        started, db_time = self.serialization_started
+        self.serialization_time += time.perf_counter() - started - (self.db_time - db_time)
+
+
+current_record = ContextVar('metrics_record', default=None)
+
+
+@contextmanager
+def serialization():
+    # Учет времени сериализации ответов, которые собираются в представлении (fast_serializers)
+    record = current_record.get()
+    if record is None:
+        yield
+        return
+    record.start_serialization()
+    try:
+        yield
+    finally:
+        record.stop_serialization()
+
+
+def record_query(execute, sql, params, many, context):
+    # Обертка выполнения SQL (connection.execute_wrapper) для всех соединений.
+    # Запись текущего запроса берется из contextvar, поэтому учитываются и запросы
+    # async-представлений, которые ORM выполняет в потоке через sync_to_async
+    record = current_record.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.queries += 1
+        record.db_time += time.perf_counter() - started
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class ViewStats:
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+        self.budget_exceeded = 0
+
+
+def get_budget(view):
+    # Допустимое число SQL-запросов на запрос к маршруту из settings.QUERY_BUDGETS
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(view)
+
+
+class Registry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.views = {}
+        # Функции, получающие каждую завершенную запись (проверка бюджетов в тестах, backend/testing.py)
+        self.listeners = []
+
+    def observe(self, record):
+        budget = get_budget(record.view)
+        exceeded = budget is not None and record.queries > budget
+        if exceeded:
+            logger.warning('%s: %s SQL-запросов при бюджете %s', record.view, record.queries, budget)
+        with self.lock:
+            key = (record.view, record.method, record.status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+            stats = self.views.setdefault(record.view, ViewStats())
+            stats.latency.observe(record.latency)
+            stats.queries.observe(record.queries)
+            stats.db_time += record.db_time
+            stats.serialization_time += record.serialization_time
+            stats.budget_exceeded += exceeded
+        for listener in list(self.listeners):
+            listener(record)
+
+    def clear(self):
+        with self.lock:
+            self.responses.clear()
+            self.views.clear()
+
+    def render(self):
+        # Текстовый формат Prometheus (exposition format 0.0.4)
+        lines = []
+
+        def family(name, kind, description):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, view, value):
+            for bound, count in zip(value.buckets, value.counts):
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {value.count}')
+            lines.append(f'{name}_sum{{view="{view}"}} {value.sum}')
+            lines.append(f'{name}_count{{view="{view}"}} {value.count}')
+
+        with self.lock:
+            family('orders_http_responses_total', 'counter', 'Responses by route, method and status')
+            for (view, method, status), count in sorted(self.responses.items()):
+                lines.append(f'orders_http_responses_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            family('orders_http_request_duration_seconds', 'histogram', 'Total request latency')
+            for view, stats in sorted(self.views.items()):
+                histogram('orders_http_request_duration_seconds', view, stats.latency)
+            family('orders_db_queries_per_request', 'histogram', 'SQL queries per request')
+            for view, stats in sorted(self.views.items()):
+                histogram('orders_db_queries_per_request', view, stats.queries)
+            family('orders_db_query_seconds_total', 'counter', 'Time spent in SQL queries')
+            for view, stats in sorted(self.views.items()):
+                lines.append(f'orders_db_query_seconds_total{{view="{view}"}} {stats.db_time}')
+            family('orders_serialization_seconds_total', 'counter', 'Time spent serializing responses')
+            for view, stats in sorted(self.views.items()):
+                lines.append(f'orders_serialization_seconds_total{{view="{view}"}} {stats.serialization_time}')
+            family('orders_query_budget_exceeded_total', 'counter', 'Requests over the QUERY_BUDGETS limit')
+            for view, stats in sorted(self.views.items()):
+                lines.append(f'orders_query_budget_exceeded_total{{view="{view}"}} {stats.budget_exceeded}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    # Измерение запросов к API. Ставится первым в MIDDLEWARE, чтобы время ответа включало остальные middleware.
+    # Время сериализации - рендеринг ответа DRF (Response) и блоки serialization() в представлениях
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        record = RequestRecord(request.method)
+        token = current_record.set(record)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_record.reset(token)
+        return self.finish(request, response, record)
+
+    async def __acall__(self, request):
+        record = RequestRecord(request.method)
+        token = current_record.set(record)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_record.reset(token)
+        return self.finish(request, response, record)
+
+    def process_template_response(self, request, response):
+        # Response DRF рендерится после представления: начало здесь, окончание в post-render callback
+        record = current_record.get()
+        if record is not None:
+            record.start_serialization()
+            response.add_post_render_callback(lambda rendered: record.stop_serialization())
+        return response
+
+    def finish(self, request, response, record):
+        record.latency = time.perf_counter() - record.started
+        match = request.resolver_match
+        record.view = (match.url_name or match.view_name) if match is not None else 'unmatched'
+        record.status = response.status_code
+        registry.observe(record)
+        if settings.DEBUG:
+            response['Server-Timing'] = (f'db;dur={record.db_time * 1000:.1f};desc="{record.queries} queries", '
+                                         f'serialize;dur={record.serialization_time * 1000:.1f}, '
+                                         f'total;dur={record.latency * 1000:.1f}')
+        return response
+
+
+def metrics_view(request):
+    # Эндпоинт для Prometheus: доступен с адресов settings.INTERNAL_IPS
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Внешний ИД'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:08
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+from django.db.models import Max, Min
+
+from backend.search import search_vector_expression
+
+# Карточек в одном UPDATE при заполнении векторов
+BATCH_SIZE = 10000
+
+
+def fill_search_vectors(apps, schema_editor):
+    # Вектор для существующих карточек: импорт пересчитывает его только для измененных,
+    # и без заполнения остальные не находились бы поиском. UPDATE по диапазонам id
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    expression = search_vector_expression(apps.get_model('backend', 'Product'),
+                                          apps.get_model('backend', 'ProductParameter'))
+    bounds = ProductInfo.objects.aggregate(first=Min('id'), last=Max('id'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        ProductInfo.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(search_vector=expression)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_shop_feed_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='productinfo_search_gin'),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:12
+
+from django.db import migrations
+from django.db.models import Count, Max, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    # Перед созданием уникальных ограничений сливаются дубли, которые мог оставить
+    # импорт через get_or_create при параллельных загрузках
+    Parameter = apps.get_model('backend', 'Parameter')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    Product = apps.get_model('backend', 'Product')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+
+    for row in Parameter.objects.values('name').annotate(count=Count('id'), keep=Min('id')).filter(count__gt=1):
+        duplicates = Parameter.objects.filter(name=row['name']).exclude(id=row['keep'])
+        ProductParameter.objects.filter(parameter__in=duplicates).update(parameter_id=row['keep'])
+        duplicates.delete()
+
+    for row in Product.objects.values('name', 'category').annotate(count=Count('id'), keep=Min('id')).filter(count__gt=1):
+        duplicates = Product.objects.filter(name=row['name'], category=row['category']).exclude(id=row['keep'])
+        ProductInfo.objects.filter(product__in=duplicates).update(product_id=row['keep'])
+        duplicates.delete()
+
+    # Из карточек магазина с одинаковым external_id ключ остается у последней загруженной
+    for row in ProductInfo.objects.filter(external_id__isnull=False).values('shop', 'external_id').annotate(
+            count=Count('id'), keep=Max('id')).filter(count__gt=1):
+        ProductInfo.objects.filter(shop=row['shop'], external_id=row['external_id']).exclude(
+            id=row['keep']).update(external_id=None, is_active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_productinfo_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
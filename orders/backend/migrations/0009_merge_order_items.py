@@ -0,0 +1,24 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:13
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_order_items(apps, schema_editor):
+    # Повторные позиции одного товара в заказе сливаются в одну с суммарным количеством
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    for row in OrderItem.objects.values('order', 'product_info').annotate(
+            count=Count('id'), keep=Min('id'), total=Sum('quantity')).filter(count__gt=1):
+        OrderItem.objects.filter(id=row['keep']).update(quantity=row['total'])
+        OrderItem.objects.filter(order=row['order'], product_info=row['product_info']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_order_items, migrations.RunPython.noop),
+    ]
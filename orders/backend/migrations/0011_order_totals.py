@@ -0,0 +1,38 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:14
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    # Снимок цены для существующих позиций - текущая цена товара, сумма заказа - по снимкам
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    Order = apps.get_model('backend', 'Order')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    OrderItem.objects.update(price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id')).values('price')[:1]))
+    positions_sum = OrderItem.objects.filter(order_id=OuterRef('id')).values('order_id').annotate(
+        sum=Sum(F('quantity') * F('price'))).values('sum')
+    Order.objects.update(total=Coalesce(Subquery(positions_sum), Value(0),
+                                        output_field=DecimalField(max_digits=12, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_orderitem_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Цена'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
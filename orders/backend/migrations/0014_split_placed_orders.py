@@ -0,0 +1,50 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:31
+
+from django.db import migrations
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Заказов покупателей в одной пачке
+BATCH_SIZE = 1000
+
+
+def split_placed_orders(apps, schema_editor):
+    # Уже оформленные заказы разделяются на заказы по магазинам так же, как при оформлении:
+    # по заказу на каждый магазин позиций, позиции переносятся в них, у заказа покупателя остается сумма.
+    # Заказы обрабатываются пачками, на пачку - постоянное число запросов
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    placed = list(Order.objects.filter(parent__isnull=True, shop__isnull=True).exclude(
+        status='temporary').order_by('id').values_list('id', flat=True))
+    positions_sum = OrderItem.objects.filter(order_id=OuterRef('id')).values('order_id').annotate(
+        sum=Sum(F('quantity') * F('price'))).values('sum')
+    for start in range(0, len(placed), BATCH_SIZE):
+        parent_ids = placed[start:start + BATCH_SIZE]
+        parents = Order.objects.in_bulk(parent_ids)
+        pairs = OrderItem.objects.filter(order_id__in=parent_ids).values_list(
+            'order_id', 'product_info__shop_id').distinct().order_by('order_id', 'product_info__shop_id')
+        sub_orders = Order.objects.bulk_create([
+            Order(user_id=parents[order_id].user_id, status=parents[order_id].status, shop_id=shop_id,
+                  parent_id=order_id) for order_id, shop_id in pairs])
+        # created_at (auto_now_add) при создании получает текущее время, дата заказа переносится отдельно
+        for sub_order in sub_orders:
+            sub_order.created_at = parents[sub_order.parent_id].created_at
+        Order.objects.bulk_update(sub_orders, ['created_at'])
+        shop_id = Subquery(ProductInfo.objects.filter(id=OuterRef(OuterRef('product_info_id'))).values('shop_id')[:1])
+        OrderItem.objects.filter(order_id__in=parent_ids).update(order_id=Subquery(
+            Order.objects.filter(parent_id=OuterRef('order_id'), shop_id=shop_id).values('id')[:1]))
+        Order.objects.filter(parent_id__in=parent_ids).update(
+            total=Coalesce(Subquery(positions_sum), Value(0),
+                           output_field=DecimalField(max_digits=12, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_order_sub_orders'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_placed_orders, migrations.RunPython.noop),
+    ]
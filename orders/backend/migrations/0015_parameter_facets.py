@@ -0,0 +1,65 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def fill_facets(apps, schema_editor):
+    # Счетчики значений параметров по карточкам в продаже всех магазинов
+    ParameterFacet = apps.get_model('backend', 'ParameterFacet')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    rows = ProductParameter.objects.filter(product_info__is_active=True).values(
+        'parameter_id', 'value', shop_id=F('product_info__shop_id'),
+        category_id=F('product_info__product__category_id')).annotate(count=Count('id')).order_by()
+    ParameterFacet.objects.bulk_create([ParameterFacet(**row) for row in rows.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_split_placed_orders'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Число карточек')),
+            ],
+            options={
+                'verbose_name': 'Счетчик значения параметра',
+                'verbose_name_plural': 'Счетчики значений параметров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value', 'product_info'], name='productparameter_value_idx'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddField(
+            model_name='parameterfacet',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddIndex(
+            model_name='parameterfacet',
+            index=models.Index(fields=['category', 'parameter'], name='parameterfacet_category_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='parameterfacet',
+            constraint=models.UniqueConstraint(fields=('shop', 'category', 'parameter', 'value'), name='parameterfacet_uniq'),
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.3 on 2026-10-18 18:42
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+from django.db.models import Aggregate, JSONField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+class JSONBObjectAgg(Aggregate):
+    function = 'JSONB_OBJECT_AGG'
+    output_field = JSONField()
+
+
+def fill_attributes(apps, schema_editor):
+    # Копия текущих параметров карточек, как attributes.update_attributes
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    attributes = ProductParameter.objects.filter(product_info_id=OuterRef('id')).values('product_info_id').annotate(
+        attributes=JSONBObjectAgg('parameter__name', 'value')).values('attributes')[:1]
+    ProductInfo.objects.update(attributes=Coalesce(Subquery(attributes), Value({}, output_field=JSONField()),
+                                                   output_field=JSONField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_parameter_facets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='attributes',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Параметры'),
+        ),
+        migrations.RunPython(fill_attributes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['attributes'], name='productinfo_attributes_gin', opclasses=['jsonb_path_ops']),
+        ),
+    ]
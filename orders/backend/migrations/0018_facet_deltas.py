@@ -0,0 +1,69 @@
+# Generated by Django 5.1.15 on 2026-10-18 19:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def rebuild_facets(apps, schema_editor):
+    # Учет карточек в продаже в facet_state и пересчет счетчиков по нему, дальше счетчики
+    # изменяются приращениями (backend/facets.py)
+    tables = {name: apps.get_model('backend', name)._meta.db_table
+              for name in ('ProductInfo', 'Product', 'Parameter', 'ParameterFacet', 'ParameterPairFacet')}
+    schema_editor.execute(
+        'UPDATE {ProductInfo} AS product_info SET facet_state = jsonb_build_object('
+        "'category', product.category_id, 'parameters', COALESCE(("
+        '  SELECT jsonb_object_agg(parameter.id::text, attribute.value) '
+        '  FROM jsonb_each_text(product_info.attributes) AS attribute '
+        '  JOIN {Parameter} AS parameter ON parameter.name = attribute.key'
+        "), '{{}}'::jsonb)) "
+        'FROM {Product} AS product WHERE product.id = product_info.product_id AND product_info.is_active'.format(**tables))
+    schema_editor.execute('DELETE FROM {ParameterFacet}'.format(**tables))
+    schema_editor.execute(
+        'INSERT INTO {ParameterFacet} (shop_id, category_id, parameter_id, value, count) '
+        "SELECT shop_id, (facet_state->>'category')::bigint, parameter.key::bigint, parameter.value, COUNT(*) "
+        "FROM {ProductInfo}, jsonb_each_text(facet_state->'parameters') AS parameter "
+        'WHERE facet_state IS NOT NULL GROUP BY 1, 2, 3, 4'.format(**tables))
+    schema_editor.execute(
+        'INSERT INTO {ParameterPairFacet} '
+        '(shop_id, category_id, filter_parameter_id, filter_value, parameter_id, value, count) '
+        "SELECT shop_id, (facet_state->>'category')::bigint, filter_parameter.key::bigint, filter_parameter.value, "
+        'parameter.key::bigint, parameter.value, COUNT(*) '
+        "FROM {ProductInfo}, jsonb_each_text(facet_state->'parameters') AS filter_parameter, "
+        "jsonb_each_text(facet_state->'parameters') AS parameter "
+        'WHERE facet_state IS NOT NULL AND filter_parameter.key <> parameter.key '
+        'GROUP BY 1, 2, 3, 4, 5, 6'.format(**tables))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_order_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='facet_state',
+            field=models.JSONField(editable=False, null=True, verbose_name='Учтено в счетчиках'),
+        ),
+        migrations.CreateModel(
+            name='ParameterPairFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filter_value', models.CharField(max_length=100, verbose_name='Значение фильтра')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Число карточек')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_facets', to='backend.category', verbose_name='Категория')),
+                ('filter_parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='filter_pair_facets', to='backend.parameter', verbose_name='Параметр фильтра')),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_facets', to='backend.parameter', verbose_name='Параметр')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_facets', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Счетчик значения параметра при фильтре',
+                'verbose_name_plural': 'Счетчики значений параметров при фильтре',
+                'indexes': [models.Index(fields=['filter_parameter', 'filter_value', 'category'], name='pairfacet_filter_idx')],
+                'constraints': [models.UniqueConstraint(fields=('shop', 'category', 'filter_parameter', 'filter_value', 'parameter', 'value'), name='parameterpairfacet_uniq')],
+            },
+        ),
+        migrations.RunPython(rebuild_facets, migrations.RunPython.noop),
+    ]
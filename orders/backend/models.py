@@ -1,4 +1,8 @@
 from django.db import models
+from django.utils import timezone
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.base_user import BaseUserManager
 from django_rest_passwordreset.tokens import get_token_generator
@@ -101,6 +105,10 @@ class Shop(models.Model):
     url =  models.URLField(verbose_name='Ссылка', null=True, blank=True)
     user = models.OneToOneField(User, verbose_name='Ассоциированный пользователь', on_delete=models.CASCADE)
     status = models.CharField(verbose_name='Прием заказов', choices=ORDERS_CHOICES, max_length=20)
+    # Данные последнего успешного импорта прайса по ссылке url, для условной загрузки и пропуска неизменного прайса
+    feed_etag = models.CharField(verbose_name='ETag прайса', max_length=255, blank=True)
+    feed_last_modified = models.CharField(verbose_name='Last-Modified прайса', max_length=64, blank=True)
+    feed_hash = models.CharField(verbose_name='SHA-256 прайса', max_length=64, blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -123,12 +131,17 @@ class Category(models.Model):
 
 
 class Product(models.Model):
-    name = models.CharField(max_length=40, verbose_name='Название')
+    # Названия в прайсах длиннее 40 символов ("Смартфон Apple iPhone XS Max 512GB (золотистый)" - 47)
+    name = models.CharField(max_length=255, verbose_name='Название')
     category = models.ForeignKey(Category, verbose_name='Категория', related_name='products', blank=True, on_delete=models.CASCADE)
 
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        constraints = [
+            # Ключ товара при импорте прайса, позволяет создавать товары через upsert
+            models.UniqueConstraint(fields=['name', 'category'], name='product_name_category_uniq'),
+        ]
 
     def __str__(self):
         return self.name
@@ -136,23 +149,53 @@ class Product(models.Model):
 
 class ProductInfo(models.Model):
     product = models.ForeignKey(Product, verbose_name='Товар', related_name='product_info', blank=True, on_delete=models.CASCADE)
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД', null=True, blank=True)
     model = models.CharField(max_length=100, verbose_name='Модель')
     shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='product_info', blank=True, on_delete=models.CASCADE)
     description = models.TextField(max_length=5000, verbose_name='Информация о товаре')
     quantity = models.IntegerField(verbose_name='Количество')
     price = models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')
     recomended_price = models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Рекомедованная розничная цена')
+    is_active = models.BooleanField(verbose_name='В продаже', default=True)
+    # Поисковый вектор (название, модель, параметры, описание), пересчитывается импортом и сигналами, см. search.py
+    search_vector = SearchVectorField(verbose_name='Поисковый вектор', null=True, editable=False)
+    # Копия параметров карточки {название: значение} для вывода и фильтров, см. attributes.py
+    attributes = models.JSONField(verbose_name='Параметры', default=dict, editable=False)
+    # Категория и параметры, с которыми карточка учтена в счетчиках фасетов (None - не учтена), см. facets.py
+    facet_state = models.JSONField(verbose_name='Учтено в счетчиках', null=True, editable=False)
 
     class Meta:
         verbose_name = 'Карточка информации о товаре'
         verbose_name_plural = 'Карточки информации о товаре'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='productinfo_search_gin'),
+            # Отбор по содержимому attributes @> {"Цвет": "красный"}
+            GinIndex(fields=['attributes'], opclasses=['jsonb_path_ops'], name='productinfo_attributes_gin'),
+            models.Index(fields=['shop', 'product'], name='productinfo_shop_product_idx'),
+            # Список товаров в продаже с сортировкой и курсорной пагинацией по (price, id)
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True), name='productinfo_active_price_idx'),
+        ]
+        constraints = [
+            # Ключ карточки в прайсе магазина для инкрементальной синхронизации и upsert
+            models.UniqueConstraint(fields=['shop', 'external_id'], name='productinfo_shop_external_id_uniq'),
+        ]
+
+    # Поля, которые ведутся сигналами по другим таблицам: сохранение загруженной ранее карточки
+    # (админка) не должно записывать поверх них устаревшие значения
+    MAINTAINED_FIELDS = ('attributes', 'facet_state')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.MAINTAINED_FIELDS]
+        return super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
 class Parameter(models.Model):
-    name = models.CharField(max_length=40, verbose_name='Пользовательский параметр')
+    name = models.CharField(max_length=40, verbose_name='Пользовательский параметр', unique=True)
     
     class Meta:
         verbose_name = 'Имя доп. параметра'
@@ -170,11 +213,83 @@ class ProductParameter(models.Model):
     class Meta:
         verbose_name = 'Дополнительный параметр'
         verbose_name_plural = 'Дополнительные параметры'
+        indexes = [
+            # Подсчет и фильтр карточек по значению параметра без чтения таблицы
+            models.Index(fields=['parameter', 'value', 'product_info'], name='productparameter_value_idx'),
+        ]
 
     def __str__(self):
         return f'{self.parameter}: {self.value}'
 
 
+class ParameterFacet(models.Model):
+    # Число карточек в продаже с данным значением параметра в категории магазина.
+    # Счетчики изменяются приращениями при импорте и правке карточек (backend/facets.py)
+    # и суммируются для products?facets=1 вместо группировки по ProductParameter
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='facets', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='facets', on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facets', on_delete=models.CASCADE)
+    value = models.CharField(verbose_name='Значение', max_length=100)
+    count = models.PositiveIntegerField(verbose_name='Число карточек', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчик значения параметра'
+        verbose_name_plural = 'Счетчики значений параметров'
+        indexes = [
+            models.Index(fields=['category', 'parameter'], name='parameterfacet_category_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'category', 'parameter', 'value'], name='parameterfacet_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.parameter}: {self.value} ({self.count})'
+
+
+class ParameterPairFacet(models.Model):
+    # Число карточек в продаже с данным значением параметра среди карточек с другим заданным значением
+    # (filter_parameter: filter_value) в категории магазина: фасеты списка с фильтром по одному параметру
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='pair_facets', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='pair_facets', on_delete=models.CASCADE)
+    filter_parameter = models.ForeignKey(Parameter, verbose_name='Параметр фильтра', related_name='filter_pair_facets', on_delete=models.CASCADE)
+    filter_value = models.CharField(verbose_name='Значение фильтра', max_length=100)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='pair_facets', on_delete=models.CASCADE)
+    value = models.CharField(verbose_name='Значение', max_length=100)
+    count = models.PositiveIntegerField(verbose_name='Число карточек', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчик значения параметра при фильтре'
+        verbose_name_plural = 'Счетчики значений параметров при фильтре'
+        indexes = [
+            models.Index(fields=['filter_parameter', 'filter_value', 'category'], name='pairfacet_filter_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'category', 'filter_parameter', 'filter_value', 'parameter', 'value'],
+                                    name='parameterpairfacet_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.filter_parameter}: {self.filter_value} / {self.parameter}: {self.value} ({self.count})'
+
+
+class OrderManager(models.Manager):
+
+    def recalculate_totals(self, order_ids):
+        # Пересчет сохраненной суммы заказов одним UPDATE по снимкам цен позиций.
+        # Вызывается в той же транзакции, что и изменение позиций (корзина, оформление заказа, админка)
+        positions_sum = OrderItem.objects.filter(order_id=models.OuterRef('id')).values('order_id').annotate(
+            sum=models.Sum(models.F('quantity') * models.F('price'))).values('sum')
+        return self.filter(id__in=order_ids).update(total=Coalesce(
+            models.Subquery(positions_sum), models.Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
+    def recalculate_parent_totals(self, order_ids):
+        # Сумма оформленного заказа - сумма его заказов по магазинам (позиции хранятся только в них)
+        sub_orders_sum = self.filter(parent_id=models.OuterRef('id')).values('parent_id').annotate(
+            sum=models.Sum('total')).values('sum')
+        return self.filter(id__in=order_ids).update(total=Coalesce(
+            models.Subquery(sub_orders_sum), models.Value(0), output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('temporary', 'Подбор товаров'),
@@ -189,10 +304,27 @@ class Order(models.Model):
     user = models.ForeignKey(User, verbose_name='Покупатель', related_name='orders', blank=True, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время создания')
     status = models.CharField(verbose_name='Статус', choices=STATUS_CHOICES, max_length=20)
+    # Сумма заказа по снимкам цен позиций, поддерживается OrderManager.recalculate_totals
+    total = models.DecimalField(verbose_name='Сумма заказа', max_digits=12, decimal_places=2, default=0)
+    # При оформлении корзина разделяется на заказы по магазинам: у них заполнены shop и parent,
+    # позиции переносятся в них, а сама корзина становится заказом покупателя без позиций
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='orders', null=True, blank=True, on_delete=models.CASCADE)
+    parent = models.ForeignKey('self', verbose_name='Заказ покупателя', related_name='sub_orders', null=True, blank=True, on_delete=models.CASCADE)
+
+    objects = OrderManager()
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+            # Корзина пользователя: частичный индекс только по заказам в статусе temporary
+            models.Index(fields=['user'], condition=models.Q(status='temporary'), name='order_basket_idx'),
+            # Заказы пользователя с курсорной пагинацией по (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Заказы магазина (partner/orders) с курсорной пагинацией по (created_at, id)
+            models.Index(fields=['shop', '-created_at', '-id'], name='order_shop_created_idx'),
+        ]
 
     def __str__(self):
         return f'Заказ {self.id} пользователя {self.user}'
@@ -202,10 +334,118 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, verbose_name='Заказ', related_name='positions', blank=True, on_delete=models.CASCADE)
     product_info = models.ForeignKey(ProductInfo, verbose_name='Карточка товара', related_name='orders', blank=True, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    # Цена товара на момент добавления в корзину (обновляется при оформлении заказа)
+    price = models.DecimalField(verbose_name='Цена', max_digits=10, decimal_places=2, default=0)
 
     class Meta:
         verbose_name = 'Позиция заказа'
         verbose_name_plural = 'Позиции заказов'
+        constraints = [
+            # Товар входит в заказ одной позицией, корзина редактируется через upsert по этой паре
+            models.UniqueConstraint(fields=['order', 'product_info'], name='orderitem_order_product_info_uniq'),
+        ]
+
+    def __str__(self):
+        return f'Позиция {self.product_info} заказа {self.order}'
+
+
+class OrderArchive(models.Model):
+    # Закрытые заказы старше срока хранения в рабочих таблицах (archive.py, команда archive_orders):
+    # заказ покупателя переносится вместе с заказами магазинов и позициями, id сохраняются
+    user = models.ForeignKey(User, verbose_name='Покупатель', related_name='archived_orders', blank=True, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(verbose_name='Дата и время создания')
+    status = models.CharField(verbose_name='Статус', choices=Order.STATUS_CHOICES, max_length=20)
+    total = models.DecimalField(verbose_name='Сумма заказа', max_digits=12, decimal_places=2, default=0)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='archived_orders', null=True, blank=True, on_delete=models.CASCADE)
+    parent = models.ForeignKey('self', verbose_name='Заказ покупателя', related_name='sub_orders', null=True, blank=True, on_delete=models.CASCADE)
+    archived_at = models.DateTimeField(verbose_name='Дата и время переноса в архив', auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Архивный заказ'
+        verbose_name_plural = 'Архив заказов'
+        indexes = [
+            # История заказов пользователя и магазина за период с курсорной пагинацией по (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='orderarchive_user_created_idx'),
+            models.Index(fields=['shop', '-created_at', '-id'], name='orderarchive_shop_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Архивный заказ {self.id} пользователя {self.user}'
+
+
+class OrderItemArchive(models.Model):
+    order = models.ForeignKey(OrderArchive, verbose_name='Заказ', related_name='positions', blank=True, on_delete=models.CASCADE)
+    product_info = models.ForeignKey(ProductInfo, verbose_name='Карточка товара', related_name='archived_orders', blank=True, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.DecimalField(verbose_name='Цена', max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Позиция архивного заказа'
+        verbose_name_plural = 'Позиции архивных заказов'
+
+    def __str__(self):
+        return f'Позиция {self.product_info} архивного заказа {self.order_id}'
+
+
+class ImportJob(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Завершен'),
+        ('skipped', 'Пропущен: прайс не изменился'),
+        ('failed', 'Ошибка'),
+    )
+
+    user = models.ForeignKey(User, verbose_name='Магазин (пользователь)', related_name='import_jobs', on_delete=models.CASCADE)
+    url = models.URLField(verbose_name='Ссылка на прайс')
+    mode = models.CharField(verbose_name='Режим импорта', max_length=10, default='sync')
+    status = models.CharField(verbose_name='Статус', choices=STATUS_CHOICES, max_length=10, default='queued')
+    processed = models.PositiveIntegerField(verbose_name='Обработано строк', default=0)
+    stats = models.JSONField(verbose_name='Статистика импорта', null=True, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время создания')
+    started_at = models.DateTimeField(verbose_name='Начало выполнения', null=True, blank=True)
+    finished_at = models.DateTimeField(verbose_name='Окончание выполнения', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задание импорта'
+        verbose_name_plural = 'Задания импорта'
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f'Импорт {self.id} ({self.get_status_display()}) пользователя {self.user}'
+
+
+class OutboxEmail(models.Model):
+    # Исходящее письмо. Записывается в транзакции с событием (регистрация, заказ),
+    # отправляется отдельным процессом: python manage.py send_outbox
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Не отправлено'),
+    )
+
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст', blank=True)
+    from_email = models.CharField(verbose_name='Отправитель', max_length=255, blank=True)
+    to = models.EmailField(verbose_name='Получатель')
+    status = models.CharField(verbose_name='Статус', choices=STATUS_CHOICES, max_length=10, default='pending')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток отправки', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', default=timezone.now)
+    error = models.TextField(verbose_name='Последняя ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время создания')
+    sent_at = models.DateTimeField(verbose_name='Дата и время отправки', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
+        indexes = [
+            # Выборка очереди отправки: только письма в статусе pending
+            models.Index(fields=['next_attempt_at', 'id'], condition=models.Q(status='pending'),
+                         name='outbox_pending_idx'),
+        ]
 
     def __str__(self):
-        return f'Позиция {self.product_info} заказа {self.order}'
\ No newline at end of file
+        return f'{self.subject} -> {self.to} ({self.get_status_display()})'
@@ -0,0 +1,63 @@
+import datetime
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.utils import timezone
+
+from backend.models import OutboxEmail
+
+# Повторные попытки отправки: пауза BACKOFF_BASE * 2^(попытка - 1) секунд, но не больше BACKOFF_MAX,
+# после MAX_ATTEMPTS неудачных попыток письмо получает статус failed
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+
+
+def queue_email(subject, body, to, from_email=None):
+    # Постановка письма в очередь. Строка пишется в текущую транзакцию,
+    # поэтому при ее откате письмо тоже не уйдет
+    return OutboxEmail.objects.create(subject=subject, body=body, to=to,
+                                      from_email=from_email or settings.EMAIL_HOST_USER)
+
+
+def backoff(attempts):
+    return datetime.timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+def send_batch(connection, batch_size=100, max_attempts=MAX_ATTEMPTS):
+    # Отправка очередной пачки писем через открытое SMTP-соединение connection.
+    # Строки блокируются select_for_update(skip_locked), поэтому несколько отправителей
+    # не возьмут одно письмо дважды. При обрыве соединения пачка прерывается, оставшиеся письма
+    # ждут следующей пачки без лишней попытки. Возвращает (отправлено, ошибок, соединение оборвано)
+    sent = failed = 0
+    disconnected = False
+    with transaction.atomic():
+        emails = list(OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            status='pending', next_attempt_at__lte=timezone.now()).order_by('next_attempt_at', 'id')[:batch_size])
+        for email in emails:
+            message = EmailMultiAlternatives(email.subject, email.body, email.from_email, [email.to],
+                                             connection=connection)
+            try:
+                message.send()
+            except Exception as error:
+                failed += 1
+                email.attempts += 1
+                email.error = str(error)
+                if email.attempts >= max_attempts:
+                    email.status = 'failed'
+                else:
+                    email.next_attempt_at = timezone.now() + backoff(email.attempts)
+                # Ошибки ответа сервера относятся к письму, остальные (обрыв, сокет) - к соединению
+                if isinstance(error, smtplib.SMTPServerDisconnected) or not isinstance(error, smtplib.SMTPException):
+                    disconnected = True
+                    break
+            else:
+                sent += 1
+                email.attempts += 1
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+                email.error = ''
+        OutboxEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'error', 'sent_at'])
+    return sent, failed, disconnected
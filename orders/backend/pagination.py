@@ -0,0 +1,164 @@
+import base64
+import datetime
+from decimal import InvalidOperation
+from functools import reduce
+
+import ujson
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # Курсорная (keyset) пагинация по уникальному набору полей сортировки.
+    # Курсор хранит значения полей сортировки последней строки страницы, следующая страница
+    # выбирается условием (f1, f2, ...) > (v1, v2, ...) по индексу, поэтому глубокие страницы
+    # стоят столько же, сколько первая. Сортировка берется из queryset (OrderingFilter, поиск),
+    # иначе используется ordering класса; id всегда добавляется последним для уникальности.
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE or 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неправильный курсор'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            page_size = self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by)
+        if not ordering or not all(isinstance(field, str) for field in ordering):
+            ordering = list(self.ordering)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def encode_cursor(self, values):
+        def default(value):
+            if isinstance(value, (datetime.datetime, datetime.date)):
+                return value.isoformat()
+            return str(value)
+        data = ujson.dumps([value if isinstance(value, (int, float, str)) or value is None else default(value)
+                            for value in values])
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, cursor, length):
+        try:
+            values = ujson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != length:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    @staticmethod
+    def get_field(model, name):
+        # Поле модели по пути сортировки ('price', 'product__name'), None - не поле (аннотация)
+        field = None
+        for part in name.lstrip('-').split('__'):
+            if model is None:
+                return None
+            try:
+                field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return None
+            model = field.related_model
+        return field
+
+    def typed_values(self, model, ordering, values):
+        # Значения курсора приводятся к типам полей сортировки: курсор приходит от клиента
+        # и может быть подделан ([{"a": 1}, 1], ["abc", 1])
+        result = []
+        for field_name, value in zip(ordering, values):
+            field = self.get_field(model, field_name)
+            if field is not None:
+                value = field.to_python(value)
+            if value is None or isinstance(value, (dict, list)):
+                raise ValidationError(self.invalid_cursor_message)
+            result.append(value)
+        return result
+
+    def keyset_filter(self, ordering, values):
+        # (a, b, c) > (x, y, z) с учетом направления каждого поля:
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        conditions = []
+        for index, field in enumerate(ordering):
+            equal = {name.lstrip('-'): value for name, value in zip(ordering[:index], values)}
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(Q(**equal, **{f'{field.lstrip("-")}__{lookup}': values[index]}))
+        return reduce(lambda left, right: left | right, conditions)
+
+    @staticmethod
+    def get_value(obj, field):
+        # obj - объект модели или строка values()
+        if isinstance(obj, dict):
+            return obj[field.lstrip('-')]
+        for attribute in field.lstrip('-').split('__'):
+            obj = getattr(obj, attribute)
+        return obj
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering_fields = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering_fields)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.decode_cursor(cursor, len(self.ordering_fields))
+            try:
+                queryset = queryset.filter(self.keyset_filter(
+                    self.ordering_fields, self.typed_values(queryset.model, self.ordering_fields, values)))
+            except (ValidationError, TypeError, ValueError, InvalidOperation):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, page):
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        # Вариант для async-представлений: страница читается асинхронной итерацией queryset
+        return self.set_page([obj async for obj in self.get_page_queryset(queryset, request)])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        cursor = self.encode_cursor([self.get_value(self.page[-1], field) for field in self.ordering_fields])
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductPagination(KeysetPagination):
+    ordering = ('price', 'id')
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
+
+
+class CategoryPagination(KeysetPagination):
+    ordering = ('id',)
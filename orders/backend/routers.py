@@ -0,0 +1,114 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Чтение с реплик PostgreSQL (settings.DATABASE_REPLICAS), запись - в основную БД.
+# На реплики идут только чтения безопасных запросов к API (GET, HEAD, OPTIONS), это решает
+# PrimaryStickinessMiddleware; команды, воркер импорта и запросы с изменениями работают с основной БД.
+# После успешного изменяющего запроса клиент на REPLICA_STICKY_SECONDS секунд читает из основной БД,
+# чтобы не увидеть корзину или заказ до того, как реплика догонит основную БД
+
+# Модели, которые всегда читаются из основной БД: токен, выданный при входе, нужен сразу
+PRIMARY_MODELS = {'authtoken.token'}
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if (not replicas or not replica_reads.get() or model._meta.label_lower in PRIMARY_MODELS
+                # Чтения внутри транзакции видят ее же изменения
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной БД, связи между объектами из разных соединений допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит репликацией с основной БД
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def client_key(request):
+    # Клиент для закрепления за основной БД: токен из заголовка Authorization или сессия
+    identity = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not identity:
+        return None
+    return 'db-primary:' + hashlib.sha256(identity.encode()).hexdigest()
+
+
+def sticky_cache():
+    # Кэш меток закрепления (settings.REPLICA_STICKY_CACHE), общий для процессов сервера
+    return caches[getattr(settings, 'REPLICA_STICKY_CACHE', 'catalog')]
+
+
+class PrimaryStickinessMiddleware:
+    # Выбор БД для чтения на время запроса. Метка закрепления хранится в кэше REPLICA_STICKY_CACHE:
+    # следующий запрос клиента может прийти в другой процесс сервера, поэтому кэш общий
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        key = client_key(request)
+        token = replica_reads.set(self.use_replicas(request, key))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        self.stick(request, response, key)
+        return response
+
+    async def __acall__(self, request):
+        key = client_key(request)
+        token = replica_reads.set(await self.ause_replicas(request, key))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        await self.astick(request, response, key)
+        return response
+
+    def use_replicas(self, request, key):
+        if not settings.DATABASE_REPLICAS or request.method not in self.safe_methods:
+            return False
+        return key is None or sticky_cache().get(key) is None
+
+    async def ause_replicas(self, request, key):
+        if not settings.DATABASE_REPLICAS or request.method not in self.safe_methods:
+            return False
+        return key is None or await sticky_cache().aget(key) is None
+
+    def must_stick(self, request, response, key):
+        return (settings.DATABASE_REPLICAS and key is not None and request.method not in self.safe_methods
+                and response.status_code < 400)
+
+    def stick(self, request, response, key):
+        if self.must_stick(request, response, key):
+            sticky_cache().set(key, 1, settings.REPLICA_STICKY_SECONDS)
+
+    async def astick(self, request, response, key):
+        if self.must_stick(request, response, key):
+            await sticky_cache().aset(key, 1, settings.REPLICA_STICKY_SECONDS)
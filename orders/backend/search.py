@@ -0,0 +1,40 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import DecimalField, F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce
+
+from backend.models import Product, ProductInfo, ProductParameter
+
+# Конфигурация полнотекстового поиска PostgreSQL (словарь, стемминг)
+SEARCH_CONFIG = 'russian'
+
+
+def search_vector_expression(product_model=Product, parameter_model=ProductParameter):
+    # Вектор карточки товара: название товара и модель (вес A), значения параметров (B), описание (C).
+    # Название и параметры берутся коррелированными подзапросами, поэтому вектор пересчитывается
+    # одним UPDATE без выборки карточек в Python. Модели передаются из миграций (apps.get_model)
+    name = Subquery(product_model.objects.filter(id=OuterRef('product_id')).values('name')[:1])
+    parameters = Subquery(
+        parameter_model.objects.filter(product_info_id=OuterRef('id')).values('product_info_id').annotate(
+            values=StringAgg('value', delimiter=' ')).values('values')[:1])
+    return (SearchVector(Coalesce(name, Value(''), output_field=TextField()), weight='A', config=SEARCH_CONFIG)
+            + SearchVector('model', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(Coalesce(parameters, Value(''), output_field=TextField()), weight='B', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='C', config=SEARCH_CONFIG))
+
+
+def update_search_vectors(product_info_ids):
+    # Пересчет поискового вектора только для переданных карточек
+    if not product_info_ids:
+        return 0
+    return ProductInfo.objects.filter(id__in=product_info_ids).update(search_vector=search_vector_expression())
+
+
+def search_products(queryset, text):
+    # Отбор карточек по поисковой строке (синтаксис websearch: слова, "фразы", -исключения, or)
+    # с сортировкой по релевантности.
+    # Ранг приводится к numeric, чтобы его значение точно передавалось через курсор пагинации
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), DecimalField(max_digits=12, decimal_places=8))).order_by(
+        '-rank', 'id')
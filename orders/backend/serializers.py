@@ -1,21 +1,23 @@
 from rest_framework import serializers
-from models import User, Shop, Category, Product, ProductInfo, ProductParameter, Order, OrderItem
+
+from backend.attributes import parameter_strings
+from backend.models import User, Shop, Category, Product, ProductInfo, ProductParameter, Order, OrderItem, ImportJob
 
 class UserSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = User
         fields = ('id', 'adress', 'phone')
-        read_only_fields = ('id')
+        read_only_fields = ('id',)
 
 
 class ShopSerializer(serializers.ModelSerializer):
-    user = UserSerializer(read_only=True, many=True)
+    user = UserSerializer(read_only=True)
 
     class Meta:
         model = Shop
         fields = ('id', 'name', 'url', 'status', 'user')
-        read_only_fields = ('id')
+        read_only_fields = ('id',)
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -23,27 +25,30 @@ class CategorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Category
-        fields = ('id', 'name', 'shop')
-        read_only_fields = ('id')
+        fields = ('id', 'name', 'shops')
+        read_only_fields = ('id',)
 
 
 class ProductSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True, many=True)
+    category = CategorySerializer(read_only=True)
 
     class Meta:
         model = Product
         fields = ('id', 'name', 'category')
-        read_only_fields = ('id')
+        read_only_fields = ('id',)
 
 
 class ProductInfoSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True, many=True)
-    parameters = serializers.StringRelatedField(read_only=True, many=True)
+    product = ProductSerializer(read_only=True)
+    parameters = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductInfo
-        fields = ('id', 'product', 'model', 'shop', 'name', 'description', 'quantity', 'price', 'recomended_price')
-        read_only_fields = ('id')
+        fields = ('id', 'product', 'model', 'shop', 'description', 'quantity', 'price', 'recomended_price', 'parameters')
+        read_only_fields = ('id',)
+
+    def get_parameters(self, obj):
+        return parameter_strings(obj.attributes)
 
 
 class ProductParameterSerializer(serializers.ModelSerializer):
@@ -55,22 +60,40 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         read_only_fields = ('id')
         
 
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_info = ProductInfoSerializer(read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'product_info', 'quantity', 'price')
+        read_only_fields = ('id',)
+
+
 class OrderSerializer(serializers.ModelSerializer):
-    user = serializers.StringRelatedField(read_only=True, many=True)
-    cost = serializers.IntegerField()
+    user = serializers.StringRelatedField(read_only=True)
+    positions = OrderItemSerializer(read_only=True, many=True)
+    # Сумма хранится в заказе (Order.total), а не считается агрегатом при каждом запросе
+    cost = serializers.DecimalField(source='total', max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
-        fields = ('id', 'user', 'created_at', 'status')
-        read_only_fields = ('id')
+        fields = ('id', 'user', 'created_at', 'status', 'shop', 'positions', 'cost')
+        read_only_fields = ('id',)
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    order = OrderSerializer(read_only=True, many=True)
-    product_info = ProductInfoSerializer(read_only=True, many=True)
-    
+class CustomerOrderSerializer(OrderSerializer):
+    # Оформленный заказ покупателя: позиции выводятся в составе заказов по магазинам
+    sub_orders = OrderSerializer(read_only=True, many=True)
+
     class Meta:
-        model = OrderItem
-        fields = ('id', 'order', 'product_info', 'quantity')
-        read_only_fields = ('id')
-        extra_kwargs = {'order': {'write_only': True}}
\ No newline at end of file
+        model = Order
+        fields = ('id', 'user', 'created_at', 'status', 'sub_orders', 'cost')
+        read_only_fields = ('id',)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'url', 'mode', 'status', 'processed', 'stats', 'error', 'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
\ No newline at end of file
@@ -1,47 +1,164 @@
 from typing import Type
-from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver, Signal
 from django_rest_passwordreset.signals import reset_password_token_created
 
-from backend.models import ConfirmEmailToken, User
+from rest_framework.authtoken.models import Token
+
+from backend.attributes import update_attributes
+from backend.authentication import token_cache
+from backend.cache import CATALOG, invalidate, shop_namespace
+from backend.facets import update_facets
+from backend.models import ConfirmEmailToken, User, Shop, Category, Product, ProductInfo, Parameter, ProductParameter
+from backend.outbox import queue_email
+from backend.search import update_search_vectors
 
 new_user_registered = Signal()
 new_order = Signal()
 
+# Письма не отправляются в запросе: они ставятся в очередь OutboxEmail в той же транзакции,
+# что и событие, и отправляются командой send_outbox
+
 
 @receiver(reset_password_token_created)
 def password_reset_token_created(sender, instance, reset_password_token, **kwargs):
-    msg = EmailMultiAlternatives(
+    queue_email(
         f"Password Reset Token for {reset_password_token.user}",
         reset_password_token.key,
-        settings.EMAIL_HOST_USER,
-        [reset_password_token.user.email]
+        reset_password_token.user.email
     )
-    msg.send()
 
 
 @receiver(post_save, sender=User)
 def new_user_registered_signal(sender: Type[User], instance: User, created: bool, **kwargs):
     if created and not instance.is_active:
         token, _ = ConfirmEmailToken.objects.get_or_create(user_id=instance.pk)
-        msg = EmailMultiAlternatives(
+        queue_email(
             f"Password Reset Token for {instance.email}",
             token.key,
-            settings.EMAIL_HOST_USER,
-            [instance.email]
+            instance.email
         )
-        msg.send()
 
 
 @receiver(new_order)
 def new_order_signal(user_id, **kwargs):
     user = User.objects.get(id=user_id)
-    msg = EmailMultiAlternatives(
+    queue_email(
         f"Обновление статуса заказа",
         'Заказ сформирован',
-        settings.EMAIL_HOST_USER,
-        [user.email]
+        user.email
     )
-    msg.send()
\ No newline at end of file
+
+
+# Пересчет поискового вектора при правке каталога вне импорта (админка, shell).
+# Импорт пишет через bulk-операции без сигналов и пересчитывает векторы сам, см. importer.py
+@receiver(post_save, sender=ProductInfo)
+def product_info_search_update(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= {'quantity', 'is_active', 'search_vector'}:
+        update_search_vectors([instance.id])
+
+
+@receiver(post_save, sender=Product)
+def product_search_update(sender, instance, **kwargs):
+    update_search_vectors(list(instance.product_info.values_list('id', flat=True)))
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_search_update(sender, instance, **kwargs):
+    update_search_vectors([instance.product_info_id])
+
+
+# Пересчет копии параметров ProductInfo.attributes (backend/attributes.py) и счетчиков фасетов
+# (backend/facets.py) при правке параметров вне импорта.
+# Удаление Parameter удаляет его ProductParameter каскадом с сигналами post_delete
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_attributes_update(sender, instance, **kwargs):
+    update_attributes([instance.product_info_id])
+    update_facets([instance.product_info_id])
+
+
+@receiver(post_save, sender=Parameter)
+def parameter_attributes_update(sender, instance, created, **kwargs):
+    # Счетчики ведутся по id параметра, переименование их не меняет
+    if not created:
+        update_attributes(list(instance.parameters.values_list('product_info_id', flat=True)))
+
+# Сброс кэша каталога (backend/cache.py) при правке данных, которые выводят закэшированные ответы.
+# Категории, магазины, товары и названия параметров входят во все ответы - общее пространство CATALOG,
+# карточки и их параметры - только в прайс своего магазина
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Shop)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Parameter)
+def catalog_cache_invalidate(sender, **kwargs):
+    invalidate(CATALOG)
+
+
+@receiver(m2m_changed, sender=Category.shops.through)
+def category_shops_cache_invalidate(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate(CATALOG)
+
+
+@receiver(post_save, sender=User)
+def shop_user_cache_invalidate(sender, instance, update_fields=None, **kwargs):
+    # Контакты продавца выводятся вместе с магазином, вход в систему (last_login) кэш не сбрасывает
+    if instance.type == 'shop' and (update_fields is None or not set(update_fields) <= {'last_login'}):
+        invalidate(CATALOG)
+
+
+@receiver([post_save, post_delete], sender=ProductInfo)
+def product_info_cache_invalidate(sender, instance, **kwargs):
+    invalidate(shop_namespace(instance.shop_id))
+
+
+@receiver([post_save, post_delete], sender=ProductParameter)
+def product_parameter_cache_invalidate(sender, instance, **kwargs):
+    shop_id = ProductInfo.objects.filter(id=instance.product_info_id).values_list('shop_id', flat=True).first()
+    if shop_id is not None:
+        invalidate(shop_namespace(shop_id))
+
+
+# Счетчики значений параметров (backend/facets.py) при правке карточек вне импорта изменяются
+# приращениями в той же транзакции: важны снятие с продажи, смена товара (и категории) и параметры, но не остаток
+@receiver(post_save, sender=ProductInfo)
+def product_info_facets_update(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= {'quantity', 'search_vector'}:
+        update_facets([instance.id])
+
+
+@receiver(pre_delete, sender=ProductInfo)
+def product_info_facets_delete(sender, instance, **kwargs):
+    # Карточка снимается со счетчиков до удаления: параметры удаляются каскадом раньше нее,
+    # и их сигналы пересчитывают уже снятую с продажи карточку
+    if instance.is_active or instance.facet_state is not None:
+        ProductInfo.objects.filter(id=instance.id).update(is_active=False)
+        update_facets([instance.id])
+
+
+@receiver(post_save, sender=Product)
+def product_facets_update(sender, instance, **kwargs):
+    update_facets(list(instance.product_info.values_list('id', flat=True)))
+
+
+# Сброс кэша аутентификации: выход и смена токена (удаление Token), смена пароля и других данных
+# пользователя, создание и удаление его магазина
+@receiver(post_delete, sender=Token)
+def token_cache_delete(sender, instance, **kwargs):
+    token_cache.forget_key(instance.key)
+
+
+@receiver(post_save, sender=Token)
+def token_cache_rotate(sender, instance, **kwargs):
+    token_cache.forget_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_token_cache_invalidate(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or not set(update_fields) <= {'last_login'}:
+        token_cache.forget_user(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def shop_token_cache_invalidate(sender, instance, **kwargs):
+    token_cache.forget_user(instance.user_id)
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+
+from backend.metrics import get_budget, registry
+
+# Помощники для тестов API: проверка числа SQL-запросов на запрос по данным MetricsMiddleware.
+# Запросы нужно выполнять тестовым клиентом (django.test.Client, rest_framework.test.APIClient),
+# чтобы они прошли через middleware:
+#
+#     with query_budget('products'):
+#         client.get(reverse('backend:products'))
+#
+#     with query_budget('basket', 4) as records:
+#         client.post(reverse('backend:basket'), {...})
+
+
+@contextmanager
+def query_budget(view=None, max_queries=None):
+    # Проверяет запросы, выполненные внутри блока: к маршруту view (или ко всем, если view не задан)
+    # не больше max_queries SQL-запросов, по умолчанию - бюджет маршрута из settings.QUERY_BUDGETS.
+    # Возвращает список RequestRecord для собственных проверок
+    records = []
+    registry.listeners.append(records.append)
+    try:
+        yield records
+    finally:
+        registry.listeners.remove(records.append)
+
+    checked = [record for record in records if view is None or record.view == view]
+    if view is not None and not checked:
+        raise AssertionError(f'{view}: в блоке не было запросов к маршруту')
+    for record in checked:
+        budget = max_queries if max_queries is not None else get_budget(record.view)
+        if budget is None:
+            raise AssertionError(f'{record.view}: бюджет SQL-запросов не задан в settings.QUERY_BUDGETS')
+        if record.queries > budget:
+            raise AssertionError(f'{record.view} ({record.method}): {record.queries} SQL-запросов, бюджет {budget}')
@@ -1,3 +1,972 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import smtplib
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import ujson
+import yaml
+from django.conf import settings
+from django.core import mail
+from django.core.cache import caches
+from django.core.mail.backends import locmem
+from django.db import connection, transaction
+from django.http import HttpResponse, QueryDict
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from backend import fast_serializers
+from backend.archive import archive_batch
+from backend.authentication import token_cache
+from backend.basket import OrderStatusError, set_partner_status
+from backend.cache import (CATALOG, cached, get_cache, get_versions, invalidate, shop_namespace, token_namespace,
+                           user_namespace)
+from backend.feeds import FeedError, YamlFeed
+from backend.export import iter_batches, iter_json, iter_ndjson
+from backend.facets import attribute_counts, facet_counts, filter_by_parameters
+from backend.importer import CatalogImporter
+from backend.jobs import claim_job, enqueue_import, run_job
+from backend.management.commands.bench_serializers import Command as BenchSerializers
+from backend.metrics import registry
+from backend.models import (Category, ImportJob, Order, OrderArchive, OrderItem, OutboxEmail, Parameter,
+                            ParameterFacet, ParameterPairFacet, Product, ProductInfo, ProductParameter, Shop, User)
+from backend.outbox import backoff, queue_email, send_batch
+from backend.routers import PrimaryReplicaRouter, PrimaryStickinessMiddleware
+from backend.testing import query_budget
+
+# Тесты работают с PostgreSQL (поиск, JSONB, блокировки строк). Кэши - в памяти процесса,
+# чтобы тесты не зависели от файлового кэша каталога разработчика.
+# Тесты API - TransactionTestCase: транзакции представлений фиксируются как в работе сервера,
+# поэтому выполняются сбросы кэша после коммита, а число SQL-запросов не включает точек сохранения
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'catalog': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-catalog'},
+}
+
+CATEGORIES = [{'id': 224, 'name': 'Смартфоны'}, {'id': 15, 'name': 'Аксессуары'}]
+
+
+def goods(count=4, changes=None):
+    # Строки прайса в формате shop1.yaml, changes - {id строки: измененные поля}
+    changes = changes or {}
+    rows = []
+    for index in range(1, count + 1):
+        row = {'id': index, 'category': 224 if index % 2 else 15, 'model': f'model-{index}',
+               'name': f'Товар {index}', 'price': 100 * index, 'price_rrc': 120 * index, 'quantity': 10,
+               'parameters': {'Цвет': 'красный' if index % 3 else 'синий', 'Память (Гб)': str(64 * (index % 2 + 1)),
+                              'Диагональ': '6.1'}}
+        row.update(changes.get(index, {}))
+        rows.append(row)
+    return rows
+
+
+def yaml_feed(count):
+    # Прайс в формате shop1.yaml с count товарами
+    return yaml.safe_dump({'shop': 'Связной', 'categories': CATEGORIES, 'goods': goods(count)},
+                          allow_unicode=True, sort_keys=False).encode()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(self.headers)
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.server.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Type', 'application/x-yaml')
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FeedServer(ThreadingHTTPServer):
+    # Локальный сервер прайса для заданий импорта: отдает body с ETag,
+    # на запрос с совпадающим If-None-Match отвечает 304
+    def __init__(self, body, etag='"1"'):
+        super().__init__(('127.0.0.1', 0), FeedHandler)
+        self.body = body
+        self.etag = etag
+        self.requests = []
+        self.url = f'http://127.0.0.1:{self.server_port}/shop1.yaml'
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class YamlFeedTests(SimpleTestCase):
+
+    def test_values_match_safe_load(self):
+        document = yaml_feed(5)
+        feed = YamlFeed(io.BytesIO(document))
+        expected = yaml.safe_load(document)
+        self.assertEqual((feed.shop, feed.categories), (expected['shop'], expected['categories']))
+        self.assertEqual(list(feed.goods), expected['goods'])
+
+    def test_memory_does_not_grow_with_goods(self):
+        peaks = []
+        for count in (1000, 10000):
+            stream = io.BytesIO(yaml_feed(count))
+            tracemalloc.start()
+            try:
+                feed = YamlFeed(stream)
+                self.assertEqual(sum(1 for _ in feed.goods), count)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(len(feed.loader.constructed_objects), 0)
+        self.assertLess(peaks[1], peaks[0] * 2)
+
+    def test_goods_must_follow_shop(self):
+        with self.assertRaises(FeedError):
+            YamlFeed(io.BytesIO('goods: []\nshop: Связной\n'.encode()))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class APITestCase(TransactionTestCase):
+
+    def setUp(self):
+        for alias in TEST_CACHES:
+            caches[alias].clear()
+        token_cache.clear()
+        self.shop_user = User.objects.create_user('shop', 'shop@example.com', 'password', phone=1, type='shop',
+                                                  is_active=True)
+        self.shop = Shop.objects.create(name='Связной', user=self.shop_user, status='open')
+        self.buyer = User.objects.create_user('buyer', 'buyer@example.com', 'password', phone=2, is_active=True)
+        CatalogImporter(self.shop).run(CATEGORIES, goods())
+        self.client = self.client_for(self.buyer)
+        self.shop_client = self.client_for(self.shop_user)
+
+    @staticmethod
+    def client_for(user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+        return client
+
+    def product_info(self, external_id):
+        return ProductInfo.objects.get(shop=self.shop, external_id=external_id)
+
+    def fill_basket(self, *items):
+        # items - (external_id, количество); возвращает id корзины
+        response = self.client.post(reverse('backend:basket'), {'items': [
+            {'product_info': self.product_info(external_id).id, 'quantity': quantity} for external_id, quantity in items
+        ]}, format='json')
+        self.assertTrue(response.json()['Status'], response.content)
+        return Order.objects.get(user=self.buyer, status='temporary').id
+
+    def place_order(self, *items):
+        basket_id = self.fill_basket(*items)
+        return basket_id, self.client.post(reverse('backend:order'), {'id': basket_id}, format='json')
+
+    def walk(self, url, params):
+        ids, pages = [], 0
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            ids.extend(row['id'] for row in data['results'])
+            pages += 1
+            if not data['next']:
+                return ids, pages
+            response = self.client.get(data['next'])
+
+
+class QueryBudgetTests(APITestCase):
+    # Каждый маршрут из settings.QUERY_BUDGETS укладывается в свой бюджет SQL-запросов
+
+    def test_all_budgeted_views(self):
+        requests = {
+            'categories': lambda: self.client.get(reverse('backend:categories')),
+            'products': lambda: self.client.get(reverse('backend:products'), {'category': 224}),
+            'shops': lambda: self.shop_client.get(reverse('backend:shops')),
+            'basket': lambda: self.client.get(reverse('backend:basket')),
+            'order': lambda: self.client.get(reverse('backend:order')),
+            'partner-orders': lambda: self.shop_client.get(reverse('backend:partner-orders')),
+            'user-details': lambda: self.client.get(reverse('backend:user-details')),
+            'async-products': lambda: self.client.get(reverse('backend:async-products'), {'category': 224}),
+            'async-basket': lambda: self.client.get(reverse('backend:async-basket')),
+            'async-order': lambda: self.client.get(reverse('backend:async-order')),
+            'async-partner-orders': lambda: self.shop_client.get(reverse('backend:async-partner-orders')),
+        }
+        self.assertEqual(set(requests), set(settings.QUERY_BUDGETS))
+        self.place_order((1, 1), (2, 2))
+        self.fill_basket((3, 1))
+        for view, request in requests.items():
+            with self.subTest(view=view), query_budget(view):
+                self.assertEqual(request().status_code, 200)
+
+    def test_basket_and_order_writes(self):
+        basket_id = self.fill_basket((1, 1))
+        with query_budget('basket'):
+            self.client.post(reverse('backend:basket'), {'items': [
+                {'product_info': self.product_info(2).id, 'quantity': 3}]}, format='json')
+        with query_budget('order'):
+            self.client.post(reverse('backend:order'), {'id': basket_id}, format='json')
+        sub_order = Order.objects.get(parent_id=basket_id)
+        with query_budget('partner-orders'):
+            self.shop_client.post(reverse('backend:partner-orders'), {'id': sub_order.id, 'status': 'accepted'},
+                                  format='json')
+
+
+class StockTests(APITestCase):
+
+    def test_order_reserves_stock(self):
+        basket_id, response = self.place_order((1, 3), (2, 10))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.product_info(1).quantity, 7)
+        self.assertEqual(self.product_info(2).quantity, 0)
+        self.assertEqual(Order.objects.get(id=basket_id).status, 'new')
+        sub_order = Order.objects.get(parent_id=basket_id)
+        self.assertEqual(sub_order.shop_id, self.shop.id)
+        self.assertEqual(sub_order.total, Decimal('2300.00'))
+
+    def test_shortage_rolls_back(self):
+        basket_id, response = self.place_order((1, 3), (2, 11))
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(str(self.product_info(2).id), response.json()['Errors'])
+        self.assertEqual(self.product_info(1).quantity, 10)
+        self.assertEqual(self.product_info(2).quantity, 10)
+        self.assertEqual(Order.objects.get(id=basket_id).status, 'temporary')
+        self.assertFalse(Order.objects.filter(parent_id=basket_id).exists())
+
+    def test_retired_product_is_out_of_stock(self):
+        ProductInfo.objects.filter(id=self.product_info(1).id).update(is_active=False)
+        _, response = self.place_order((2, 1))
+        self.assertEqual(response.status_code, 200)
+        basket_id = self.fill_basket((2, 1))
+        OrderItem.objects.create(order_id=basket_id, product_info=self.product_info(1), quantity=1, price=100)
+        response = self.client.post(reverse('backend:order'), {'id': basket_id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.product_info(2).quantity, 9)
+
+    def test_cancel_releases_stock(self):
+        basket_id, _ = self.place_order((1, 4))
+        sub_order = Order.objects.get(parent_id=basket_id)
+        self.assertTrue(set_partner_status(self.shop_user.id, sub_order.id, 'accepted'))
+        response = self.shop_client.post(reverse('backend:partner-orders'), {'id': sub_order.id, 'status': 'canceled'},
+                                         format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.product_info(1).quantity, 10)
+
+    def test_status_transitions(self):
+        basket_id, _ = self.place_order((1, 1))
+        sub_order = Order.objects.get(parent_id=basket_id)
+        with self.assertRaises(OrderStatusError):
+            set_partner_status(self.shop_user.id, sub_order.id, 'delivered')
+        for status in ('accepted', 'assembled', 'sent', 'delivered'):
+            self.assertTrue(set_partner_status(self.shop_user.id, sub_order.id, status))
+        response = self.shop_client.post(reverse('backend:partner-orders'), {'id': sub_order.id, 'status': 'canceled'},
+                                         format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.product_info(1).quantity, 9)
+        self.assertFalse(set_partner_status(self.buyer.id, sub_order.id, 'canceled'))
+
+
+class BasketTests(APITestCase):
+
+    def test_upsert_replaces_quantity(self):
+        basket_id = self.fill_basket((1, 2), (2, 1))
+        self.fill_basket((1, 5))
+        positions = dict(OrderItem.objects.filter(order_id=basket_id).values_list('product_info__external_id',
+                                                                                  'quantity'))
+        self.assertEqual(positions, {1: 5, 2: 1})
+        self.assertEqual(Order.objects.get(id=basket_id).total, Decimal('700.00'))
+
+    def test_last_duplicate_wins(self):
+        product_info_id = self.product_info(3).id
+        self.client.post(reverse('backend:basket'), {'items': [
+            {'product_info': product_info_id, 'quantity': 1}, {'product_info': product_info_id, 'quantity': 4}]},
+            format='json')
+        self.assertEqual(list(OrderItem.objects.filter(order__user=self.buyer).values_list('quantity', flat=True)), [4])
+
+    def test_invalid_items(self):
+        response = self.client.post(reverse('backend:basket'), {'items': [
+            {'product_info': self.product_info(1).id, 'quantity': 0}, {'product_info': 10 ** 9, 'quantity': 1}]},
+            format='json')
+        self.assertFalse(response.json()['Status'])
+        self.assertFalse(OrderItem.objects.filter(order__user=self.buyer).exists())
+
+
+class ImportTests(APITestCase):
+
+    def test_sync_updates_only_changes(self):
+        rows = goods(5, {1: {'price': 150}, 2: {'parameters': {'Цвет': 'черный'}}})
+        del rows[3]
+        old_ids = {external_id: self.product_info(external_id).id for external_id in (1, 2, 3)}
+        result = CatalogImporter(self.shop).run(CATEGORIES, rows)
+        self.assertEqual((result['created'], result['updated'], result['retired']), (1, 2, 1))
+        self.assertEqual({external_id: self.product_info(external_id).id for external_id in (1, 2, 3)}, old_ids)
+        self.assertEqual(self.product_info(1).price, Decimal('150.00'))
+        self.assertEqual(self.product_info(2).attributes, {'Цвет': 'черный'})
+        self.assertEqual(list(ProductParameter.objects.filter(product_info__external_id=2, product_info__shop=self.shop)
+                              .values_list('parameter__name', 'value')), [('Цвет', 'черный')])
+        self.assertFalse(self.product_info(4).is_active)
+        self.assertTrue(self.product_info(5).is_active)
+
+    def test_sync_without_changes(self):
+        result = CatalogImporter(self.shop).run(CATEGORIES, goods())
+        self.assertEqual((result['created'], result['updated'], result['retired']), (0, 0, 0))
+
+    def test_retired_product_returns(self):
+        CatalogImporter(self.shop).run(CATEGORIES, goods(3))
+        result = CatalogImporter(self.shop).run(CATEGORIES, goods())
+        self.assertEqual(result['updated'], 1)
+        self.assertTrue(self.product_info(4).is_active)
+
+    def test_products_shared_between_shops(self):
+        user = User.objects.create_user('shop2', 'shop2@example.com', 'password', phone=3, type='shop')
+        shop = Shop.objects.create(name='DNS', user=user, status='open')
+        CatalogImporter(shop).run(CATEGORIES, goods())
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertEqual(ProductInfo.objects.count(), 8)
+
+    def test_sample_feed(self):
+        # Прайс-образец из корня репозитория, названия товаров в нем длиннее 40 символов
+        with open(settings.BASE_DIR.parent / 'shop1.yaml', 'rb') as stream:
+            feed = YamlFeed(stream)
+            result = CatalogImporter(self.shop, mode='replace').run(feed.categories, feed.goods)
+        names = set(ProductInfo.objects.filter(shop=self.shop).values_list('product__name', flat=True))
+        self.assertEqual(len(names), result['created'])
+        self.assertIn('Смартфон Apple iPhone XS Max 512GB (золотистый)', names)
+
+    def test_too_long_values_reported(self):
+        rows = goods(changes={2: {'model': 'м' * 101}, 3: {'parameters': {'Цвет': 'ц' * 101}}})
+        with self.assertRaisesMessage(FeedError, 'товар 2: model длиннее 100 символов; '
+                                                 'товар 3: parameters.Цвет длиннее 100 символов'):
+            CatalogImporter(self.shop).run(CATEGORIES, rows)
+        self.assertEqual(self.product_info(2).model, goods()[1]['model'])
+
+
+class ImportJobTests(APITestCase):
+
+    def feed_server(self, body):
+        server = FeedServer(body)
+        self.addCleanup(server.stop)
+        return server
+
+    def test_one_running_job_per_shop(self):
+        user = User.objects.create_user('shop2', 'shop2@example.com', 'password', phone=3, type='shop')
+        first = enqueue_import(self.shop_user.id, 'http://example.com/1.yaml')
+        second = enqueue_import(self.shop_user.id, 'http://example.com/2.yaml')
+        other = enqueue_import(user.id, 'http://example.com/3.yaml')
+        self.assertEqual(claim_job().id, first.id)
+        # Второе задание магазина ждет первое, вместо него берется задание другого магазина
+        self.assertEqual(claim_job().id, other.id)
+        self.assertIsNone(claim_job())
+        ImportJob.objects.filter(id=first.id).update(status='done')
+        self.assertEqual(claim_job().id, second.id)
+
+    @mock.patch('backend.jobs.PROGRESS_INTERVAL', 0.05)
+    def test_progress_saved_while_running(self):
+        server = self.feed_server(yaml_feed(3000))
+        job = enqueue_import(self.shop_user.id, server.url)
+        with CaptureQueriesContext(connection) as queries:
+            run_job(claim_job())
+        # Число обработанных строк сохранялось по порциям импорта, до завершения его транзакции
+        progress = [int(query['sql'].split('"processed" = ')[1].split()[0]) for query in queries
+                    if query['sql'].startswith('UPDATE "backend_importjob" SET "processed" = ')]
+        self.assertTrue([value for value in progress if 0 < value < 3000], progress)
+        response = self.shop_client.get(reverse('backend:partner-update-status', args=[job.id]))
+        self.assertEqual((response.data['status'], response.data['processed']), ('done', 3000))
+        self.assertEqual(response.data['stats']['created'], 2996)
+        self.assertEqual(ProductInfo.objects.filter(shop=self.shop).count(), 3000)
+
+    def run_feed_job(self, url, mode='sync'):
+        job = enqueue_import(self.shop_user.id, url, mode)
+        run_job(claim_job())
+        job.refresh_from_db()
+        return job
+
+    def test_not_modified_feed_skipped(self):
+        server = self.feed_server(yaml_feed(5))
+        self.assertEqual(self.run_feed_job(server.url).status, 'done')
+        self.assertIsNone(server.requests[0].get('If-None-Match'))
+        job = self.run_feed_job(server.url)
+        # Повторная загрузка той же ссылки - условный запрос, на 304 разбор и запись не выполняются
+        self.assertEqual(server.requests[1].get('If-None-Match'), '"1"')
+        self.assertEqual((job.status, job.stats), ('skipped', {'skipped': True, 'reason': 'not_modified'}))
+
+    def test_same_hash_skipped(self):
+        server = self.feed_server(yaml_feed(5))
+        self.run_feed_job(server.url)
+        server.etag = '"2"'
+        job = self.run_feed_job(server.url)
+        self.assertEqual((job.status, job.stats), ('skipped', {'skipped': True, 'reason': 'same_hash'}))
+        # Новый ETag запоминается, следующая загрузка снова получит 304
+        self.assertEqual(Shop.objects.get(id=self.shop.id).feed_etag, '"2"')
+        self.assertEqual(self.run_feed_job(server.url).stats['reason'], 'not_modified')
+
+    def test_changed_and_replace_feeds_imported(self):
+        server = self.feed_server(yaml_feed(5))
+        self.run_feed_job(server.url)
+        server.body, server.etag = yaml_feed(6), '"2"'
+        self.assertEqual(self.run_feed_job(server.url).stats['created'], 1)
+        # Режим replace загружает прайс без условных заголовков
+        job = self.run_feed_job(server.url, 'replace')
+        self.assertIsNone(server.requests[-1].get('If-None-Match'))
+        self.assertEqual((job.status, job.stats['created']), ('done', 6))
+
+    def test_failed_job_keeps_error(self):
+        server = self.feed_server(b'shop: [')
+        job = enqueue_import(self.shop_user.id, server.url)
+        run_job(claim_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error)
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def test_products_pages(self):
+        rows = goods(9, {5: {'price': 300}, 6: {'price': 300}})
+        CatalogImporter(self.shop).run(CATEGORIES, rows)
+        expected = list(ProductInfo.objects.filter(is_active=True).order_by('price', 'id').values_list('id', flat=True))
+        ids, pages = self.walk(reverse('backend:products'), {'page_size': 2})
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 5)
+        ids, _ = self.walk(reverse('backend:products'), {'page_size': 4, 'ordering': '-price'})
+        self.assertEqual(ids, list(ProductInfo.objects.filter(is_active=True).order_by('-price', '-id').values_list(
+            'id', flat=True)))
+
+    def test_orders_pages(self):
+        for external_id in (1, 2, 3):
+            self.place_order((external_id, 1))
+        Order.objects.filter(user=self.buyer, parent__isnull=True).update(created_at=timezone.now())
+        expected = list(Order.objects.filter(user=self.buyer, parent__isnull=True).order_by('-created_at', '-id')
+                        .values_list('id', flat=True))
+        ids, _ = self.walk(reverse('backend:order'), {'page_size': 2})
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('backend:products'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        # Курсор правильной длины, но со значениями не тех типов
+        for values in ([{'a': 1}, 1], ['abc', 1], [100, 'x'], [None, 1], [[1], 1]):
+            cursor = base64.urlsafe_b64encode(ujson.dumps(values).encode()).decode()
+            with self.subTest(values=values):
+                self.assertEqual(self.client.get(reverse('backend:products'), {'cursor': cursor}).status_code, 404)
+                self.assertEqual(self.client.get(reverse('backend:async-products'), {'cursor': cursor}).status_code,
+                                 404)
+        for values in (['вчера', 1], [1, 1]):
+            cursor = base64.urlsafe_b64encode(ujson.dumps(values).encode()).decode()
+            with self.subTest(values=values):
+                self.assertEqual(self.client.get(reverse('backend:order'), {'cursor': cursor}).status_code, 404)
+
+
+class SearchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Слово "смартфон" в названии (вес A), значении параметра (B) и описании (C)
+        CatalogImporter(self.shop, mode='replace').run(CATEGORIES, goods(changes={
+            1: {'name': 'Чехол для смартфона', 'parameters': {}},
+            2: {'name': 'Кабель USB-C', 'parameters': {'Совместимость': 'смартфоны'}},
+            3: {'name': 'Наушники', 'parameters': {}, 'description': 'Подходят к любому смартфону'},
+            4: {'name': 'Зарядное устройство', 'parameters': {}},
+        }))
+        self.ids = {external_id: self.product_info(external_id).id for external_id in (1, 2, 3, 4)}
+
+    def search(self, text, url='backend:products', **params):
+        ids, _ = self.walk(reverse(url), {'search': text, **params})
+        return ids
+
+    def test_ranked_by_field_weight(self):
+        expected = [self.ids[1], self.ids[2], self.ids[3]]
+        self.assertEqual(self.search('смартфоны'), expected)
+        # Ранг передается в курсоре без потерь: постранично тот же порядок
+        self.assertEqual(self.search('смартфон', page_size=1), expected)
+        self.assertEqual(self.search('смартфон', 'backend:async-products', page_size=1), expected)
+
+    def test_websearch_syntax(self):
+        self.assertEqual(self.search('смартфон -чехол'), [self.ids[2], self.ids[3]])
+        self.assertEqual(self.search('кабель or наушники'), [self.ids[2], self.ids[3]])
+        self.assertEqual(self.search('"зарядное устройство"'), [self.ids[4]])
+
+    def test_vector_follows_product_name(self):
+        product = Product.objects.get(name='Зарядное устройство')
+        product.name = 'Зарядное устройство для смартфона'
+        product.save()
+        self.assertCountEqual(self.search('смартфон')[:2], [self.ids[1], self.ids[4]])
+
+
+class CatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.builds = 0
+
+    def cached_value(self, namespaces, key='key'):
+        # Значение из кэша или номер нового построения
+
+        def build():
+            self.builds += 1
+            return self.builds
+        return cached(namespaces, key, build)
+
+    def test_version_changes_after_commit(self):
+        self.assertEqual(self.cached_value([CATALOG]), 1)
+        self.assertEqual(self.cached_value([CATALOG]), 1)
+        with transaction.atomic():
+            invalidate(CATALOG)
+            # До фиксации транзакции запросы получают прежнее значение и не кэшируют новое под старой версией
+            self.assertEqual(self.cached_value([CATALOG]), 1)
+        self.assertEqual(self.cached_value([CATALOG]), 2)
+        with transaction.atomic():
+            invalidate(CATALOG)
+            transaction.set_rollback(True)
+        self.assertEqual(self.cached_value([CATALOG]), 2)
+
+    def test_namespaces_independent(self):
+        namespaces = [CATALOG, shop_namespace(self.shop.id)]
+        self.assertEqual(self.cached_value(namespaces), 1)
+        invalidate(shop_namespace(0))
+        self.assertEqual(self.cached_value(namespaces), 1)
+        invalidate(shop_namespace(self.shop.id))
+        self.assertEqual(self.cached_value(namespaces), 2)
+
+    def test_lost_version_not_reused(self):
+        self.assertEqual(self.cached_value([CATALOG]), 1)
+        # Вытесненный счетчик версии заводится заново от текущего времени, старые записи не подхватываются
+        get_cache().delete(f'version:{CATALOG}')
+        self.assertEqual(self.cached_value([CATALOG]), 2)
+
+    def test_category_list_invalidated(self):
+        url = reverse('backend:categories')
+        names = self.client.get(url).json()['results']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).json()['results'], names)
+        self.assertFalse([query for query in queries if 'backend_category' in query['sql']])
+        Category.objects.filter(id=224).update(name='Телефоны')
+        # Изменение мимо сигналов не видно до смены версии
+        self.assertEqual(self.client.get(url).json()['results'], names)
+        category = Category.objects.get(id=224)
+        category.save()
+        self.assertIn('Телефоны', [row['name'] for row in self.client.get(url).json()['results']])
+
+    def test_shop_price_list_invalidated(self):
+        url = reverse('backend:products')
+        catalog, shop = get_versions([CATALOG, shop_namespace(self.shop.id)])
+        self.client.get(url, {'shop': self.shop.id})
+        product_info = self.product_info(1)
+        product_info.price = 999
+        product_info.save()
+        prices = [row['price'] for row in self.client.get(url, {'shop': self.shop.id}).json()['results']]
+        self.assertIn('999.00', prices)
+        # Изменение карточки сбрасывает только прайс ее магазина
+        self.assertEqual(get_versions([CATALOG])[0], catalog)
+        self.assertNotEqual(get_versions([shop_namespace(self.shop.id)])[0], shop)
+        CatalogImporter(self.shop).run(CATEGORIES, goods(changes={2: {'price': 777}}))
+        prices = [row['price'] for row in self.client.get(url, {'shop': self.shop.id}).json()['results']]
+        self.assertIn('777.00', prices)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    # Почтовое соединение, отвечающее на очередные письма ошибками из errors (None - письмо уходит)
+    def __init__(self, *errors, **kwargs):
+        super().__init__(**kwargs)
+        self.errors = list(errors)
+
+    def send_messages(self, messages):
+        error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        return super().send_messages(messages)
+
+
+class OutboxTests(TransactionTestCase):
+
+    def setUp(self):
+        self.emails = [queue_email(f'Письмо {index}', 'Текст', f'user{index}@example.com') for index in range(3)]
+
+    def state(self, email):
+        email.refresh_from_db()
+        return email.status, email.attempts
+
+    def test_batch_sent(self):
+        self.assertEqual(send_batch(FlakyEmailBackend()), (3, 0, False))
+        self.assertEqual([message.to for message in mail.outbox], [[email.to] for email in self.emails])
+        self.assertEqual([self.state(email) for email in self.emails], [('sent', 1)] * 3)
+        self.assertEqual(send_batch(FlakyEmailBackend()), (0, 0, False))
+
+    def test_rejected_email_retried_with_backoff(self):
+        started = timezone.now()
+        rejected = smtplib.SMTPRecipientsRefused({self.emails[1].to: (550, b'No such user')})
+        # Отказ сервера по одному письму не прерывает пачку
+        self.assertEqual(send_batch(FlakyEmailBackend(None, rejected)), (2, 1, False))
+        email = OutboxEmail.objects.get(id=self.emails[1].id)
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIn('No such user', email.error)
+        self.assertGreaterEqual(email.next_attempt_at, started + backoff(1))
+        # До истечения паузы письмо не берется
+        self.assertEqual(send_batch(FlakyEmailBackend()), (0, 0, False))
+        OutboxEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_batch(FlakyEmailBackend()), (1, 0, False))
+        self.assertEqual(self.state(email), ('sent', 2))
+
+    def test_disconnect_stops_batch(self):
+        self.assertEqual(send_batch(FlakyEmailBackend(smtplib.SMTPServerDisconnected('Connection lost'))),
+                         (0, 1, True))
+        self.assertEqual([self.state(email) for email in self.emails], [('pending', 1), ('pending', 0), ('pending', 0)])
+        self.assertEqual(send_batch(FlakyEmailBackend()), (2, 0, False))
+
+    def test_failed_after_max_attempts(self):
+        for attempt in range(2):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            send_batch(FlakyEmailBackend(*[smtplib.SMTPDataError(554, b'Rejected')] * 3), max_attempts=2)
+        self.assertEqual([self.state(email) for email in self.emails], [('failed', 2)] * 3)
+        self.assertEqual(send_batch(FlakyEmailBackend()), (0, 0, False))
+
+    def test_backoff_grows_up_to_limit(self):
+        self.assertEqual([backoff(attempt).total_seconds() for attempt in (1, 2, 3)], [30, 60, 120])
+        self.assertEqual(backoff(20).total_seconds(), 3600)
+
+
+class FastSerializerTests(APITestCase):
+    # Вывод fast_serializers совпадает с сериализаторами DRF байт в байт (случаи команды bench_serializers)
+
+    def assert_same_output(self):
+        renderer = JSONRenderer()
+        for name, queryset, serializer_class, values_queryset, fields, serialize in BenchSerializers().get_cases():
+            with self.subTest(name):
+                expected = renderer.render(serializer_class(list(queryset), many=True).data)
+                self.assertTrue(ujson.loads(expected))
+                self.assertEqual(fast_serializers.dumps(serialize(list(values_queryset.values(*fields)))), expected)
+
+    def test_output_matches_drf(self):
+        # Не-ASCII, "/", кавычки и разделители строк, которые JSONRenderer экранирует
+        ProductInfo.objects.filter(shop=self.shop, external_id=1).update(
+            description='Чехол "Про" / https://example.com/a\u2028b\u2029')
+        self.buyer.first_name, self.buyer.last_name = 'Иван', 'Петров'
+        self.buyer.save()
+        self.place_order((1, 1), (2, 2))
+        _, response = self.place_order((3, 1))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_same_output()
+        with override_settings(TIME_ZONE='Europe/Moscow'):
+            self.assert_same_output()
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        CatalogImporter(self.shop).run(CATEGORIES, goods(9))
+        self.ids, _ = self.walk(reverse('backend:products'), {'page_size': 200})
+
+    def export(self, url, params, client=None):
+        response = (client or self.client).get(reverse(url), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_json_and_ndjson(self):
+        response, content = self.export('backend:products', {'export': 'json'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="products.json"')
+        self.assertEqual([row['id'] for row in ujson.loads(content)], self.ids)
+        response, content = self.export('backend:products', {'export': 'ndjson', 'category': 224})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [ujson.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['id'] for row in rows], list(ProductInfo.objects.filter(
+            is_active=True, product__category_id=224).order_by('price', 'id').values_list('id', flat=True)))
+
+    def test_batches_joined(self):
+        # Части ответа по пачкам собираются в тот же список, что и одной пачкой
+        queryset = ProductInfo.objects.filter(is_active=True).order_by('price', 'id')
+        fields, serialize = fast_serializers.PRODUCT_INFO_FIELDS, fast_serializers.product_infos
+        parts = list(iter_json(iter_batches(queryset, fields, serialize, chunk_size=4)))
+        self.assertEqual(len(parts), 5)
+        self.assertEqual(ujson.loads(b''.join(parts)), serialize(list(queryset.values(*fields))))
+        self.assertEqual(b''.join(iter_json(iter_batches(queryset.none(), fields, serialize))), b'[]')
+        self.assertEqual(len(b''.join(iter_ndjson(iter_batches(queryset, fields, serialize, chunk_size=4)))
+                             .splitlines()), 9)
+
+    def test_orders(self):
+        self.place_order((1, 1))
+        self.place_order((2, 1))
+        _, content = self.export('backend:order', {'export': 'ndjson'})
+        orders = [ujson.loads(line) for line in content.splitlines()]
+        self.assertEqual(orders, self.client.get(reverse('backend:order')).json()['results'])
+        _, content = self.export('backend:partner-orders', {'export': 'json'}, self.shop_client)
+        self.assertEqual(len(ujson.loads(content)), 2)
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('backend:products'), {'export': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_asgi_streaming(self):
+        response = await AsyncClient().get(reverse('backend:products'), {'export': 'json'})
+        self.assertTrue(response.is_async)
+        content = b''.join([part async for part in response.streaming_content])
+        self.assertEqual([row['id'] for row in ujson.loads(content)], self.ids)
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    @staticmethod
+    def parse(text):
+        # {метрика с метками: значение} из текстового формата Prometheus
+        return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+    def metrics(self):
+        response = self.client.get(reverse('backend:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return self.parse(response.content.decode())
+
+    @override_settings(INTERNAL_IPS=['10.0.0.1'])
+    def test_internal_ips_only(self):
+        self.assertEqual(self.client.get(reverse('backend:metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('backend:metrics'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+    def test_requests_counted(self):
+        self.client.get(reverse('backend:products'))
+        self.client.get(reverse('backend:products'), {'page_size': 1})
+        self.client.get(reverse('backend:order'), {'created_after': 'вчера'})
+        metrics = self.metrics()
+        self.assertEqual(metrics['orders_http_responses_total{view="products",method="GET",status="200"}'], '2')
+        self.assertEqual(metrics['orders_http_responses_total{view="order",method="GET",status="400"}'], '1')
+        self.assertEqual(metrics['orders_http_request_duration_seconds_count{view="products"}'], '2')
+        self.assertEqual(metrics['orders_http_request_duration_seconds_bucket{view="products",le="+Inf"}'], '2')
+        self.assertGreaterEqual(int(metrics['orders_db_queries_per_request_sum{view="products"}']), 2)
+        self.assertEqual(metrics['orders_db_queries_per_request_bucket{view="products",le="100"}'], '2')
+        self.assertGreater(float(metrics['orders_db_query_seconds_total{view="products"}']), 0)
+        self.assertGreater(float(metrics['orders_serialization_seconds_total{view="products"}']), 0)
+        self.assertEqual(metrics['orders_query_budget_exceeded_total{view="products"}'], '0')
+
+    async def test_async_view_queries_counted(self):
+        response = await AsyncClient().get(reverse('backend:async-products'))
+        self.assertEqual(response.status_code, 200)
+        # SQL-запросы ORM из sync_to_async учитываются в записи запроса через contextvar
+        metrics = self.parse(registry.render())
+        self.assertEqual(metrics['orders_http_responses_total{view="async-products",method="GET",status="200"}'], '1')
+        self.assertGreater(int(metrics['orders_db_queries_per_request_sum{view="async-products"}']), 0)
+
+    @override_settings(QUERY_BUDGETS={'products': 1})
+    def test_budget_exceeded(self):
+        with self.assertLogs('backend.metrics', 'WARNING'):
+            self.client.get(reverse('backend:products'))
+        self.assertEqual(self.metrics()['orders_query_budget_exceeded_total{view="products"}'], '1')
+
+    @override_settings(DEBUG=True)
+    def test_server_timing(self):
+        response = self.client.get(reverse('backend:products'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, total;dur=')
+
+
+class TokenCacheTests(APITestCase):
+
+    def details(self, client=None):
+        return (client or self.client).get(reverse('backend:user-details'))
+
+    def test_cached_token_skips_database(self):
+        self.assertEqual(self.details().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.details().status_code, 200)
+            self.assertEqual(self.client.get(reverse('backend:async-basket')).status_code, 200)
+        self.assertFalse([query for query in queries if Token._meta.db_table in query['sql']])
+
+    def test_logout(self):
+        self.assertEqual(self.details().status_code, 200)
+        self.assertEqual(self.client.post(reverse('backend:user-logout')).status_code, 200)
+        self.assertEqual(self.details().status_code, 401)
+
+    def test_deactivated_user(self):
+        self.assertEqual(self.details().status_code, 200)
+        self.buyer.is_active = False
+        self.buyer.save()
+        self.assertEqual(self.details().status_code, 401)
+
+    def test_invalidation_from_another_process(self):
+        # Другой процесс меняет только версию в общем кэше, локальная запись этого процесса остается
+        self.assertEqual(self.details().status_code, 200)
+        key = Token.objects.get(user=self.buyer).key
+        self.assertIsNotNone(token_cache.get(key))
+        invalidate(user_namespace(self.buyer.id))
+        self.assertIsNone(token_cache.get(key))
+        self.assertEqual(self.details().status_code, 200)
+        Token.objects.filter(key=key).update(key='0' * 40)
+        invalidate(token_namespace(key))
+        self.assertEqual(self.details().status_code, 401)
+
+
+# Изменяющий запрос клиента с токеном 'one' в отдельном процессе (другой воркер сервера)
+STICK_IN_OTHER_PROCESS = '''
+import sys
+import django
+django.setup()
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from backend.routers import PrimaryStickinessMiddleware
+caches = {'catalog': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': sys.argv[1]}}
+with override_settings(CACHES=caches, DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_CACHE='catalog'):
+    PrimaryStickinessMiddleware(lambda request: HttpResponse())(
+        RequestFactory().post('/', HTTP_AUTHORIZATION='Token one'))
+'''
+
+
+@override_settings(CACHES=TEST_CACHES, DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=10,
+                   REPLICA_STICKY_CACHE='catalog')
+class RouterStickinessTests(SimpleTestCase):
+    # Выбор БД для чтения без запросов к БД: представление запоминает, куда бы пошло чтение
+
+    def setUp(self):
+        caches['catalog'].clear()
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+        self.reads = []
+
+    def request(self, method, status=200, token='one'):
+        def view(request):
+            self.reads.append(self.router.db_for_read(Order))
+            return HttpResponse(status=status)
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        PrimaryStickinessMiddleware(view)(getattr(self.factory, method)('/', **headers))
+        return self.reads[-1]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.request('get'), 'replica1')
+        self.assertEqual(self.request('get', token=None), 'replica1')
+
+    def test_write_sticks_client_to_primary(self):
+        self.assertEqual(self.request('post'), 'default')
+        self.assertEqual(self.request('get'), 'default')
+        self.assertEqual(self.request('get', token='two'), 'replica1')
+
+    def test_failed_write_does_not_stick(self):
+        self.request('post', status=400)
+        self.assertEqual(self.request('get'), 'replica1')
+
+    def test_tokens_always_read_from_primary(self):
+        self.request('get')
+        self.assertEqual(self.router.db_for_read(Token), 'default')
+
+    def test_pin_is_shared_between_processes(self):
+        # Метку ставит запрос в другом процессе с тем же файловым кэшем, этот процесс ее видит
+        with tempfile.TemporaryDirectory() as location:
+            shared = {**TEST_CACHES, 'catalog': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}
+            with override_settings(CACHES=shared):
+                subprocess.run([sys.executable, '-c', STICK_IN_OTHER_PROCESS, location], check=True,
+                               cwd=settings.BASE_DIR)
+                self.assertEqual(self.request('get'), 'default')
+                self.assertEqual(self.request('get', token='two'), 'replica1')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(self.request('get'), 'default')
+
+
+class ArchiveTests(APITestCase):
+
+    def close_order(self, external_id, days_ago):
+        basket_id, _ = self.place_order((external_id, 1))
+        sub_order = Order.objects.get(parent_id=basket_id)
+        for status in ('accepted', 'assembled', 'sent', 'delivered'):
+            set_partner_status(self.shop_user.id, sub_order.id, status)
+        Order.objects.filter(id__in=[basket_id, sub_order.id]).update(
+            created_at=timezone.now() - datetime.timedelta(days=days_ago))
+        return basket_id
+
+    def test_archive_and_history(self):
+        old_id = self.close_order(1, 400)
+        recent_id = self.close_order(2, 10)
+        open_basket_id, _ = self.place_order((3, 1))
+        Order.objects.filter(id=open_basket_id).update(created_at=timezone.now() - datetime.timedelta(days=500))
+
+        self.assertEqual(archive_batch(timezone.now() - datetime.timedelta(days=365)), 1)
+        self.assertEqual(set(OrderArchive.objects.filter(parent__isnull=True).values_list('id', flat=True)), {old_id})
+        self.assertFalse(Order.objects.filter(id=old_id).exists())
+        self.assertFalse(OrderItem.objects.filter(order__parent_id=old_id).exists())
+
+        ids = [row['id'] for row in self.client.get(reverse('backend:order')).json()['results']]
+        self.assertEqual(ids, [recent_id, open_basket_id])
+
+        response = self.client.get(reverse('backend:order'), {'created_after': '2000-01-01', 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row['id'] for row in data['results']], [recent_id, old_id])
+        archived = data['results'][1]
+        self.assertEqual(len(archived['sub_orders']), 1)
+        self.assertEqual(archived['sub_orders'][0]['status'], 'delivered')
+        next_page = self.client.get(data['next']).json()
+        self.assertEqual([row['id'] for row in next_page['results']], [open_basket_id])
+
+        shop_ids = [row['id'] for row in self.shop_client.get(
+            reverse('backend:partner-orders'), {'created_after': '2000-01-01'}).json()['results']]
+        self.assertEqual(len(shop_ids), 3)
+        self.assertEqual(self.client.get(reverse('backend:order'), {'created_after': 'вчера'}).status_code, 400)
+
+
+class FacetTests(APITestCase):
+
+    def assert_counts_match(self):
+        # Счетчики в таблицах совпадают с подсчетом по карточкам в продаже
+        expected = attribute_counts(ProductInfo.objects.filter(is_active=True))
+        facets = facet_counts(ProductInfo.objects.filter(is_active=True), QueryDict())
+        self.assertEqual({(name, value): count for name, value, count in expected},
+                         {(name, value): count for name, values in facets.items() for value, count in values.items()})
+        self.assertFalse(ParameterFacet.objects.filter(count=0).exists())
+        self.assertFalse(ParameterPairFacet.objects.filter(count=0).exists())
+        for name, value, _ in expected:
+            queryset = filter_by_parameters(ProductInfo.objects.filter(is_active=True), {name: [value]})
+            filtered = facet_counts(queryset, QueryDict(f'param={name}:{value}'))
+            counts = {(row_name, row_value): count for row_name, row_value, count in attribute_counts(queryset)
+                      if row_name != name}
+            self.assertEqual(counts, {(row_name, row_value): count for row_name, values in filtered.items()
+                                      if row_name != name for row_value, count in values.items()})
+
+    def test_import_and_edits(self):
+        self.assert_counts_match()
+        CatalogImporter(self.shop).run(CATEGORIES, goods(5, {1: {'parameters': {'Цвет': 'черный'}}})[1:])
+        self.assert_counts_match()
+        product_info = self.product_info(2)
+        product_info.is_active = False
+        product_info.save()
+        self.assert_counts_match()
+        ProductParameter.objects.filter(product_info=self.product_info(3), parameter__name='Цвет').update(value='x')
+        ProductParameter.objects.get(product_info=self.product_info(3), parameter__name='Цвет').save()
+        self.assert_counts_match()
+        parameter = Parameter.objects.get(name='Диагональ')
+        parameter.name = 'Диагональ (дюймы)'
+        parameter.save()
+        self.assert_counts_match()
+        self.product_info(5).delete()
+        Category.objects.get(id=15).delete()
+        self.assert_counts_match()
+        CatalogImporter(self.shop, mode='replace').run(CATEGORIES, goods(3))
+        self.assert_counts_match()
+
+    def test_products_view(self):
+        self.client.get(reverse('backend:user-details'))
+        with query_budget('products'):
+            response = self.client.get(reverse('backend:products'), {'facets': 1, 'param': 'Цвет:синий'})
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()['facets']
+        self.assertEqual(facets['Цвет'], {'красный': 3, 'синий': 1})
+        self.assertEqual(facets['Память (Гб)'], {'128': 1})
@@ -1,22 +1,33 @@
 from django.urls import path
 from django_rest_passwordreset.views import reset_password_request_token, reset_password_confirm
 
-from views import *
+from backend.views import *
+from backend.async_views import AsyncProductSearchView, AsyncBasketView, AsyncOrderView, AsyncPartnerOrders
+from backend.metrics import metrics_view
 
 app_name = 'backend'
 urlpatterns = [
     path('partner/update', PartnerUpdate.as_view(), name='partner-update'),
+    path('partner/update/<int:job_id>', PartnerUpdateStatus.as_view(), name='partner-update-status'),
     path('partner/orders', PartnerOrders.as_view(), name='partner-orders'),
     path('user/register', UserRegistration.as_view(), name='user-register'),
     path('user/register/confirm', EmailConfirmView.as_view(), name='user-register-confirm'),
     path('user/details', AccountDetails.as_view(), name='user-details'),
     path('user/signin', UserSignIn.as_view(), name='user-login'),
+    path('user/logout', UserLogout.as_view(), name='user-logout'),
     path('user/password_reset', reset_password_request_token, name='password-reset'),
     path('user/password_reset/confirm', reset_password_confirm, name='password-reset-confirm'),
     path('categories', CategoryView.as_view(), name='categories'),
     path('shops', ShopView.as_view(), name='shops'),
-    path('products', ProductSearchView.as_view(), name='shops'),
+    path('products', ProductSearchView.as_view(), name='products'),
     path('basket', BasketView.as_view(), name='basket'),
     path('order', OrderView.as_view(), name='order'),
+    # Асинхронные версии для запуска под ASGI (orders/asgi.py)
+    path('async/products', AsyncProductSearchView.as_view(), name='async-products'),
+    path('async/basket', AsyncBasketView.as_view(), name='async-basket'),
+    path('async/order', AsyncOrderView.as_view(), name='async-order'),
+    path('async/partner/orders', AsyncPartnerOrders.as_view(), name='async-partner-orders'),
+    # Метрики запросов в формате Prometheus (backend/metrics.py)
+    path('metrics', metrics_view, name='metrics'),
 
 ]
\ No newline at end of file
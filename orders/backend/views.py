@@ -1,3 +1,5 @@
+import logging
+
 from rest_framework.request import Request
 from rest_framework.response import Response
 from django.contrib.auth.password_validation import validate_password
@@ -7,20 +9,32 @@ from django.http import JsonResponse
 from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
-from django.db import IntegrityError
-from django.db.models import Q, Sum, F
+from rest_framework.filters import OrderingFilter
+from django.db import IntegrityError, transaction
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
-from ..strbool import strtobool
-from requests import get
+from strbool import strtobool
 
 import ujson
-import yaml
 
-from models import *
-from serializers import *
-from signals import new_order
+from backend.models import *
+from backend.serializers import *
+from backend.signals import new_order
+from backend.importer import CatalogImporter
+from backend.jobs import enqueue_import
+from backend.basket import (add_items, update_items, delete_items, place_order, set_partner_status, BasketError,
+                            OrderStatusError, ORDER_POSITIONS_PREFETCH)
+from backend.facets import facet_counts, wants_facets
+from backend.filters import ProductInfoFilter, FullTextSearchFilter, ParameterFilter
+from backend.pagination import ProductPagination, OrderPagination, CategoryPagination
+from backend.cache import CATALOG, CachedListMixin, cached, invalidate, shop_namespace
+from backend import fast_serializers
+from backend.fast_serializers import FastListMixin, PRODUCT_INFO_PREFETCH, SHOPS_PREFETCH
+from backend.export import ExportListMixin, export_response, is_export
+from backend.archive import (PeriodError, archived_customer_orders, archived_orders, filter_period, history_response,
+                            parse_period)
+
+logger = logging.getLogger(__name__)
 
 
 class UserRegistration(APIView):
@@ -37,9 +51,11 @@ class UserRegistration(APIView):
             result = self.password_checker(request.data['password'])
             # Проверим result, если с паролем все ок, он должен быть None
             if not result:
-                user = user_serializer.save()
-                user.set_pasword(request.data['password'])
-                user.save()
+                # Пользователь и письмо подтверждения (очередь OutboxEmail) сохраняются одной транзакцией
+                with transaction.atomic():
+                    user = user_serializer.save()
+                    user.set_password(request.data['password'])
+                    user.save()
                 return JsonResponse({'Status': True})
         else:
             return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы!'})
@@ -58,6 +74,15 @@ class UserSignIn(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы!'})
 
 
+class UserLogout(APIView):
+    # Метод POST, выход: удаление токена аутентификации, запись кэша токена сбрасывается сигналом
+    def post(self, request: Request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        Token.objects.filter(user_id=request.user.id).delete()
+        return JsonResponse({'Status': True})
+
+
 class EmailConfirmView(APIView):
      # Метод POST, создание токена подтверждения почты
      def post(self, request: Request, *args, **kwargs):
@@ -73,32 +98,49 @@ class EmailConfirmView(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class ProductSearchView(APIView):
-    # Отображение спика доступных товаров. Использую стандартную фильтрацию и поиск по полям
-    queryset = ProductInfo.objects.all()
+class ProductSearchView(ExportListMixin, CachedListMixin, FastListMixin, ListAPIView):
+    # Отображение спика доступных товаров. Фильтрация по категории и магазину,
+    # полнотекстовый поиск (параметр search) с сортировкой по релевантности, сортировка по цене.
+    # Прайс отдельного магазина (параметр shop) кэшируется до изменения каталога или карточек магазина.
+    # Выгрузка всего списка с теми же фильтрами - параметр export=json или export=ndjson.
+    # Фильтр по значениям параметров (param=Цвет:красный) и счетчики значений (facets=1) - см. backend/facets.py
+    queryset = ProductInfo.objects.filter(is_active=True).select_related(
+        'product__category', 'shop').prefetch_related(*PRODUCT_INFO_PREFETCH)
     serializer_class = ProductInfoSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ['category', 'shop']
-    search_fields = ['description', 'model']
+    fast_fields = fast_serializers.PRODUCT_INFO_FIELDS
+    fast_serializer = staticmethod(fast_serializers.product_infos)
+    filter_backends = [DjangoFilterBackend, ParameterFilter, FullTextSearchFilter, OrderingFilter]
+    filterset_class = ProductInfoFilter
     ordering_fields = ['price']
+    pagination_class = ProductPagination
+    export_filename = 'products'
+
+    def get_extra_data(self, request, queryset):
+        # Счетчики значений параметров по всему отфильтрованному списку: facets=1
+        if wants_facets(request.query_params):
+            return {'facets': facet_counts(queryset, request.query_params)}
+        return None
+
+    def get_cache_namespaces(self, request):
+        shop = request.query_params.get('shop', '')
+        return [CATALOG, shop_namespace(shop)] if shop.isdigit() else None
 
 
 class BasketView(APIView):
     # Метод GET, отображение содержимого предварительного заказа (корзины)
-    # Подсчет общей стоимости заказа (с исключением повторов)
+    # Общая стоимость берется из сохраненной суммы заказа
     def get(self, request: Request, *args, **kwargs):
         # Проверка аутентификации
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
         
-        basket = Order.objects.filter(user = request.user.id, status = 'temporary').prefetch_related(
-            'positions__product_info__product__category',
-            'positions__product_info__product__name').annotate(
-            cost=Sum(F('positions__quantity') * F('positions__product_info__price'))).distinct()
+        basket = Order.objects.filter(user = request.user.id, status = 'temporary').select_related(
+            'user').prefetch_related(ORDER_POSITIONS_PREFETCH)
         serializer = OrderSerializer(basket, many=True)
         return Response(serializer.data)
 
     # Метод POST, редактирование позиций корзины
+    # Пачка проверяется по одной выборке товаров и записывается одним upsert
     def post(self, request: Request, *args, **kwargs):
         # Проверка аутентификации
         if not request.user.is_authenticated:
@@ -107,25 +149,13 @@ class BasketView(APIView):
         items_string = request.data.get('items')
         if items_string:
             try:
-                items_dict = ujson.loads(items_string)
-            except ValueError:
-                return JsonResponse({'Status': False, 'Errors': 'Ошибка запроса'})
-            else:
-                basket, _ = Order.objects.get_or_create(user=request.user.id, status='temporary')
-                for item in items_dict:
-                    item.update({'order': basket.id})
-                    serializer = OrderItemSerializer(data=item)
-                    if serializer.is_valid():
-                        try:
-                            serializer.save()
-                        except IntegrityError as error:
-                            return JsonResponse({'Status': False, 'Errors': str(error)})
-                    else:
-                        return JsonResponse({'Status': False, 'Errors': serializer.errors})
-                return JsonResponse({'Status': True})
+                add_items(request.user.id, items_string)
+            except BasketError as error:
+                return JsonResponse({'Status': False, 'Errors': error.args[0]})
+            return JsonResponse({'Status': True})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
-    # Метод DELETE, удаление товара из корзины
+    # Метод DELETE, удаление товара из корзины одним запросом по списку id
     def delete(self, request: Request, *args, **kwargs):
         # Проверка аутентификации
         if not request.user.is_authenticated:
@@ -133,21 +163,13 @@ class BasketView(APIView):
 
         items_string = request.data.get('items')
         if items_string:
-            items_list = items_string.split(',')
-            basket, _ = Order.objects.get_or_create(user=request.user.id, status='temporary')
-            query = Q()
-            objects_deleted = False
-            for order_item_id in items_list:
-                if order_item_id.isdigit():
-                    query = query | Q(order=basket.id, id=order_item_id)
-                    objects_deleted = True
-
-            if objects_deleted:
-                deleted_count = OrderItem.objects.filter(query).delete()[0]
+            ids = [int(order_item_id) for order_item_id in items_string.split(',') if order_item_id.isdigit()]
+            if ids:
+                deleted_count = delete_items(request.user.id, ids)
                 return JsonResponse({'Status': True, 'Удалено объектов': deleted_count})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
-    # Метод PUT, добавление товара в корзину
+    # Метод PUT, изменение количества товаров в корзине одним bulk_update
     def put(self, request: Request, *args, **kwargs):
         # Проверка аутентификации
         if not request.user.is_authenticated:
@@ -156,24 +178,21 @@ class BasketView(APIView):
         items_string = request.data.get('items')
         if items_string:
             try:
-                items_dict = ujson.loads(items_string)
-            except ValueError:
-                return JsonResponse({'Status': False, 'Errors': 'Ошибка запроса'})
-            else:
-                basket, _ = Order.objects.get_or_create(user=request.user.id, status='temporary')
-                objects_updated = 0
-                for order_item in items_dict:
-                    if type(order_item['id']) == int and type(order_item['quantity']) == int:
-                        objects_updated += OrderItem.objects.filter(order=basket.id, id=order_item['id']).update(
-                            quantity=order_item['quantity'])
-
-                return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
+                objects_updated = update_items(request.user.id, items_string)
+            except BasketError as error:
+                return JsonResponse({'Status': False, 'Errors': error.args[0]})
+            return JsonResponse({'Status': True, 'Обновлено объектов': objects_updated})
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class CategoryView(ListAPIView):
-    queryset = Category.objects.all()
+class CategoryView(ExportListMixin, CachedListMixin, FastListMixin, ListAPIView):
+    # Список категорий с магазинами кэшируется до изменения каталога
+    queryset = Category.objects.prefetch_related(SHOPS_PREFETCH)
     serializer_class = CategorySerializer
+    fast_fields = fast_serializers.CATEGORY_FIELDS
+    fast_serializer = staticmethod(fast_serializers.categories)
+    export_filename = 'categories'
+    pagination_class = CategoryPagination
 
 
 class ShopView(APIView):
@@ -185,9 +204,8 @@ class ShopView(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Пользователь должен иметь тип - магазин!'}, status=403)
             
-        shop = request.user.shop
-        serializer = ShopSerializer(shop)
-        return Response(serializer.data)
+        data = cached([CATALOG], f'shop-view:{request.user.id}', lambda: ShopSerializer(request.user.shop).data)
+        return Response(data)
 
     def post(self, request: Request, *args, **kwargs):
         # Проверка аутентификации и того. что пользователь является продавцом (магазином)
@@ -200,6 +218,7 @@ class ShopView(APIView):
         if status:
             try:
                 Shop.objects.filter(user=request.user.id).update(status=strtobool(status))
+                invalidate(CATALOG)
                 return JsonResponse({'Status': True})
             except ValueError as error:
                 return JsonResponse({'Status': False, 'Errors': str(error)})
@@ -247,6 +266,11 @@ class PartnerUpdate(APIView):
             return JsonResponse({'Status': False, 'Error': 'Пользователь должен иметь тип - магазин!'}, status=403)
 
         url = request.data.get('url')
+        # Режим импорта: sync (по умолчанию) - инкрементальная синхронизация по external_id,
+        # replace - удаление всех товаров магазина и полная загрузка прайса
+        mode = request.data.get('mode', 'sync')
+        if mode not in CatalogImporter.MODES:
+            return JsonResponse({'Status': False, 'Errors': f'Неизвестный режим импорта: {mode}'})
         if url:
             validate_url = URLValidator()
             try:
@@ -254,37 +278,34 @@ class PartnerUpdate(APIView):
             except ValidationError as e:
                 return JsonResponse({'Status': False, 'Error': str(e)})
             else:
-                stream = get(url).content
-
-                data = yaml.load(stream, Loader=yaml.Loader)
-
-                shop, _ = Shop.objects.get_or_create(name=data['shop'], user_id=request.user.id)
-                for category in data['categories']:
-                    category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                    category_object.shops.add(shop.id)
-                    category_object.save()
-                ProductInfo.objects.filter(shop_id=shop.id).delete()
-                for item in data['goods']:
-                    product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                    product_info = ProductInfo.objects.create(product_id=product.id,
-                                                              external_id=item['id'],
-                                                              model=item['model'],
-                                                              price=item['price'],
-                                                              price_rrc=item['price_rrc'],
-                                                              quantity=item['quantity'],
-                                                              shop_id=shop.id)
-                    for name, value in item['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                        ProductParameter.objects.create(product_info_id=product_info.id,
-                                                        parameter_id=parameter_object.id,
-                                                        value=value)
-
-                return JsonResponse({'Status': True})
+                # Импорт ставится в очередь и выполняется воркером (manage.py run_import_worker),
+                # ход выполнения доступен по partner/update/<job_id>
+                job = enqueue_import(request.user.id, url, mode)
+                return JsonResponse({'Status': True, 'Job': job.id}, status=202)
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
+class PartnerUpdateStatus(APIView):
+    # Метод GET, статус и прогресс задания импорта прайса
+    def get(self, request: Request, job_id, *args, **kwargs):
+        # Проверка аутентификации и того, что пользователь является продавцом (магазином)
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Пользователь должен иметь тип - магазин!'}, status=403)
+
+        job = ImportJob.objects.filter(id=job_id, user_id=request.user.id).first()
+        if job is None:
+            return JsonResponse({'Status': False, 'Errors': 'Задание импорта не найдено'}, status=404)
+        serializer = ImportJobSerializer(job)
+        return Response(serializer.data)
+
+
+# Статусы, которые магазин может установить своему заказу
+PARTNER_ORDER_STATUSES = ('accepted', 'assembled', 'sent', 'delivered', 'canceled')
+
+
 class PartnerOrders(APIView):
 
     def get(self, request, *args, **kwargs):
@@ -295,14 +316,50 @@ class PartnerOrders(APIView):
         if request.user.type != 'shop':
             return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
 
-        order = Order.objects.filter(
-            ordered_items__product_info__shop__user_id=request.user.id).exclude(state='temporary').prefetch_related(
-            'positions__product_info__product__category',
-            'positions__product_info__parameters__parameter').select_related('user').annotate(
-            total_sum=Sum(F('positions__quantity') * F('positions__product_info__price'))).distinct()
+        # Заказы магазина - его части оформленных заказов, отбор по Order.shop без соединения с позициями
+        order = Order.objects.filter(shop__user_id=request.user.id)
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        # Выгрузка всех заказов магазина потоком: export=json или export=ndjson
+        if is_export(request):
+            return export_response(request, order.order_by(*OrderPagination.ordering), fast_serializers.ORDER_FIELDS,
+                                   fast_serializers.orders, 'partner-orders')
+
+        # История за период created_after, created_before - вместе с архивом закрытых заказов (archive.py)
+        try:
+            period = parse_period(request.query_params)
+        except PeriodError as error:
+            return JsonResponse({'Status': False, 'Errors': error.args[0]}, status=400)
+        if period is not None:
+            archive = OrderArchive.objects.filter(shop__user_id=request.user.id)
+            return history_response(OrderPagination(), filter_period(order, period), filter_period(archive, period),
+                                    fast_serializers.orders, archived_orders, request)
+
+        # Курсорная пагинация по (created_at, id), параметры cursor и page_size.
+        # Вывод как у OrderSerializer, но без объектов моделей (fast_serializers)
+        return fast_serializers.paginated_response(OrderPagination(), order, fast_serializers.ORDER_FIELDS,
+                                                   fast_serializers.orders, request, view=self)
+
+    # Метод POST, изменение статуса заказа магазина: каждый магазин выполняет свою часть заказа независимо.
+    # Допустимые переходы - basket.PARTNER_STATUS_TRANSITIONS, при отмене остатки возвращаются
+    def post(self, request, *args, **kwargs):
+
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+
+        if request.user.type != 'shop':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+
+        if {'id', 'status'}.issubset(request.data):
+            if not str(request.data['id']).isdigit() or request.data['status'] not in PARTNER_ORDER_STATUSES:
+                return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
+            try:
+                is_updated = set_partner_status(request.user.id, int(request.data['id']), request.data['status'])
+            except OrderStatusError as error:
+                return JsonResponse({'Status': False, 'Errors': error.args[0]}, status=409)
+            if is_updated:
+                return JsonResponse({'Status': True})
+            return JsonResponse({'Status': False, 'Errors': 'Заказ не найден'}, status=404)
+        return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
 class OrderView(APIView):
@@ -311,14 +368,28 @@ class OrderView(APIView):
 
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
-        order = Order.objects.filter(
-            user_id=request.user.id).exclude(state='temporary').prefetch_related(
-            'positions__product_info__product__category',
-            'positions__product_info__parameters__parameter').select_related('user').annotate(
-            total_sum=Sum(F('positions__quantity') * F('positions__product_info__price'))).distinct()
+        # Заказы покупателя, заказы по магазинам и их позиции выбирает customer_orders
+        order = Order.objects.filter(user_id=request.user.id, parent__isnull=True).exclude(status='temporary')
 
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+        # Выгрузка всех заказов потоком: export=json или export=ndjson
+        if is_export(request):
+            return export_response(request, order.order_by(*OrderPagination.ordering), fast_serializers.ORDER_FIELDS,
+                                   fast_serializers.customer_orders, 'orders')
+
+        # История за период created_after, created_before - вместе с архивом закрытых заказов (archive.py)
+        try:
+            period = parse_period(request.query_params)
+        except PeriodError as error:
+            return JsonResponse({'Status': False, 'Errors': error.args[0]}, status=400)
+        if period is not None:
+            archive = OrderArchive.objects.filter(user_id=request.user.id, parent__isnull=True)
+            return history_response(OrderPagination(), filter_period(order, period), filter_period(archive, period),
+                                    fast_serializers.customer_orders, archived_customer_orders, request)
+
+        # Курсорная пагинация по (created_at, id), параметры cursor и page_size.
+        # Вывод как у CustomerOrderSerializer, но без объектов моделей (fast_serializers)
+        return fast_serializers.paginated_response(OrderPagination(), order, fast_serializers.ORDER_FIELDS,
+                                                   fast_serializers.customer_orders, request, view=self)
 
     # разместить заказ из корзины
     def post(self, request, *args, **kwargs):
@@ -326,20 +397,23 @@ class OrderView(APIView):
         if not request.user.is_authenticated:
             return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
 
-        if {'id', 'contact'}.issubset(request.data):
-            if request.data['id'].isdigit():
+        if 'id' in request.data:
+            if str(request.data['id']).isdigit():
                 try:
-                    is_updated = Order.objects.filter(
-                        user_id=request.user.id, id=request.data['id']).update(
-                        contact_id=request.data['contact'],
-                        state='new')
+                    # Письмо о заказе попадает в очередь OutboxEmail в транзакции оформления
+                    with transaction.atomic():
+                        is_updated = place_order(request.user.id, int(request.data['id']))
+                        if is_updated:
+                            # new order is a signal to email, see signals.py
+                            new_order.send(sender=self.__class__, user_id=request.user.id)
+                except BasketError as error:
+                    return JsonResponse({'Status': False, 'Errors': error.args[0]}, status=409)
                 except IntegrityError as error:
-                    print(error)
+                    logger.warning('Оформление заказа %s: %s', request.data['id'], error)
                     return JsonResponse({'Status': False, 'Errors': 'Неправильно указаны аргументы'})
                 else:
                     if is_updated:
-                        # new order is a signal to email, see signals.py
-                        new_order.send(sender=self.__class__, user_id=request.user.id)
                         return JsonResponse({'Status': True})
+                    return JsonResponse({'Status': False, 'Errors': 'Корзина не найдена'}, status=404)
 
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
\ No newline at end of file
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,17 +38,21 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'django_filters',
     'rest_framework.authtoken',
     'django_rest_passwordreset',
 
-    'backend',
     'backend.apps.BackendConfig',
 ]
 
 MIDDLEWARE = [
+    # Первым: время ответа, число и время SQL-запросов по маршрутам (backend/metrics.py)
+    'backend.metrics.MetricsMiddleware',
+    # Чтение безопасных запросов с реплик, закрепление за основной БД после изменений (backend/routers.py)
+    'backend.routers.PrimaryStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +97,41 @@ DATABASES = {
     }
 }
 
+# Пул соединений psycopg: соединения процесса переиспользуются запросами и потоками (WSGI и ASGI)
+# вместо подключения к PostgreSQL на каждый запрос, по окончании запроса соединение возвращается в пул.
+# Размер пула задается на процесс: при gunicorn --threads N нужен DB_POOL_MAX_SIZE не меньше N,
+# а workers * DB_POOL_MAX_SIZE соединений должны помещаться в max_connections PostgreSQL.
+# Проверку при выдаче из пула выполняет сам пул: с CONN_HEALTH_CHECKS Django 5.1 создает ConnectionPool
+# с check=ConnectionPool.check_connection (psycopg_pool >= 3.2), и разорванное соединение заменяется новым.
+# Собственная проверка Django (close_if_health_check_failed) при пуле не выполняется. Ключ 'check'
+# в OPTIONS['pool'] задавать нельзя - Django уже передает его в ConnectionPool.
+# DB_POOL=0 отключает пул (новое соединение на каждый запрос)
+if os.environ.get('DB_POOL', '1') != '0':
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            # Ожидание свободного соединения, сек
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+
+# Реплики для чтения (backend/routers.py): DB_REPLICAS=host1:port1,host2:port2 - остальные параметры
+# подключения как у основной БД. В тестах реплики - зеркала основной БД (TEST MIRROR)
+DATABASE_REPLICAS = []
+for index, address in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    host, _, port = address.partition(':')
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT'],
+                                    'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['backend.routers.PrimaryReplicaRouter']
+# Сколько секунд клиент после изменяющего запроса читает из основной БД (запас на отставание реплики)
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+# Алиас кэша (CACHES) для меток закрепления: он должен быть общим для всех процессов сервера, иначе
+# закреплен окажется только процесс, выполнивший изменение. По умолчанию - общий кэш каталога
+REPLICA_STICKY_CACHE = os.environ.get('DB_REPLICA_STICKY_CACHE', 'catalog')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -145,8 +185,70 @@ EMAIL_HOST_PASSWORD = 'yourpassword'
 EMAIL_PORT = 587
 SERVER_EMAIL = EMAIL_HOST_USER
 
+# Кэш каталога (backend/cache.py): категории, прайсы магазинов, данные магазина.
+# Записи сбрасываются сменой версии по сигналам и после импорта. Кэш должен быть общим для веб-процессов
+# и воркера импорта (run_import_worker): файловый бэкенд общий для процессов одного сервера,
+# для нескольких серверов нужен сетевой бэкенд:
+#   'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+#   'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'catalog_cache'
+#   (таблицу создает python manage.py createcachetable)
+# TIMEOUT - срок жизни записи, сек: страховка на случай, если смена версии до процесса не дошла
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'catalog',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Кэш аутентификации по токену (backend/authentication.py): число записей и время жизни записи в секундах.
+# Сброс записей во всех процессах идет через версии в общем кэше 'catalog'
+AUTH_TOKEN_CACHE = {
+    'max_size': 10000,
+    'ttl': 60,
+}
+
+# Срок хранения закрытых заказов в рабочих таблицах, дней: более старые переносит в архив
+# команда archive_orders (backend/archive.py)
+ORDER_ARCHIVE_DAYS = 365
+
+# Эндпоинт metrics доступен только с этих адресов
+INTERNAL_IPS = ['127.0.0.1']
+
+# Допустимое число SQL-запросов на один запрос по имени маршрута (backend/urls.py).
+# Превышение пишется в лог и в метрику orders_query_budget_exceeded_total, в тестах проверяется
+# контекстным менеджером backend.testing.query_budget
+# Значения - измеренное число запросов плюс один на промах кэша токенов; для order и partner/orders -
+# по странице истории за период (created_after, created_before), которая читает и рабочие таблицы, и архив
+QUERY_BUDGETS = {
+    'categories': 4,
+    'products': 4,
+    'shops': 2,
+    'basket': 8,
+    'order': 15,
+    'partner-orders': 13,
+    'user-details': 2,
+    'async-products': 4,
+    'async-basket': 8,
+    'async-order': 15,
+    'async-partner-orders': 13,
+}
+
 REST_FRAMEWORK = {
+    # Токен передается заголовком "Authorization: Token <key>", сессия - для админки и browsable API
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'backend.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
-    ]
+    ],
+    # Курсорная пагинация (backend/pagination.py) и размер страницы по умолчанию,
+    # клиент может запросить page_size не больше KeysetPagination.max_page_size
+    'DEFAULT_PAGINATION_CLASS': 'backend.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
\ No newline at end of file